@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # the store is memory-mapped NumPy arrays; import/open need it
+    np = None
+
+# Same service-day offset as app.station_timetable (kept free of the
+# Firestore import so the importer runs standalone).
+SCHEDULE_UTC_OFFSET_H = float(os.getenv("SCHEDULE_UTC_OFFSET_H", "3"))
+
+STORE_VERSION = 1
+DAY_SEC = 86400
+
+# Files written by import_gtfs():
+#   offsets.npy        int64 [stations + 1]  CSR row ranges per station
+#   times.npy          int32 [events]        seconds after service-day midnight,
+#                                            sorted within each station
+#   trips.npy          int32 [events]        trip row, parallel to times
+#   trip_service.npy   int32 [trips]         service row per trip
+#   meta.json          station ids, trip table strings, service calendars
+_ARRAYS = ("offsets", "times", "trips", "trip_service")
+
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def _read_csv(path: str) -> List[Dict[str, str]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [{k.strip(): (v or "").strip() for k, v in row.items() if k} for row in csv.DictReader(f)]
+
+
+def _gtfs_seconds(s: str) -> Optional[int]:
+    """GTFS "H:MM:SS" (hours may exceed 24) -> seconds after midnight."""
+    try:
+        h, m, sec = s.split(":")
+        return int(h) * 3600 + int(m) * 60 + int(sec)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _clock(secs: int) -> str:
+    secs %= DAY_SEC
+    return f"{secs // 3600:02d}:{secs % 3600 // 60:02d}:{secs % 60:02d}"
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("numpy is required for the GTFS timetable store")
+
+
+# ----------------------------
+# Import
+# ----------------------------
+def import_gtfs(src_dir: str, out_dir: str) -> Dict[str, Any]:
+    """
+    Convert a GTFS feed (stops.txt, trips.txt, stop_times.txt; routes.txt,
+    calendar.txt and calendar_dates.txt when present) into the columnar
+    store in out_dir. Platforms are folded into their parent_station.
+    Returns a small summary.
+    """
+    _require_numpy()
+
+    def path(name: str) -> str:
+        return os.path.join(src_dir, name)
+
+    parent: Dict[str, str] = {}
+    for row in _read_csv(path("stops.txt")):
+        parent[row["stop_id"]] = row.get("parent_station") or row["stop_id"]
+
+    route_names: Dict[str, str] = {}
+    if os.path.exists(path("routes.txt")):
+        for row in _read_csv(path("routes.txt")):
+            route_names[row["route_id"]] = row.get("route_short_name") or row["route_id"]
+
+    services: Dict[str, Dict[str, Any]] = {}
+    if os.path.exists(path("calendar.txt")):
+        days = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+        for row in _read_csv(path("calendar.txt")):
+            services[row["service_id"]] = {
+                "id": row["service_id"],
+                "days": "".join("1" if row.get(d) == "1" else "0" for d in days),
+                "start": row.get("start_date") or "",
+                "end": row.get("end_date") or "",
+                "added": [],
+                "removed": [],
+            }
+    if os.path.exists(path("calendar_dates.txt")):
+        for row in _read_csv(path("calendar_dates.txt")):
+            svc = services.setdefault(row["service_id"], {
+                "id": row["service_id"], "days": "0000000", "start": "", "end": "", "added": [], "removed": [],
+            })
+            svc["added" if row.get("exception_type") == "1" else "removed"].append(row["date"])
+
+    service_rows: Dict[str, int] = {}
+    trip_rows: Dict[str, int] = {}
+    trip_ids: List[str] = []
+    lines: List[str] = []
+    directions: List[str] = []
+    headsigns: List[str] = []
+    trip_service: List[int] = []
+    for row in _read_csv(path("trips.txt")):
+        sid = row.get("service_id") or ""
+        if sid not in service_rows:
+            service_rows[sid] = len(service_rows)
+            # No calendar entry: assume the trip runs every day
+            services.setdefault(sid, {"id": sid, "days": "1111111", "start": "", "end": "", "added": [], "removed": []})
+        trip_rows[row["trip_id"]] = len(trip_ids)
+        trip_ids.append(row["trip_id"])
+        lines.append(route_names.get(row.get("route_id", ""), row.get("route_id", "")))
+        directions.append(row.get("direction_id") or "0")
+        headsigns.append(row.get("trip_headsign") or "")
+        trip_service.append(service_rows[sid])
+
+    station_rows: Dict[str, int] = {}
+    ev_station: List[int] = []
+    ev_time: List[int] = []
+    ev_trip: List[int] = []
+    last_stop: Dict[int, Tuple[int, str]] = {}  # trip row -> (stop_sequence, station)
+    with open(path("stop_times.txt"), newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            trip = trip_rows.get((row.get("trip_id") or "").strip())
+            secs = _gtfs_seconds((row.get("arrival_time") or row.get("departure_time") or "").strip())
+            if trip is None or secs is None:
+                continue
+            station = parent.get(row["stop_id"].strip(), row["stop_id"].strip())
+            if station not in station_rows:
+                station_rows[station] = len(station_rows)
+            ev_station.append(station_rows[station])
+            ev_time.append(secs)
+            ev_trip.append(trip)
+            seq = int(row.get("stop_sequence") or 0)
+            if trip not in last_stop or seq >= last_stop[trip][0]:
+                last_stop[trip] = (seq, station)
+
+    for trip, (_, station) in last_stop.items():
+        if not headsigns[trip]:
+            headsigns[trip] = station
+
+    st = np.asarray(ev_station, dtype=np.int32)
+    tm = np.asarray(ev_time, dtype=np.int32)
+    tr = np.asarray(ev_trip, dtype=np.int32)
+    order = np.lexsort((tr, tm, st))
+    counts = np.bincount(st, minlength=len(station_rows))
+    offsets = np.zeros(len(station_rows) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(out_dir, "times.npy"), tm[order])
+    np.save(os.path.join(out_dir, "trips.npy"), tr[order])
+    np.save(os.path.join(out_dir, "trip_service.npy"), np.asarray(trip_service, dtype=np.int32))
+
+    by_row = sorted(service_rows, key=service_rows.get)
+    meta = {
+        "version": STORE_VERSION,
+        "stations": sorted(station_rows, key=station_rows.get),
+        "trip_ids": trip_ids,
+        "lines": lines,
+        "directions": directions,
+        "headsigns": headsigns,
+        "services": [services[s] for s in by_row],
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    return {"stations": len(station_rows), "trips": len(trip_ids), "stop_events": int(tm.size)}
+
+
+# ----------------------------
+# Loader
+# ----------------------------
+class GtfsTimetable:
+    """
+    Read-only view of an imported store. Arrays are memory-mapped, so
+    opening costs the JSON metadata only; next_trips() binary-searches a
+    station's slice and keeps trips whose service runs that day.
+    """
+
+    def __init__(self, store_dir: str):
+        _require_numpy()
+        with open(os.path.join(store_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION:
+            raise ValueError(f"unsupported GTFS store version: {meta.get('version')}")
+
+        arrays = {name: np.load(os.path.join(store_dir, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        self.offsets = arrays["offsets"]
+        self.times = arrays["times"]
+        self.trips = arrays["trips"]
+        self.trip_service = arrays["trip_service"]
+
+        self.station_rows = {sid: i for i, sid in enumerate(meta["stations"])}
+        self.trip_ids: List[str] = meta["trip_ids"]
+        self.lines: List[str] = meta["lines"]
+        self.directions: List[str] = meta["directions"]
+        self.headsigns: List[str] = meta["headsigns"]
+        self.services: List[Dict[str, Any]] = meta["services"]
+        self._active: Dict[date, Any] = {}
+
+    def active_services(self, day: date) -> Any:
+        """Bool array over service rows running on 'day'."""
+        hit = self._active.get(day)
+        if hit is None:
+            ymd = day.strftime("%Y%m%d")
+            hit = np.zeros(len(self.services), dtype=bool)
+            for i, svc in enumerate(self.services):
+                on = svc["days"][day.weekday()] == "1"
+                if (svc["start"] and ymd < svc["start"]) or (svc["end"] and ymd > svc["end"]):
+                    on = False
+                if ymd in svc["added"]:
+                    on = True
+                elif ymd in svc["removed"]:
+                    on = False
+                hit[i] = on
+            if len(self._active) > 8:
+                self._active.clear()
+            self._active[day] = hit
+        return hit
+
+    def next_trips(self, station_id: str, when: datetime, limit: int) -> List[Dict[str, Any]]:
+        """
+        Next 'limit' arrivals at station_id at or after 'when'. Yesterday's
+        after-midnight trips (times past 24:00) and tomorrow's first ones
+        are included, so answers near midnight are complete.
+        """
+        row = self.station_rows.get(station_id)
+        if row is None or limit <= 0:
+            return []
+        lo, hi = int(self.offsets[row]), int(self.offsets[row + 1])
+        times = self.times[lo:hi]
+        trips = self.trips[lo:hi]
+
+        tz = timezone(timedelta(hours=SCHEDULE_UTC_OFFSET_H))
+        local = when.astimezone(tz)
+        today = local.date()
+        secs = local.hour * 3600 + local.minute * 60 + local.second
+
+        found: List[Tuple[int, int, int]] = []  # (seconds after today's midnight, time, trip)
+        for shift in (-1, 0, 1):
+            q = secs - shift * DAY_SEC
+            i = int(np.searchsorted(times, max(q, 0), side="left"))
+            if i >= times.size:
+                continue
+            active = self.active_services(today + timedelta(days=shift))
+            cand_t = np.asarray(times[i:i + limit * 8])
+            cand_trip = np.asarray(trips[i:i + limit * 8])
+            keep = active[self.trip_service[cand_trip]]
+            while keep.sum() < limit and i + cand_t.size < times.size:
+                # Sparse service that day: widen the window
+                cand_t = np.asarray(times[i:i + cand_t.size * 4])
+                cand_trip = np.asarray(trips[i:i + cand_trip.size * 4])
+                keep = active[self.trip_service[cand_trip]]
+            for t, trip in zip(cand_t[keep][:limit].tolist(), cand_trip[keep][:limit].tolist()):
+                found.append((t + shift * DAY_SEC, t, trip))
+
+        found.sort()
+        out: List[Dict[str, Any]] = []
+        for _, t, trip in found[:limit]:
+            out.append({
+                "trip_id": self.trip_ids[trip],
+                "trip_headsign": self.headsigns[trip] or self.trip_ids[trip],
+                "line_id": self.lines[trip],
+                "direction_id": self.directions[trip],
+                "arrival_time": _clock(t),
+                "station_id": station_id,
+            })
+        return out
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Import a GTFS feed into the local timetable store")
+    parser.add_argument("gtfs_dir")
+    parser.add_argument("out_dir")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    summary = import_gtfs(args.gtfs_dir, args.out_dir)
+    summary["import_seconds"] = round(time.perf_counter() - t0, 3)
+    t0 = time.perf_counter()
+    GtfsTimetable(args.out_dir)
+    summary["open_seconds"] = round(time.perf_counter() - t0, 3)
+    print(json.dumps(summary, indent=2))
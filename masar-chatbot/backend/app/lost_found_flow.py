@@ -2,7 +2,7 @@ from datetime import datetime, timezone
 import uuid
 from typing import Optional
 
-from app.session_store import get_session, save_session
+from app.session_store import SessionUnit, session_unit
 from app.report_store import save_lost_found_report
 
 
@@ -54,11 +54,23 @@ def handle_lost_found_flow(
     user_message: str,
     passenger_id: str,
     photo_url: Optional[str] = None,
+    unit: Optional[SessionUnit] = None,
 ) -> str:
 
     pid = (passenger_id or "").strip() or "anonymous"
 
-    session = get_session(pid, session_id)
+    # Shares the caller's session unit when it is for the same document
+    with session_unit(pid, session_id, unit) as unit:
+        return _lost_found_step(unit, user_message, passenger_id, photo_url)
+
+
+def _lost_found_step(
+    unit: SessionUnit,
+    user_message: str,
+    passenger_id: str,
+    photo_url: Optional[str],
+) -> str:
+    session = unit.load()
     state = session.get("state", "menu")
     data = session.get("data", {}) or {}
 
@@ -72,7 +84,7 @@ def handle_lost_found_flow(
 
     # START
     if state == "menu":
-        save_session(pid, session_id, "lf_item_type", data)
+        unit.save("lf_item_type", data)
         return (
             "[LF_START]\n"
             "تم بدء تسجيل بلاغ مفقود.\n\n"
@@ -86,7 +98,7 @@ def handle_lost_found_flow(
             return "[LF_ERROR]\nيرجى إدخال نوع الغرض المفقود."
 
         data["item_type"] = user_message
-        save_session(pid, session_id, "lf_color", data)
+        unit.save("lf_color", data)
 
         return (
             "[LF_COLOR]\n"
@@ -101,7 +113,7 @@ def handle_lost_found_flow(
             return "[LF_ERROR]\nيرجى إدخال لون الغرض أو كتابة: غير واضح."
 
         data["color"] = user_message
-        save_session(pid, session_id, "lf_brand", data)
+        unit.save("lf_brand", data)
 
         return (
             "[LF_BRAND]\n"
@@ -117,7 +129,7 @@ def handle_lost_found_flow(
         else:
             data["brand"] = user_message if user_message else None
 
-        save_session(pid, session_id, "lf_description", data)
+        unit.save("lf_description", data)
 
         return (
             "[LF_DESC]\n"
@@ -131,7 +143,7 @@ def handle_lost_found_flow(
             return "[LF_ERROR]\nيرجى إدخال تفاصيل الغرض."
 
         data["description"] = user_message
-        save_session(pid, session_id, "lf_photo_choice", data)
+        unit.save("lf_photo_choice", data)
 
         return (
             "[LF_PHOTO]\n"
@@ -145,7 +157,7 @@ def handle_lost_found_flow(
 
         if ans == "yes":
             data["photo_url"] = None
-            save_session(pid, session_id, "lf_expect_photo", data)
+            unit.save("lf_expect_photo", data)
             return (
                 "[LF_PHOTO]\n"
                 "تم اختيار إرفاق صورة.\n"
@@ -155,7 +167,7 @@ def handle_lost_found_flow(
 
         if ans == "no":
             data["photo_url"] = None
-            save_session(pid, session_id, "lf_station", data)
+            unit.save("lf_station", data)
             return (
                 "[LF_STATION]\n"
                 "تمت المتابعة بدون صورة.\n\n"
@@ -169,7 +181,7 @@ def handle_lost_found_flow(
     if state == "lf_expect_photo":
         stored_url = (data.get("photo_url") or "").strip()
         if stored_url:
-            save_session(pid, session_id, "lf_station", data)
+            unit.save("lf_station", data)
             return (
                 "[LF_STATION]\n"
                 "تم استلام الصورة.\n\n"
@@ -180,7 +192,7 @@ def handle_lost_found_flow(
         ans = _normalize_ar_yes_no(user_message)
         if ans == "no":
             data["photo_url"] = None
-            save_session(pid, session_id, "lf_station", data)
+            unit.save("lf_station", data)
             return (
                 "[LF_STATION]\n"
                 "تمت المتابعة بدون صورة.\n\n"
@@ -204,7 +216,7 @@ def handle_lost_found_flow(
         except Exception:
             return "[LF_ERROR]\nيرجى اختيار رقم صحيح من قائمة المحطات."
 
-        save_session(pid, session_id, "lf_datetime", data)
+        unit.save("lf_datetime", data)
 
         return (
             "[LF_DATETIME]\n"
@@ -221,7 +233,7 @@ def handle_lost_found_flow(
             )
 
         data["lost_datetime"] = user_message
-        save_session(pid, session_id, "lf_name", data)
+        unit.save("lf_name", data)
 
         return "[LF_CONTACT]\n8) يرجى إدخال الاسم الكامل."
 
@@ -231,7 +243,7 @@ def handle_lost_found_flow(
             return "[LF_ERROR]\nيرجى إدخال الاسم الكامل."
 
         data["name"] = user_message
-        save_session(pid, session_id, "lf_phone", data)
+        unit.save("lf_phone", data)
 
         return "[LF_CONTACT]\n9) يرجى إدخال رقم الجوال للتواصل."
 
@@ -261,7 +273,7 @@ def handle_lost_found_flow(
         }
 
         save_lost_found_report(report)
-        save_session(pid, session_id, "menu", {})
+        unit.save("menu", {})
 
         return (
             "[LF_DONE]\n"
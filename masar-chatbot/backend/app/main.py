@@ -1,7 +1,7 @@
 from fastapi import FastAPI, UploadFile, File, Form
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List, Tuple
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 import os
 load_dotenv()
@@ -19,7 +19,7 @@ from app.distance_service import get_walk_drive
 
 # Lost & Found
 from app.lost_found_flow import handle_lost_found_flow
-from app.session_store import get_session, save_session, reset_session
+from app.session_store import SessionUnit, get_session, save_session, session_unit
 
 # Image upload
 from app.upload import upload_lost_found_image
@@ -27,6 +27,17 @@ from app.upload import upload_lost_found_image
 # Schedule (Firestore trips)
 from app.trips_store import fetch_trips_for_station_today
 
+# Station name lookup
+from app.station_index import StationIndex
+from app.spatial_index import SpatialIndex
+
+# All-pairs metro routes
+from app.route_table import RouteTable
+
+# Timetable journeys (Firestore stop times)
+from app.timetable import get_timetable
+from app.raptor import RaptorPlanner
+
 app = FastAPI()
 
 # ----------------------------
@@ -36,14 +47,32 @@ METRO_STATIONS_PATH = os.getenv("METRO_STATIONS_PATH", "app/data/metro_stations.
 STATION_ID_MAP_PATH = os.getenv("STATION_ID_MAP_PATH", "app/data/station_id_map.json")
 STATION_DEFAULT_ORDER = ["S1", "S2", "S3", "S4", "S5", "S6"]
 
-TRAIN_SPEED_KMH = float(os.getenv("TRAIN_SPEED_KMH", "35"))
-DWELL_MIN = float(os.getenv("DWELL_MIN", "0.5"))
-MIN_SEGMENT_MIN = float(os.getenv("MIN_SEGMENT_MIN", "1.5"))
-TRANSFER_MIN = float(os.getenv("TRANSFER_MIN", "5.0"))
+# Metro timing model. Re-read from the environment whenever the graph
+# is requested, and the route table is rebuilt if any of them changed.
+ROUTING_ENV_DEFAULTS = {
+    "TRAIN_SPEED_KMH": "35",
+    "DWELL_MIN": "0.5",
+    "MIN_SEGMENT_MIN": "1.5",
+    "TRANSFER_MIN": "5.0",
+    "TRANSFER_MAX_DIST_M": "120",
+}
+
+TRAIN_SPEED_KMH = float(os.getenv("TRAIN_SPEED_KMH", ROUTING_ENV_DEFAULTS["TRAIN_SPEED_KMH"]))
+DWELL_MIN = float(os.getenv("DWELL_MIN", ROUTING_ENV_DEFAULTS["DWELL_MIN"]))
+MIN_SEGMENT_MIN = float(os.getenv("MIN_SEGMENT_MIN", ROUTING_ENV_DEFAULTS["MIN_SEGMENT_MIN"]))
+TRANSFER_MIN = float(os.getenv("TRANSFER_MIN", ROUTING_ENV_DEFAULTS["TRANSFER_MIN"]))
 
-TRANSFER_MAX_DIST_M = float(os.getenv("TRANSFER_MAX_DIST_M", "120"))
+TRANSFER_MAX_DIST_M = float(os.getenv("TRANSFER_MAX_DIST_M", ROUTING_ENV_DEFAULTS["TRANSFER_MAX_DIST_M"]))
 DEST_OPTIONS_COUNT = int(os.getenv("DEST_OPTIONS_COUNT", "6"))
+# Route card: up to this many routes on the minutes / transfers trade-off
+ROUTE_ALTERNATIVES = int(os.getenv("ROUTE_ALTERNATIVES", "3"))
+# Route card schedule: rides allowed by the timetable planner
+ROUTE_MAX_RIDES = int(os.getenv("ROUTE_MAX_RIDES", "5"))
+RIYADH_TZ = timezone(timedelta(hours=3))
 STATION_OPTIONS_COUNT = int(os.getenv("STATION_OPTIONS_COUNT", "6"))
+# Misspelled station name: take the fuzzy match directly when it is this
+# close (edit distance / length) and clearly ahead of the runner-up.
+FUZZY_ACCEPT_RATIO = float(os.getenv("FUZZY_ACCEPT_RATIO", "0.2"))
 
 GENERAL_STATE = "general_qa"
 
@@ -177,7 +206,32 @@ def _aliases_from_map_value(raw: str) -> List[str]:
 
 
 _STATIONS_CACHE: Optional[List[Dict[str, Any]]] = None
+_STATIONS_FILE_SIG: Optional[Tuple[int, int]] = None
+_STATION_INDEX: Optional[StationIndex] = None
+_STATION_GEO_INDEX: Optional[SpatialIndex] = None
 _GRAPH_CACHE: Optional[Dict[str, Any]] = None
+_PLANNER_CACHE: Optional[Dict[str, Any]] = None
+
+
+def _stations_file_sig() -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(METRO_STATIONS_PATH)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _routing_env() -> Dict[str, float]:
+    return {k: float(os.getenv(k, v)) for k, v in ROUTING_ENV_DEFAULTS.items()}
+
+
+def _apply_routing_env(env: Dict[str, float]) -> None:
+    global TRAIN_SPEED_KMH, DWELL_MIN, MIN_SEGMENT_MIN, TRANSFER_MIN, TRANSFER_MAX_DIST_M
+    TRAIN_SPEED_KMH = env["TRAIN_SPEED_KMH"]
+    DWELL_MIN = env["DWELL_MIN"]
+    MIN_SEGMENT_MIN = env["MIN_SEGMENT_MIN"]
+    TRANSFER_MIN = env["TRANSFER_MIN"]
+    TRANSFER_MAX_DIST_M = env["TRANSFER_MAX_DIST_M"]
 
 
 def _safe_float(x) -> Optional[float]:
@@ -218,6 +272,10 @@ def _find_station_by_text(
     *,
     use_map_aliases: bool = True
 ) -> Optional[Dict[str, Any]]:
+    # Loaded catalogue: answer from the prebuilt index
+    if _STATION_INDEX is not None and stations is _STATIONS_CACHE:
+        return _STATION_INDEX.find(text, use_map_aliases=use_map_aliases)
+
     q = _norm_ar(text)
     if not q:
         return None
@@ -252,6 +310,12 @@ def _find_station_by_text(
     return None
 
 
+def _suggest_stations(text: str, stations: List[Dict[str, Any]], limit: int) -> List[Tuple[Dict[str, Any], float]]:
+    if _STATION_INDEX is None or stations is not _STATIONS_CACHE:
+        return []
+    return _STATION_INDEX.suggest(text, k=limit)
+
+
 def _augment_station_keys_with_map_aliases(stations: List[Dict[str, Any]]) -> None:
     m = _load_station_id_map()
     if not m:
@@ -288,8 +352,9 @@ def _augment_station_keys_with_map_aliases(stations: List[Dict[str, Any]]) -> No
 
 
 def _load_stations() -> List[Dict[str, Any]]:
-    global _STATIONS_CACHE
-    if _STATIONS_CACHE is not None:
+    global _STATIONS_CACHE, _STATIONS_FILE_SIG, _STATION_INDEX, _STATION_GEO_INDEX
+    file_sig = _stations_file_sig()
+    if _STATIONS_CACHE is not None and file_sig == _STATIONS_FILE_SIG:
         return _STATIONS_CACHE
 
     if not os.path.exists(METRO_STATIONS_PATH):
@@ -347,11 +412,22 @@ def _load_stations() -> List[Dict[str, Any]]:
         })
 
     _augment_station_keys_with_map_aliases(stations)
+    _STATION_INDEX = StationIndex(
+        stations,
+        (_aliases_from_map_value(raw) for raw in _load_station_id_map().values()),
+        _norm_ar,
+    )
+    _STATION_GEO_INDEX = SpatialIndex([(s["lat"], s["lon"]) for s in stations], stations)
     _STATIONS_CACHE = stations
+    _STATIONS_FILE_SIG = file_sig
     return stations
 
 
 def _find_nearest_station(lat: float, lon: float, stations: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if _STATION_GEO_INDEX is not None and stations is _STATIONS_CACHE:
+        hits = _STATION_GEO_INDEX.nearest(lat, lon, 1)
+        return hits[0][0] if hits else None
+
     best = None
     best_km = 1e18
     for s in stations:
@@ -364,10 +440,12 @@ def _find_nearest_station(lat: float, lon: float, stations: List[Dict[str, Any]]
 
 def _build_graph() -> Dict[str, Any]:
     global _GRAPH_CACHE
-    if _GRAPH_CACHE is not None:
+    stations = _load_stations()
+    env = _routing_env()
+    if _GRAPH_CACHE is not None and _GRAPH_CACHE["stations"] is stations and _GRAPH_CACHE["env"] == env:
         return _GRAPH_CACHE
 
-    stations = _load_stations()
+    _apply_routing_env(env)
     by_id: Dict[str, Dict[str, Any]] = {s["id"]: s for s in stations}
     adj: Dict[str, List[Tuple[str, float]]] = {sid: [] for sid in by_id.keys()}
 
@@ -422,7 +500,13 @@ def _build_graph() -> Dict[str, Any]:
                     adj[a["id"]].append((b["id"], TRANSFER_MIN))
                     adj[b["id"]].append((a["id"], TRANSFER_MIN))
 
-    _GRAPH_CACHE = {"stations": stations, "by_id": by_id, "adj": adj}
+    routes = RouteTable(
+        adj,
+        render_steps=lambda path_ids: _make_route_steps(path_ids, by_id),
+        lines={sid: s.get("line") for sid, s in by_id.items()},
+    )
+
+    _GRAPH_CACHE = {"stations": stations, "by_id": by_id, "adj": adj, "routes": routes, "env": env}
     return _GRAPH_CACHE
 
 
@@ -458,6 +542,80 @@ def _dijkstra(adj: Dict[str, List[Tuple[str, float]]], start: str, goal: str):
     return path, dist[goal]
 
 
+def _journey_planner(timetable, g: Dict[str, Any]) -> RaptorPlanner:
+    """RAPTOR planner for this timetable; the graph's line-change edges are its footpaths."""
+    global _PLANNER_CACHE
+    if _PLANNER_CACHE is not None and _PLANNER_CACHE["timetable"] is timetable and _PLANNER_CACHE["graph"] is g:
+        return _PLANNER_CACHE["planner"]
+
+    by_id = g["by_id"]
+    footpaths: Dict[str, List[Tuple[str, float]]] = {}
+    for u, edges in g["adj"].items():
+        for v, w in edges:
+            if by_id[u].get("line") != by_id[v].get("line"):
+                footpaths.setdefault(u, []).append((v, w * 60.0))
+
+    planner = RaptorPlanner(timetable, footpaths)
+    _PLANNER_CACHE = {"timetable": timetable, "graph": g, "planner": planner}
+    return planner
+
+
+def _clock(ts: int) -> str:
+    return datetime.fromtimestamp(ts, RIYADH_TZ).strftime("%H:%M")
+
+
+def _timetable_schedule(g: Dict[str, Any], start_id: str, end_id: str, now_utc: datetime) -> Optional[Dict[str, Any]]:
+    """
+    Next real departure from start to end over the loaded stop times:
+    {"depart_time", "arrive_time", "metro_min", "legs"}, or None when the
+    timetable is unavailable or has no journey (the card keeps estimates).
+    """
+    timetable = get_timetable(now_utc)
+    if timetable is None:
+        return None
+    journey = _journey_planner(timetable, g).earliest_arrival(
+        start_id, end_id, int(now_utc.timestamp()), max_rounds=ROUTE_MAX_RIDES
+    )
+    if not journey:
+        return None
+
+    by_id = g["by_id"]
+
+    def name(sid: str) -> str:
+        return _station_display(by_id[sid]) if sid in by_id else sid
+
+    legs: List[Dict[str, Any]] = []
+    for leg in journey["legs"]:
+        if leg["type"] == "ride":
+            meta = _line_meta(leg["line_id"])
+            legs.append({
+                "type": "ride",
+                "line_id": leg["line_id"],
+                "line_name": meta.get("name_ar"),
+                "line_color": meta.get("color"),
+                "trip_id": leg["trip_id"],
+                "from": name(leg["from"]),
+                "to": name(leg["to"]),
+                "depart_time": _clock(leg["depart_ts"]),
+                "arrive_time": _clock(leg["arrive_ts"]),
+                "stops": leg["stops"],
+            })
+        else:
+            legs.append({
+                "type": "transfer",
+                "from": name(leg["from"]),
+                "to": name(leg["to"]),
+                "minutes": int(math.ceil(leg["minutes"])),
+            })
+
+    return {
+        "depart_time": _clock(journey["depart_ts"]),
+        "arrive_time": _clock(journey["arrive_ts"]),
+        "metro_min": int(round((journey["arrive_ts"] - journey["depart_ts"]) / 60.0)),
+        "legs": legs,
+    }
+
+
 def _line_meta(line_id: str) -> Dict[str, Any]:
     return LINE_META.get(line_id, {"name_ar": line_id or "المسار", "color": None, "icon": None})
 
@@ -541,7 +699,24 @@ def _route_card_response(
     walk_from_end: Optional[int],
     drive_from_end: Optional[int],
     steps: List[Dict[str, Any]],
+    alternatives: Optional[List[Dict[str, Any]]] = None,
+    schedule: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
+    options = [
+        {"id": "1", "label": "تغيير الوجهة"},
+        {"id": "2", "label": "رجوع للقائمة"},
+    ]
+    alt_cards = [
+        {
+            "metro_min": int(round(a["minutes"])),
+            "transfers": a["transfers"],
+            "steps": a["steps"],
+        }
+        for a in (alternatives or [])
+    ]
+    if alt_cards:
+        options.insert(1, {"id": "3", "label": "مسار بتحويلات أقل"})
+
     return {
         "matched_faq_id": None,
         "answer": title,
@@ -571,13 +746,14 @@ def _route_card_response(
                 "drive_to_start_min": drive_to_start,
                 "walk_from_end_min": walk_from_end,
                 "drive_from_end_min": drive_from_end,
+                "depart_time": (schedule or {}).get("depart_time"),
+                "arrive_time": (schedule or {}).get("arrive_time"),
             },
             "steps": steps,
+            "schedule": schedule,
+            "alternatives": alt_cards,
         },
-        "options": [
-            {"id": "1", "label": "تغيير الوجهة"},
-            {"id": "2", "label": "رجوع للقائمة"},
-        ],
+        "options": options,
     }
 
 
@@ -586,9 +762,14 @@ def route_flow(
     session_id: str,
     user_message: str,
     lat: Optional[float],
-    lon: Optional[float]
+    lon: Optional[float],
+    unit: Optional[SessionUnit] = None,
 ) -> Dict[str, Any]:
-    session = get_session(passenger_id, session_id)
+    if unit is None:
+        with session_unit(passenger_id, session_id) as unit:
+            return route_flow(passenger_id, session_id, user_message, lat, lon, unit)
+
+    session = unit.load()
     state = session.get("state") or "menu"
     data = session.get("data", {}) or {}
 
@@ -597,12 +778,35 @@ def route_flow(
 
     if state == RT_SHOWING:
         if msg == "1":
-            save_session(passenger_id, session_id, RT_ASK_DEST, data)
+            unit.save(RT_ASK_DEST, data)
             return {"matched_faq_id": None, "answer": "تمام. وين تبي تروح؟", "confidence": 1.0, "type": "text"}
         if msg == "2":
-            reset_session(passenger_id, session_id)
+            unit.reset()
             return menu_response()
-        save_session(passenger_id, session_id, RT_ASK_DEST, data)
+        last = data.get("rt_last") or {}
+        if msg == "3" and last.get("start_id") and last.get("end_id"):
+            g = _build_graph()
+            by_id = g["by_id"]
+            alts = g["routes"].alternatives(last["start_id"], last["end_id"], ROUTE_ALTERNATIVES)
+            if len(alts) > 1 and last["start_id"] in by_id and last["end_id"] in by_id:
+                # Fewest transfers on the Pareto front
+                alt = alts[-1]
+                last["metro_min"] = int(round(alt["minutes"]))
+                last["path_ids"] = alt["path_ids"]
+                unit.save(RT_SHOWING, data)
+                return _route_card_response(
+                    title=f"هذا مسار بتحويلات أقل للوجهة: {last.get('dest_label')}",
+                    start_station=by_id[last["start_id"]],
+                    end_station=by_id[last["end_id"]],
+                    dest_label=last.get("dest_label"),
+                    metro_min=last["metro_min"],
+                    walk_to_start=last.get("walk_to_start"),
+                    drive_to_start=last.get("drive_to_start"),
+                    walk_from_end=last.get("walk_from_end"),
+                    drive_from_end=last.get("drive_from_end"),
+                    steps=alt["steps"],
+                )
+        unit.save(RT_ASK_DEST, data)
         state = RT_ASK_DEST
 
     if state == RT_ASK_DEST:
@@ -610,7 +814,7 @@ def route_flow(
             return {"matched_faq_id": None, "answer": "وين تبي تروح؟ (مثال: البوليفارد)", "confidence": 1.0, "type": "text"}
 
         if lat is None or lon is None:
-            save_session(passenger_id, session_id, RT_ASK_DEST, data)
+            unit.save(RT_ASK_DEST, data)
             return {
                 "matched_faq_id": None,
                 "answer": "عشان احدد اقرب محطة لك، فعّلي الموقع بالتطبيق ثم ارسلي اسم وجهتك مرة ثانية.",
@@ -624,7 +828,7 @@ def route_flow(
             place = None
 
         if not place or place.get("lat") is None or place.get("lon") is None:
-            save_session(passenger_id, session_id, RT_ASK_DEST, data)
+            unit.save(RT_ASK_DEST, data)
             return {
                 "matched_faq_id": None,
                 "answer": "ما قدرت احدد مكان الوجهة. اكتبي اسم اوضح (مثال: البوليفارد سيتي).",
@@ -638,22 +842,21 @@ def route_flow(
 
         g = _build_graph()
         stations = g["stations"]
-        by_id = g["by_id"]
-        adj = g["adj"]
+        routes = g["routes"]
 
         start_station = _find_nearest_station(lat, lon, stations)
         end_station = _find_nearest_station(dest_lat, dest_lon, stations)
 
         if not start_station or not end_station:
-            save_session(passenger_id, session_id, RT_ASK_DEST, data)
+            unit.save(RT_ASK_DEST, data)
             return {"matched_faq_id": None, "answer": "ما قدرت احدد اقرب محطات حاليا.", "confidence": 1.0, "type": "text"}
 
         start_id = start_station["id"]
         end_id = end_station["id"]
 
-        path_ids, metro_min_f = _dijkstra(adj, start_id, end_id)
+        path_ids, metro_min_f = routes.path(start_id, end_id)
         if not path_ids:
-            save_session(passenger_id, session_id, RT_ASK_DEST, data)
+            unit.save(RT_ASK_DEST, data)
             return {"matched_faq_id": None, "answer": "ما قدرت القى مسار مترو بين اقرب محطتين حاليا.", "confidence": 1.0, "type": "text"}
 
         metro_min = int(round(metro_min_f or 0.0))
@@ -681,7 +884,14 @@ def route_flow(
         except Exception:
             pass
 
-        steps = _make_route_steps(path_ids, by_id)
+        steps = routes.steps(start_id, end_id)
+        # [0] is the route above; the rest trade minutes for fewer transfers
+        alternatives = routes.alternatives(start_id, end_id, ROUTE_ALTERNATIVES)[1:]
+
+        try:
+            schedule = _timetable_schedule(g, start_id, end_id, datetime.now(timezone.utc))
+        except Exception:
+            schedule = None
 
         data["rt_last"] = {
             "dest_label": dest_label,
@@ -696,7 +906,7 @@ def route_flow(
             "drive_from_end": drive_from_end,
             "path_ids": path_ids,
         }
-        save_session(passenger_id, session_id, RT_SHOWING, data)
+        unit.save(RT_SHOWING, data)
 
         title = f"هذا افضل مسار للوجهة: {dest_label}"
         return _route_card_response(
@@ -710,9 +920,11 @@ def route_flow(
             walk_from_end=walk_from_end,
             drive_from_end=drive_from_end,
             steps=steps,
+            alternatives=alternatives,
+            schedule=schedule,
         )
 
-    save_session(passenger_id, session_id, "menu", {})
+    unit.save("menu", {})
     return {"matched_faq_id": None, "answer": "اختاري مسار وجهتك من القائمة.", "confidence": 1.0, "type": "text"}
 
 
@@ -758,8 +970,10 @@ def _schedule_station_options(stations: List[Dict[str, Any]], limit: int = 6) ->
         remaining = sorted(remaining, key=lambda s: (s.get("line", ""), s.get("seq") is None, s.get("seq") or 10**9))
         picks.extend(remaining[: (limit - len(picks))])
 
-    picks = picks[:limit]
+    return _station_options(picks[:limit])
+
 
+def _station_options(picks: List[Dict[str, Any]]) -> Tuple[List[Dict[str, str]], Dict[str, str]]:
     options: List[Dict[str, str]] = []
     opt_map: Dict[str, str] = {}
     for i, s in enumerate(picks, start=1):
@@ -795,11 +1009,20 @@ def _schedule_inline_response(station_id: str, station_label: str, answer: str)
     }
 
 
-def schedule_flow(passenger_id: str, session_id: str, user_message: str) -> Dict[str, Any]:
+def schedule_flow(
+    passenger_id: str,
+    session_id: str,
+    user_message: str,
+    unit: Optional[SessionUnit] = None,
+) -> Dict[str, Any]:
+    if unit is None:
+        with session_unit(passenger_id, session_id) as unit:
+            return schedule_flow(passenger_id, session_id, user_message, unit)
+
     msg_raw = (user_message or "").strip()
     msg = _strip_opt_prefix(msg_raw)
 
-    session = get_session(passenger_id, session_id)
+    session = unit.load()
     state = session.get("state") or "menu"
     data = session.get("data", {}) or {}
 
@@ -809,7 +1032,7 @@ def schedule_flow(passenger_id: str, session_id: str, user_message: str) -> Dict
     if _norm_ar(msg) in {"", "options", "opt", "محطات", "اختيارات"}:
         options, opt_map = _schedule_station_options(stations, limit=STATION_OPTIONS_COUNT)
         data["sch_station_opt_map"] = opt_map
-        save_session(passenger_id, session_id, SCH_CHOOSE_STATION, data)
+        unit.save(SCH_CHOOSE_STATION, data)
         return {
             "matched_faq_id": None,
             "answer": "تمام. اختاري/اكتبي اسم المحطة عشان اعرض لك اقرب الرحلات القادمة.",
@@ -822,7 +1045,7 @@ def schedule_flow(passenger_id: str, session_id: str, user_message: str) -> Dict
         if msg == "1":
             options, opt_map = _schedule_station_options(stations, limit=STATION_OPTIONS_COUNT)
             data["sch_station_opt_map"] = opt_map
-            save_session(passenger_id, session_id, SCH_CHOOSE_STATION, data)
+            unit.save(SCH_CHOOSE_STATION, data)
             return {
                 "matched_faq_id": None,
                 "answer": "تمام. اختاري محطة جديدة.",
@@ -831,7 +1054,7 @@ def schedule_flow(passenger_id: str, session_id: str, user_message: str) -> Dict
                 "options": options,
             }
         if msg == "2":
-            save_session(passenger_id, session_id, "menu", {})
+            unit.save("menu", {})
             return menu_response()
         state = SCH_CHOOSE_STATION
 
@@ -845,10 +1068,30 @@ def schedule_flow(passenger_id: str, session_id: str, user_message: str) -> Dict
             found = _find_station_by_text(msg, stations, use_map_aliases=True)
             st_id = found["id"] if found else None
 
+        suggestions = []
+        if not st_id:
+            suggestions = _suggest_stations(msg, stations, STATION_OPTIONS_COUNT)
+            if suggestions and suggestions[0][1] <= FUZZY_ACCEPT_RATIO and (
+                len(suggestions) == 1 or suggestions[1][1] - suggestions[0][1] >= FUZZY_ACCEPT_RATIO / 2
+            ):
+                st_id = suggestions[0][0]["id"]
+
+        if (not st_id or st_id not in by_id) and suggestions:
+            options, new_map = _station_options([s for s, _ in suggestions])
+            data["sch_station_opt_map"] = new_map
+            unit.save(SCH_CHOOSE_STATION, data)
+            return {
+                "matched_faq_id": None,
+                "answer": "ما لقيت المحطة بالضبط. تقصدين وحدة من هذي المحطات؟",
+                "confidence": 1.0,
+                "type": "stations",
+                "options": options,
+            }
+
         if not st_id or st_id not in by_id:
             options, new_map = _schedule_station_options(stations, limit=STATION_OPTIONS_COUNT)
             data["sch_station_opt_map"] = new_map
-            save_session(passenger_id, session_id, SCH_CHOOSE_STATION, data)
+            unit.save(SCH_CHOOSE_STATION, data)
             return {
                 "matched_faq_id": None,
                 "answer": "ما قدرت احدد المحطة. اختاري من الاقتراحات او اكتبي الاسم بشكل اوضح.",
@@ -859,14 +1102,14 @@ def schedule_flow(passenger_id: str, session_id: str, user_message: str) -> Dict
 
         data["sch_station_id"] = st_id
         station_label = _station_display(by_id[st_id])
-        save_session(passenger_id, session_id, SCH_SHOWING_TRIPS, data)
+        unit.save(SCH_SHOWING_TRIPS, data)
         return _schedule_inline_response(
             station_id=st_id,
             station_label=station_label,
             answer=f"تمام، هذي أقرب الرحلات للمحطة: {station_label}",
         )
 
-    save_session(passenger_id, session_id, SCH_CHOOSE_STATION, data)
+    unit.save(SCH_CHOOSE_STATION, data)
     options, opt_map = _schedule_station_options(stations, limit=STATION_OPTIONS_COUNT)
     data["sch_station_opt_map"] = opt_map
     return {
@@ -881,13 +1124,22 @@ def schedule_flow(passenger_id: str, session_id: str, user_message: str) -> Dict
 # ----------------------------
 # ← جديد: Track flow
 # ----------------------------
-def track_flow(passenger_id: str, session_id: str, user_message: str) -> Dict[str, Any]:
+def track_flow(
+    passenger_id: str,
+    session_id: str,
+    user_message: str,
+    unit: Optional[SessionUnit] = None,
+) -> Dict[str, Any]:
+    if unit is None:
+        with session_unit(passenger_id, session_id) as unit:
+            return track_flow(passenger_id, session_id, user_message, unit)
+
     msg = _strip_opt_prefix((user_message or "").strip())
-    session = get_session(passenger_id, session_id)
+    session = unit.load()
     data = session.get("data", {}) or {}
 
     if msg in {"1", "MENU"}:
-        reset_session(passenger_id, session_id)
+        unit.reset()
         return menu_response()
 
     try:
@@ -896,7 +1148,7 @@ def track_flow(passenger_id: str, session_id: str, user_message: str) -> Dict[st
         reports = []
 
     if not reports:
-        save_session(passenger_id, session_id, TRACK_STATE, data)
+        unit.save(TRACK_STATE, data)
         return {
             "matched_faq_id": None,
             "answer": "ما عندك أي بلاغات مسجلة حتى الآن.",
@@ -939,7 +1191,7 @@ def track_flow(passenger_id: str, session_id: str, user_message: str) -> Dict[st
             "timeline":      timeline,
         })
 
-    save_session(passenger_id, session_id, TRACK_STATE, data)
+    unit.save(TRACK_STATE, data)
 
     return {
         "matched_faq_id": None,
@@ -956,6 +1208,26 @@ def track_flow(passenger_id: str, session_id: str, user_message: str) -> Dict[st
 # ----------------------------
 @app.post("/ask")
 def ask(req: AskReq):
+    # One session read and at most one write per request
+    unit = SessionUnit(req.passenger_id, req.session_id)
+    reply = _ask(req, unit)
+    try:
+        unit.flush()
+    except Exception as e:
+        return _server_error(e)
+    return reply
+
+
+def _server_error(e: Exception) -> Dict[str, Any]:
+    return {
+        "matched_faq_id": None,
+        "answer": f"SERVER_ERROR: {type(e).__name__}: {str(e)}",
+        "confidence": 0.0,
+        "type": "error"
+    }
+
+
+def _ask(req: AskReq, unit: SessionUnit) -> Dict[str, Any]:
     try:
         raw_question = (req.question or "").strip()
         question = _strip_opt_prefix(raw_question)
@@ -965,15 +1237,15 @@ def ask(req: AskReq):
         lat = req.lat
         lon = req.lon
 
-        session = get_session(passenger_id, session_id)
+        session = unit.load()
         state = (session.get("state") or "menu")
 
         if question.strip().lower() in ["", "menu", "start"]:
-            reset_session(passenger_id, session_id)
+            unit.reset()
             return menu_response()
 
         if _is_exit_to_menu(question):
-            reset_session(passenger_id, session_id)
+            unit.reset()
             return menu_response()
 
         # ← track state
@@ -982,13 +1254,15 @@ def ask(req: AskReq):
                 passenger_id=passenger_id,
                 session_id=session_id,
                 user_message=question,
+                unit=unit,
             )
 
         if str(state).startswith("lf_"):
             reply_text = handle_lost_found_flow(
                 session_id=session_id,
                 user_message=question,
-                passenger_id=passenger_id
+                passenger_id=passenger_id,
+                unit=unit,
             )
 
             response_type = "text"
@@ -1017,14 +1291,16 @@ def ask(req: AskReq):
                 session_id=session_id,
                 user_message=question,
                 lat=lat,
-                lon=lon
+                lon=lon,
+                unit=unit,
             )
 
         if state in {SCH_CHOOSE_STATION, SCH_SHOWING_TRIPS}:
             return schedule_flow(
                 passenger_id=passenger_id,
                 session_id=session_id,
-                user_message=question
+                user_message=question,
+                unit=unit,
             )
 
         if state == GENERAL_STATE:
@@ -1046,7 +1322,7 @@ def ask(req: AskReq):
             return menu_response()
 
         if question == "1":
-            save_session(passenger_id, session_id, GENERAL_STATE, session.get("data", {}) or {})
+            unit.save(GENERAL_STATE, session.get("data", {}) or {})
             return {
                 "matched_faq_id": None,
                 "answer": "تم. ارسلي سؤالك العام وانا اجاوبك.",
@@ -1058,7 +1334,8 @@ def ask(req: AskReq):
             reply_text = handle_lost_found_flow(
                 session_id=session_id,
                 user_message="menu",
-                passenger_id=passenger_id
+                passenger_id=passenger_id,
+                unit=unit,
             )
 
             response_type = "text"
@@ -1086,7 +1363,7 @@ def ask(req: AskReq):
             stations = _load_stations()
             options, opt_map = _schedule_station_options(stations, limit=STATION_OPTIONS_COUNT)
             data["sch_station_opt_map"] = opt_map
-            save_session(passenger_id, session_id, SCH_CHOOSE_STATION, data)
+            unit.save(SCH_CHOOSE_STATION, data)
             return {
                 "matched_faq_id": None,
                 "answer": "تمام. اختاري/اكتبي اسم المحطة عشان اعرض لك اقرب الرحلات القادمة.",
@@ -1097,7 +1374,7 @@ def ask(req: AskReq):
 
         if question == "4":
             data = session.get("data", {}) or {}
-            save_session(passenger_id, session_id, RT_ASK_DEST, data)
+            unit.save(RT_ASK_DEST, data)
             return {
                 "matched_faq_id": None,
                 "answer": "وين تبي تروح؟",
@@ -1107,11 +1384,12 @@ def ask(req: AskReq):
 
         # ← جديد: خيار 5
         if question == "5":
-            save_session(passenger_id, session_id, TRACK_STATE, {})
+            unit.save(TRACK_STATE, {})
             return track_flow(
                 passenger_id=passenger_id,
                 session_id=session_id,
                 user_message=question,
+                unit=unit,
             )
 
         faqs = fetch_all_faq()
@@ -1124,12 +1402,7 @@ def ask(req: AskReq):
         }
 
     except Exception as e:
-        return {
-            "matched_faq_id": None,
-            "answer": f"SERVER_ERROR: {type(e).__name__}: {str(e)}",
-            "confidence": 0.0,
-            "type": "error"
-        }
+        return _server_error(e)
 
 
 # ----------------------------
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.timetable import Timetable
+
+INF = 1 << 62
+
+
+# ----------------------------
+# Planner
+# ----------------------------
+class RaptorPlanner:
+    """
+    Round-based earliest-arrival search (RAPTOR) over a Timetable.
+    Round k allows k rides; between rides, 'footpaths' (station id ->
+    [(station id, seconds)], e.g. the metro graph's transfer links) may
+    be walked once. Each round scans only the routes serving a stop
+    improved in the previous round.
+    """
+
+    def __init__(self, timetable: Timetable, footpaths: Optional[Dict[str, List[Tuple[str, float]]]] = None):
+        self.tt = timetable
+        self.footpaths: List[List[Tuple[int, int]]] = [[] for _ in timetable.stop_ids]
+        for a, edges in (footpaths or {}).items():
+            pa = timetable.stop_index.get(a)
+            if pa is None:
+                continue
+            for b, seconds in edges:
+                pb = timetable.stop_index.get(b)
+                if pb is not None and pb != pa:
+                    self.footpaths[pa].append((pb, int(round(seconds))))
+
+    def _earliest_trip(self, r: int, pos: int, ts: int, before: int) -> Optional[int]:
+        """First trip of route r (row < before) leaving stop 'pos' at or after ts."""
+        times = self.tt.route_times[r]
+        width = len(self.tt.route_stops[r])
+        lo, hi = 0, before
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[mid * width + pos] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < before else None
+
+    def earliest_arrival(
+        self,
+        origin: str,
+        target: str,
+        depart_ts: int,
+        max_rounds: int = 5,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Earliest arrival at target leaving origin at depart_ts, with the
+        fewest rides among equally early journeys. Returns
+        {"depart_ts", "arrive_ts", "rides", "legs": [...]} or None.
+        """
+        tt = self.tt
+        src = tt.stop_index.get(origin)
+        dst = tt.stop_index.get(target)
+        if src is None or dst is None or src == dst:
+            return None
+
+        n = len(tt.stop_ids)
+        best = [INF] * n
+        tau = [INF] * n
+        tau[src] = best[src] = depart_ts
+        # Per round: rides[k][p] = (route, trip, board_pos, alight_pos),
+        # walks[k][p] = (from_stop, seconds) leaving a stop reached by a ride
+        rides: List[Dict[int, Tuple[int, int, int, int]]] = [{}]
+        walks: List[Dict[int, Tuple[int, int]]] = [{}]
+        marked = {src}
+        for q, secs in self.footpaths[src]:
+            if depart_ts + secs < best[q]:
+                tau[q] = best[q] = depart_ts + secs
+                walks[0][q] = (src, secs)
+                marked.add(q)
+
+        for k in range(1, max_rounds + 1):
+            prev = tau
+            tau = list(prev)
+            rides.append({})
+            walks.append({})
+
+            queue: Dict[int, int] = {}
+            for p in marked:
+                for r, pos in tt.stop_routes[p]:
+                    if pos < queue.get(r, INF):
+                        queue[r] = pos
+
+            for r, start_pos in queue.items():
+                stops = tt.route_stops[r]
+                times = tt.route_times[r]
+                width = len(stops)
+                n_trips = len(tt.route_trips[r])
+                trip = None
+                board = -1
+                for pos in range(start_pos, width):
+                    p = stops[pos]
+                    if trip is not None:
+                        arr = times[trip * width + pos]
+                        if arr < best[p] and arr < best[dst]:
+                            tau[p] = best[p] = arr
+                            rides[k][p] = (r, trip, board, pos)
+                    if pos < width - 1 and prev[p] < INF and (trip is None or prev[p] <= times[trip * width + pos]):
+                        t = self._earliest_trip(r, pos, prev[p], n_trips if trip is None else trip + 1)
+                        if t is not None and (trip is None or t < trip):
+                            trip, board = t, pos
+
+            marked = set(rides[k])
+            ride_arrival = {p: tau[p] for p in rides[k]}
+            for p, arr_p in ride_arrival.items():
+                for q, secs in self.footpaths[p]:
+                    arr = arr_p + secs
+                    if arr < best[q] and arr < best[dst]:
+                        tau[q] = best[q] = arr
+                        walks[k][q] = (p, secs)
+                        marked.add(q)
+            if not marked:
+                break
+
+        if best[dst] >= INF:
+            return None
+        return self._journey(rides, walks, src, dst, depart_ts, best[dst])
+
+    def _journey(
+        self,
+        rides: List[Dict[int, Tuple[int, int, int, int]]],
+        walks: List[Dict[int, Tuple[int, int]]],
+        src: int,
+        dst: int,
+        depart_ts: int,
+        arrive_ts: int,
+    ) -> Dict[str, Any]:
+        tt = self.tt
+        legs: List[Dict[str, Any]] = []
+        k = len(rides) - 1
+        p = dst
+        while p != src and k >= 0:
+            if p in walks[k]:
+                # A walk improves on the ride label it would otherwise replace
+                q, secs = walks[k][p]
+                legs.append({
+                    "type": "transfer",
+                    "from": tt.stop_ids[q],
+                    "to": tt.stop_ids[p],
+                    "minutes": round(secs / 60.0, 1),
+                })
+                p = q
+                if k == 0:
+                    break
+            if p not in rides[k]:
+                k -= 1
+                continue
+            r, trip, board, alight = rides[k][p]
+            stops = tt.route_stops[r]
+            times = tt.route_times[r]
+            width = len(stops)
+            line_id, direction_id = tt.route_meta[r]
+            legs.append({
+                "type": "ride",
+                "line_id": line_id,
+                "direction_id": direction_id,
+                "trip_id": tt.route_trips[r][trip],
+                "from": tt.stop_ids[stops[board]],
+                "to": tt.stop_ids[stops[alight]],
+                "depart_ts": times[trip * width + board],
+                "arrive_ts": times[trip * width + alight],
+                "stops": alight - board,
+            })
+            p = stops[board]
+            k -= 1
+
+        legs.reverse()
+        first_ride = next((l for l in legs if l["type"] == "ride"), None)
+        return {
+            "depart_ts": first_ride["depart_ts"] if first_ride else depart_ts,
+            "arrive_ts": arrive_ts,
+            "rides": sum(1 for l in legs if l["type"] == "ride"),
+            "legs": legs,
+        }
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import heapq
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+Adjacency = Dict[str, List[Tuple[str, float]]]
+
+
+# ----------------------------
+# Shortest-path trees
+# ----------------------------
+def shortest_path_tree(adj: Adjacency, start: str) -> Tuple[Dict[str, float], Dict[str, Optional[str]]]:
+    """
+    Full Dijkstra from start: (dist, prev) for every reachable station.
+
+    Relaxation order and the strict '<' match main._dijkstra, so the
+    path read back from prev is the one _dijkstra(adj, start, goal)
+    returns (it stops at goal, but prev of goal and of every station on
+    its path is final by then).
+    """
+    dist: Dict[str, float] = {start: 0.0}
+    prev: Dict[str, Optional[str]] = {start: None}
+    pq = [(0.0, start)]
+    visited = set()
+
+    while pq:
+        d, u = heapq.heappop(pq)
+        if u in visited:
+            continue
+        visited.add(u)
+        for v, w in adj.get(u, []):
+            nd = d + w
+            if v not in dist or nd < dist[v]:
+                dist[v] = nd
+                prev[v] = u
+                heapq.heappush(pq, (nd, v))
+
+    return dist, prev
+
+
+def _restricted_path(
+    adj: Adjacency,
+    start: str,
+    goal: str,
+    banned_nodes: Set[str],
+    banned_edges: Set[Tuple[str, str]],
+) -> Tuple[Optional[List[str]], Optional[float]]:
+    """main._dijkstra that may not enter banned_nodes or use banned_edges."""
+    dist: Dict[str, float] = {start: 0.0}
+    prev: Dict[str, Optional[str]] = {start: None}
+    pq = [(0.0, start)]
+    visited = set()
+
+    while pq:
+        d, u = heapq.heappop(pq)
+        if u in visited:
+            continue
+        visited.add(u)
+        if u == goal:
+            break
+        for v, w in adj.get(u, []):
+            if v in banned_nodes or (u, v) in banned_edges:
+                continue
+            nd = d + w
+            if v not in dist or nd < dist[v]:
+                dist[v] = nd
+                prev[v] = u
+                heapq.heappush(pq, (nd, v))
+
+    if goal not in dist:
+        return None, None
+
+    path = []
+    cur: Optional[str] = goal
+    while cur is not None:
+        path.append(cur)
+        cur = prev.get(cur)
+    path.reverse()
+    return path, dist[goal]
+
+
+def k_shortest_paths(adj: Adjacency, start: str, goal: str, k: int) -> List[Tuple[float, List[str]]]:
+    """
+    Yen's algorithm: up to k loopless (minutes, path) pairs, shortest
+    first. The first one is the path _dijkstra returns.
+    """
+    first, cost = _restricted_path(adj, start, goal, set(), set())
+    if first is None or k <= 0:
+        return []
+
+    # Parallel edges (e.g. duplicate transfer links) count at their cheapest
+    weight: Dict[Tuple[str, str], float] = {}
+    for u, edges in adj.items():
+        for v, w in edges:
+            if (u, v) not in weight or w < weight[(u, v)]:
+                weight[(u, v)] = w
+
+    found: List[Tuple[float, List[str]]] = [(cost, first)]
+    seen = {tuple(first)}
+    candidates: List[Tuple[float, int, List[str]]] = []
+    counter = 0
+
+    while len(found) < k:
+        last = found[-1][1]
+        root_cost = 0.0
+        for j in range(len(last) - 1):
+            spur = last[j]
+            root = last[: j + 1]
+            banned_edges = {(p[j], p[j + 1]) for _, p in found if len(p) > j + 1 and p[: j + 1] == root}
+            spur_path, spur_cost = _restricted_path(adj, spur, goal, set(root[:-1]), banned_edges)
+            if spur_path is not None:
+                path = root[:-1] + spur_path
+                if tuple(path) not in seen:
+                    seen.add(tuple(path))
+                    counter += 1
+                    heapq.heappush(candidates, (root_cost + spur_cost, counter, path))
+            root_cost += weight[(last[j], last[j + 1])]
+
+        if not candidates:
+            break
+        c, _, path = heapq.heappop(candidates)
+        found.append((c, path))
+
+    return found
+
+
+# ----------------------------
+# Route table
+# ----------------------------
+class RouteTable:
+    """
+    All-pairs metro routes, computed once per graph build (one Dijkstra
+    per station; the graph has ~100 nodes). path() is a table walk and
+    steps() renders a station pair's step list once, then serves it
+    from a per-pair cache. alternatives() adds Yen k-shortest routes,
+    also cached per (start, goal, k). Returned lists are shared: do not
+    mutate.
+    """
+
+    # Yen paths examined per alternative asked for
+    SEARCH_FACTOR = 3
+
+    def __init__(
+        self,
+        adj: Adjacency,
+        render_steps: Optional[Callable[[List[str]], List[Dict[str, Any]]]] = None,
+        lines: Optional[Dict[str, str]] = None,
+    ):
+        self.adj = adj
+        self.render_steps = render_steps
+        self.lines = lines or {}
+        self.dist: Dict[str, Dict[str, float]] = {}
+        self.prev: Dict[str, Dict[str, Optional[str]]] = {}
+        for sid in adj:
+            self.dist[sid], self.prev[sid] = shortest_path_tree(adj, sid)
+
+        self._paths: Dict[Tuple[str, str], List[str]] = {}
+        self._steps: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._alternatives: Dict[Tuple[str, str, int], List[Dict[str, Any]]] = {}
+
+    def minutes(self, start: str, goal: str) -> Optional[float]:
+        if start == goal:
+            return 0.0
+        return self.dist.get(start, {}).get(goal)
+
+    def path(self, start: str, goal: str) -> Tuple[Optional[List[str]], Optional[float]]:
+        """(station ids, minutes) like main._dijkstra, or (None, None)."""
+        if start == goal:
+            return [start], 0.0
+        minutes = self.minutes(start, goal)
+        if minutes is None:
+            return None, None
+
+        key = (start, goal)
+        path = self._paths.get(key)
+        if path is None:
+            prev = self.prev[start]
+            path = []
+            cur: Optional[str] = goal
+            while cur is not None:
+                path.append(cur)
+                cur = prev.get(cur)
+            path.reverse()
+            self._paths[key] = path
+        return path, minutes
+
+    def steps(self, start: str, goal: str) -> List[Dict[str, Any]]:
+        key = (start, goal)
+        steps = self._steps.get(key)
+        if steps is None:
+            path, _ = self.path(start, goal)
+            steps = self.render_steps(path) if (path and self.render_steps) else []
+            self._steps[key] = steps
+        return steps
+
+    def transfers(self, path_ids: List[str]) -> int:
+        """Line changes along a path (the 'transfer' steps of the route card)."""
+        count = 0
+        for a, b in zip(path_ids, path_ids[1:]):
+            line = self.lines.get(b)
+            if line and line != self.lines.get(a):
+                count += 1
+        return count
+
+    def alternatives(self, start: str, goal: str, k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Up to k routes on the minutes / transfers Pareto front, fastest
+        first; each later one has fewer transfers than all before it.
+        Items: {"path_ids", "minutes", "transfers", "steps"}.
+        """
+        key = (start, goal, k)
+        cached = self._alternatives.get(key)
+        if cached is not None:
+            return cached
+
+        out: List[Dict[str, Any]] = []
+        if start != goal and k > 0:
+            for minutes, path in k_shortest_paths(self.adj, start, goal, k * self.SEARCH_FACTOR):
+                transfers = self.transfers(path)
+                if out and transfers >= out[-1]["transfers"]:
+                    continue
+                out.append({
+                    "path_ids": path,
+                    "minutes": minutes,
+                    "transfers": transfers,
+                    "steps": self.render_steps(path) if self.render_steps else [],
+                })
+                if len(out) >= k:
+                    break
+
+        self._alternatives[key] = out
+        return out
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import copy
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, Optional
 
 from app.firestore import get_db
 
@@ -92,4 +94,95 @@ def delete_session(passenger_id: str, session_id: str) -> None:
     """
     db = get_db()
     doc_id = _build_doc_id(passenger_id, session_id)
-    db.collection(SESSIONS_COL).document(doc_id).delete()
\ No newline at end of file
+    db.collection(SESSIONS_COL).document(doc_id).delete()
+
+
+# ----------------------------
+# Request-scoped unit of work
+# ----------------------------
+class SessionUnit:
+    """
+    One request's view of a session: read from Firestore at most once,
+    changed in memory by save() / reset(), written once by flush().
+
+    load() and save() copy 'data', so a flow that edits its dict without
+    saving changes nothing, exactly as with get_session / save_session.
+    flush() writes only the fields that differ from what was loaded (plus
+    updated_at), and nothing when the request never saved.
+
+    Flows take an optional unit; called without one they open their own
+    (see session_unit), so each call still reads and writes on its own.
+    """
+
+    def __init__(self, passenger_id: str, session_id: str):
+        self.passenger_id = passenger_id
+        self.session_id = session_id
+        self._loaded: Optional[Dict[str, Any]] = None
+        self._state: Optional[str] = None
+        self._data: Dict[str, Any] = {}
+        self._touched = False
+
+    @property
+    def doc_id(self) -> str:
+        return _build_doc_id(self.passenger_id, self.session_id)
+
+    def load(self) -> Dict[str, Any]:
+        """Same shape as get_session(), including this request's unsaved writes."""
+        if self._loaded is None:
+            self._loaded = get_session(self.passenger_id, self.session_id)
+            self._state = self._loaded["state"]
+            self._data = copy.deepcopy(self._loaded["data"])
+        return {
+            "state": self._state,
+            "data": copy.deepcopy(self._data),
+            "updated_at": self._loaded.get("updated_at"),
+        }
+
+    def save(self, state: str, data: Optional[Dict[str, Any]] = None) -> None:
+        self._state = str(state or "menu")
+        self._data = copy.deepcopy(_normalize_data(data))
+        self._touched = True
+
+    def reset(self) -> None:
+        self.save("menu", {})
+
+    def dirty_fields(self) -> Dict[str, Any]:
+        if not self._touched:
+            return {}
+        # Not read, or no document yet (never written): write every field
+        loaded = self._loaded or {}
+        full = loaded.get("updated_at") is None
+        fields: Dict[str, Any] = {}
+        if full or self._state != loaded.get("state"):
+            fields["state"] = self._state
+        if full or self._data != loaded.get("data"):
+            fields["data"] = self._data
+        return fields
+
+    def flush(self) -> None:
+        """One merged write of this request's changes."""
+        if not self._touched:
+            return
+        payload = dict(self.dirty_fields())
+        payload["updated_at"] = _now_utc_iso()
+
+        get_db().collection(SESSIONS_COL).document(self.doc_id).set(payload, merge=True)
+
+        self._loaded = {"state": self._state, "data": copy.deepcopy(self._data), "updated_at": payload["updated_at"]}
+        self._touched = False
+
+
+@contextmanager
+def session_unit(passenger_id: str, session_id: str, unit: Optional[SessionUnit] = None) -> Iterator[SessionUnit]:
+    """
+    Reuse 'unit' when it is for the same session document; otherwise open
+    a new one for the block and flush it on the way out.
+    """
+    if unit is not None and unit.doc_id == _build_doc_id(passenger_id, session_id):
+        yield unit
+        return
+    unit = SessionUnit(passenger_id, session_id)
+    try:
+        yield unit
+    finally:
+        unit.flush()
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import math
+from typing import Callable, Dict, Generic, List, Optional, Sequence, Tuple, TypeVar
+
+try:
+    import numpy as np
+except ImportError:  # batch queries fall back to per-point lookups
+    np = None
+
+T = TypeVar("T")
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LON_EQUATOR = 111.320
+
+# Grid projection error is well under 1% over a city; this keeps the
+# ring-search stop condition on the safe side of it.
+_RING_SLACK = 0.98
+
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance (km) between two lat/lon points."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+# ----------------------------
+# Index
+# ----------------------------
+class SpatialIndex(Generic[T]):
+    """
+    Uniform grid over an equirectangular projection of the points
+    (cell_km x cell_km buckets). Queries scan rings of cells outward from
+    the query's cell and rank the candidates by exact haversine distance;
+    ties keep input order, like a linear scan with a strict '<'.
+
+    Without cell_km the cell size is picked so that a cell holds about
+    CELL_POINTS points on average over the bounding box.
+    """
+
+    CELL_POINTS = 0.4
+
+    def __init__(
+        self,
+        points: Sequence[Tuple[float, float]],
+        items: Sequence[T],
+        cell_km: Optional[float] = None,
+    ):
+        if len(points) != len(items):
+            raise ValueError("points and items must have the same length")
+        self.items: List[T] = list(items)
+        self.lats = [float(p[0]) for p in points]
+        self.lons = [float(p[1]) for p in points]
+
+        lat0 = sum(self.lats) / len(self.lats) if self.lats else 0.0
+        self._kx = KM_PER_DEG_LON_EQUATOR * math.cos(math.radians(lat0))
+        self._ky = KM_PER_DEG_LAT
+
+        if cell_km is None:
+            width = (max(self.lons) - min(self.lons)) * self._kx if self.lons else 0.0
+            height = (max(self.lats) - min(self.lats)) * self._ky if self.lats else 0.0
+            area = max(width, 1.0) * max(height, 1.0)
+            cell_km = math.sqrt(area * self.CELL_POINTS / max(1, len(self.items)))
+        self.cell_km = max(0.1, float(cell_km))
+
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, (lat, lon) in enumerate(zip(self.lats, self.lons)):
+            self.cells.setdefault(self._cell(lat, lon), []).append(i)
+
+        if self.cells:
+            xs = [c[0] for c in self.cells]
+            ys = [c[1] for c in self.cells]
+            self._bounds = (min(xs), max(xs), min(ys), max(ys))
+        else:
+            self._bounds = (0, -1, 0, -1)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (
+            int(math.floor(lon * self._kx / self.cell_km)),
+            int(math.floor(lat * self._ky / self.cell_km)),
+        )
+
+    def _ring(self, cx: int, cy: int, r: int) -> List[int]:
+        if r == 0:
+            return list(self.cells.get((cx, cy), ()))
+        out: List[int] = []
+        for x in range(cx - r, cx + r + 1):
+            out.extend(self.cells.get((x, cy - r), ()))
+            out.extend(self.cells.get((x, cy + r), ()))
+        for y in range(cy - r + 1, cy + r):
+            out.extend(self.cells.get((cx - r, y), ()))
+            out.extend(self.cells.get((cx + r, y), ()))
+        return out
+
+    def _max_ring(self, cx: int, cy: int) -> int:
+        x0, x1, y0, y1 = self._bounds
+        return max(abs(cx - x0), abs(cx - x1), abs(cy - y0), abs(cy - y1))
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int = 1,
+        accept: Optional[Callable[[T], bool]] = None,
+    ) -> List[Tuple[T, float]]:
+        """Up to k (item, distance_km) pairs, closest first."""
+        if k <= 0 or not self.items:
+            return []
+        cx, cy = self._cell(lat, lon)
+        last = self._max_ring(cx, cy)
+
+        found: List[Tuple[float, int]] = []
+        r = 0
+        while r <= last:
+            for i in self._ring(cx, cy, r):
+                if accept is None or accept(self.items[i]):
+                    found.append((haversine_km(lat, lon, self.lats[i], self.lons[i]), i))
+            # Anything outside rings 0..r is at least r cells away
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= r * self.cell_km * _RING_SLACK:
+                    break
+            r += 1
+
+        found.sort()
+        return [(self.items[i], d) for d, i in found[:k]]
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[T, float]]:
+        """All (item, distance_km) pairs within radius_km, closest first."""
+        if not self.items or radius_km < 0:
+            return []
+        cx, cy = self._cell(lat, lon)
+        rings = min(self._max_ring(cx, cy), int(math.ceil(radius_km / (self.cell_km * _RING_SLACK))) + 1)
+
+        found: List[Tuple[float, int]] = []
+        for r in range(rings + 1):
+            for i in self._ring(cx, cy, r):
+                d = haversine_km(lat, lon, self.lats[i], self.lons[i])
+                if d <= radius_km:
+                    found.append((d, i))
+        found.sort()
+        return [(self.items[i], d) for d, i in found]
+
+    def nearest_many(self, points: Sequence[Tuple[float, float]]) -> List[Optional[Tuple[T, float]]]:
+        """
+        Nearest (item, distance_km) for each query point. With NumPy this is
+        one vectorized haversine matrix; otherwise one grid query per point.
+        """
+        if not self.items:
+            return [None] * len(points)
+        if np is None:
+            return [(self.nearest(lat, lon, 1) or [None])[0] for lat, lon in points]
+
+        q = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+        plat = np.radians(np.asarray(self.lats))
+        plon = np.radians(np.asarray(self.lons))
+        qlat, qlon = q[:, :1], q[:, 1:]
+        a = (
+            np.sin((plat - qlat) / 2) ** 2
+            + np.cos(qlat) * np.cos(plat) * np.sin((plon - qlon) / 2) ** 2
+        )
+        d = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        best = d.argmin(axis=1)  # first minimum -> input order on ties
+        return [(self.items[j], float(d[i, j])) for i, j in enumerate(best)]
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import os
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# Longest n-gram kept in the inverted index. Queries of this length or
+# more are looked up by their NGRAM-grams; shorter ones by the whole query.
+NGRAM = 3
+
+# Fuzzy matching: candidates re-ranked by edit distance, kept when
+# distance / length is at most FUZZY_MAX_RATIO.
+FUZZY_MAX_RATIO = float(os.getenv("FUZZY_MAX_RATIO", "0.34"))
+FUZZY_CANDIDATES = int(os.getenv("FUZZY_CANDIDATES", "24"))
+
+_AR_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u0640]")
+_NON_WORD = re.compile(r"[^\w]+")
+# Transliterated Arabic article: "al", "ad dar", "as sulimaniyah", ...
+_EN_ARTICLES = {"al", "el", "ad", "ar", "as", "ash", "at", "ath", "az", "an", "adh", "the"}
+
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def _grams(s: str, n: int) -> Set[str]:
+    return {s[i:i + n] for i in range(len(s) - n + 1)}
+
+
+def fuzzy_norm(s: str) -> str:
+    """
+    Spelling-insensitive form of a station name: hamza / taa-marbuta /
+    alef-maqsura variants folded, diacritics and punctuation removed,
+    and the article dropped ("ال" prefix, "al-" / "ad " / "as " ...).
+    """
+    s = (s or "").lower()
+    s = _AR_DIACRITICS.sub("", s)
+    for src, dst in (("أ", "ا"), ("إ", "ا"), ("آ", "ا"), ("ٱ", "ا"), ("ى", "ي"),
+                     ("ة", "ه"), ("ؤ", "و"), ("ئ", "ي"), ("ء", "")):
+        s = s.replace(src, dst)
+    words = []
+    for w in _NON_WORD.sub(" ", s).replace("_", " ").split():
+        if w in _EN_ARTICLES:
+            continue
+        if w.startswith("ال") and len(w) > 3:
+            w = w[2:]
+        words.append(w)
+    return " ".join(words)
+
+
+def _trigrams(s: str) -> Set[str]:
+    return _grams(f"  {s} ", 3)
+
+
+def _char_masks(pattern: str) -> Dict[str, int]:
+    masks: Dict[str, int] = {}
+    for i, c in enumerate(pattern):
+        masks[c] = masks.get(c, 0) | (1 << i)
+    return masks
+
+
+def _bit_distance(masks: Dict[str, int], m: int, text: str) -> int:
+    """
+    Levenshtein distance between a pattern of length m (given by its
+    per-character bit masks) and text: Myers' bit-vector algorithm, one
+    column of the DP table per text character as a few integer ops.
+    """
+    if m == 0:
+        return len(text)
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = full, 0, m
+    for c in text:
+        eq = masks.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & full
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+    return score
+
+
+def edit_distance(a: str, b: str, limit: Optional[int] = None) -> int:
+    """Levenshtein distance, capped at limit + 1 when 'limit' is given."""
+    d = _bit_distance(_char_masks(a), len(a), b)
+    return d if limit is None else min(d, limit + 1)
+
+
+# ----------------------------
+# Index
+# ----------------------------
+class StationIndex:
+    """
+    Station lookup tables built once from the loaded stations.
+
+    find() returns the same station as a linear scan would:
+      1) station_id_map alias -> the station whose id is the alias group's
+         last entry (first matching map entry wins)
+      2) exact normalized key (first station in list order)
+      3) first station in list order with a key containing the query,
+         using an n-gram inverted index to narrow the candidates
+
+    suggest() is the fallback for misspelled names: a trigram index over
+    fuzzy_norm()'d keys and aliases, re-ranked by edit distance.
+    """
+
+    def __init__(
+        self,
+        stations: List[Dict[str, Any]],
+        alias_groups: Iterable[List[str]],
+        norm: Callable[[str], str],
+    ):
+        self.stations = stations
+        self.norm = norm
+
+        by_id: Dict[str, int] = {}
+        self.exact: Dict[str, int] = {}
+        self.postings: Dict[str, Set[int]] = {}
+
+        for pos, s in enumerate(stations):
+            sid = s.get("id")
+            if sid:
+                by_id.setdefault(sid, pos)
+            for k in s.get("keys") or []:
+                self.exact.setdefault(k, pos)
+                for n in range(1, NGRAM + 1):
+                    for g in _grams(k, n):
+                        self.postings.setdefault(g, set()).add(pos)
+
+        # normalized alias -> station positions, in map order
+        self.aliases: Dict[str, List[int]] = {}
+        for aliases in alias_groups:
+            if not aliases:
+                continue
+            candidate_code = aliases[-1]
+            if not candidate_code or " " in candidate_code or candidate_code not in by_id:
+                continue
+            target = by_id[candidate_code]
+            for a in dict.fromkeys(norm(a) for a in aliases):
+                self.aliases.setdefault(a, []).append(target)
+
+        # Fuzzy entries: (fuzzy name, station position), one per distinct name
+        names: Dict[Tuple[str, int], None] = {}
+        for pos, s in enumerate(stations):
+            for k in s.get("keys") or []:
+                names[(fuzzy_norm(k), pos)] = None
+        for a, targets in self.aliases.items():
+            for pos in targets:
+                names[(fuzzy_norm(a), pos)] = None
+        self.fuzzy_names: List[Tuple[str, int]] = [n for n in names if n[0]]
+        self.fuzzy_postings: Dict[str, List[int]] = {}
+        self.fuzzy_gram_counts: List[int] = []
+        for i, (name, _) in enumerate(self.fuzzy_names):
+            grams = _trigrams(name)
+            self.fuzzy_gram_counts.append(len(grams))
+            for g in grams:
+                self.fuzzy_postings.setdefault(g, []).append(i)
+
+    def _substring_match(self, q: str) -> Optional[int]:
+        if len(q) <= NGRAM:
+            candidates = self.postings.get(q, set())
+        else:
+            sets = [self.postings.get(g, set()) for g in _grams(q, NGRAM)]
+            sets.sort(key=len)
+            candidates = set(sets[0]).intersection(*sets[1:])
+
+        # n-grams can match across different keys or out of order; confirm
+        for pos in sorted(candidates):
+            if any(q in k for k in self.stations[pos].get("keys") or []):
+                return pos
+        return None
+
+    def find(self, text: str, *, use_map_aliases: bool = True) -> Optional[Dict[str, Any]]:
+        q = self.norm(text)
+        if not q:
+            return None
+
+        if use_map_aliases:
+            hits = self.aliases.get(q)
+            if hits:
+                return self.stations[hits[0]]
+
+        pos = self.exact.get(q)
+        if pos is None:
+            pos = self._substring_match(q)
+        return self.stations[pos] if pos is not None else None
+
+    def suggest(self, text: str, k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Up to k (station, score) pairs for a possibly misspelled name, best
+        first, one per station id. score = edit distance / name length
+        (0 = same spelling); candidates above FUZZY_MAX_RATIO are dropped.
+        """
+        q = fuzzy_norm(text)
+        if not q:
+            return []
+
+        q_grams = _trigrams(q)
+        q_masks = _char_masks(q)
+        shared: Dict[int, int] = {}
+        for g in q_grams:
+            for i in self.fuzzy_postings.get(g, ()):
+                shared[i] = shared.get(i, 0) + 1
+        top = sorted(shared, key=lambda i: (-shared[i], i))[:FUZZY_CANDIDATES]
+
+        best: Dict[str, Tuple[float, int]] = {}
+        kth = FUZZY_MAX_RATIO  # score to beat once k stations are found
+        for i in top:
+            name, pos = self.fuzzy_names[i]
+            length = max(len(q), len(name))
+            limit = int(kth * length)
+            # One edit changes at most 3 trigrams: too few shared -> too far
+            if shared[i] < max(len(q_grams), self.fuzzy_gram_counts[i]) - 3 * limit:
+                continue
+            if abs(len(q) - len(name)) > limit:
+                continue
+            d = _bit_distance(q_masks, len(q), name)
+            if d > limit:
+                continue
+            score = d / length
+            sid = self.stations[pos].get("id") or str(pos)
+            if sid not in best or (score, pos) < best[sid]:
+                best[sid] = (score, pos)
+                if len(best) >= k:
+                    kth = sorted(best.values())[k - 1][0]
+
+        ranked = sorted(best.values())[:k]
+        return [(self.stations[pos], round(score, 3)) for score, pos in ranked]
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # per-station arrays fall back to array('q') + bisect
+    np = None
+
+from app.firestore import get_db
+
+logger = logging.getLogger(__name__)
+
+# Service day boundary (local time) and how far past midnight a day's
+# index reaches, so late trips are still answered from memory.
+SCHEDULE_UTC_OFFSET_H = float(os.getenv("SCHEDULE_UTC_OFFSET_H", "3"))
+STATION_TT_SPILL_H = float(os.getenv("STATION_TT_SPILL_H", "3"))
+# Start loading the next day's index this long before midnight.
+STATION_TT_PREFETCH_MIN = int(os.getenv("STATION_TT_PREFETCH_MIN", "30"))
+STATION_TT_ENABLED = os.getenv("STATION_TT_ENABLED", "1") == "1"
+# After a failed load, wait this long before trying that day again.
+STATION_TT_RETRY_SEC = int(os.getenv("STATION_TT_RETRY_SEC", "60"))
+
+_GET_ALL_CHUNK = 300
+
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def _epoch(x: Any) -> Optional[int]:
+    if isinstance(x, datetime):
+        if x.tzinfo is None:
+            x = x.replace(tzinfo=timezone.utc)
+        return int(x.timestamp())
+    if isinstance(x, (int, float)):
+        return int(x)
+    return None
+
+
+def service_day(now: datetime) -> Tuple[datetime, datetime]:
+    """[start, end) in UTC of the local service day containing 'now', end including the spill."""
+    tz = timezone(timedelta(hours=SCHEDULE_UTC_OFFSET_H))
+    local = now.astimezone(tz)
+    start = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    end = start + timedelta(days=1, hours=STATION_TT_SPILL_H)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+
+
+# ----------------------------
+# Index
+# ----------------------------
+class StationTimetable:
+    """
+    One service day of stop events, grouped by station.
+
+      times[station]     sorted arrival epochs (int64)
+      trip_idx[station]  row in the trip table, parallel to times
+      clock[station]     arrival_time strings ("HH:MM:SS"), parallel to times
+      trip table         trip_ids / line_ids / direction_ids / headsigns
+
+    next_trips() is a binary search on the station's times.
+    """
+
+    def __init__(self, start_ts: int, end_ts: int):
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.times: Dict[str, Any] = {}
+        self.trip_idx: Dict[str, Any] = {}
+        self.clock: Dict[str, List[str]] = {}
+        self.trip_ids: List[str] = []
+        self.line_ids: List[str] = []
+        self.direction_ids: List[str] = []
+        self.headsigns: List[str] = []
+
+    def covers(self, ts: int) -> bool:
+        return self.start_ts <= ts < self.end_ts
+
+    @classmethod
+    def build(cls, events: Iterable[Dict[str, Any]], start_ts: int, end_ts: int) -> "StationTimetable":
+        """
+        events: one per stop with station_id, ts (epoch seconds),
+        arrival_time, trip_key, trip_id, line_id, direction_id, headsign.
+        """
+        tt = cls(start_ts, end_ts)
+        trip_rows: Dict[str, int] = {}
+        per_station: Dict[str, List[Tuple[int, int, str]]] = {}  # station -> (ts, trip row, arrival_time)
+
+        for e in events:
+            sid, ts = e.get("station_id"), e.get("ts")
+            if not sid or ts is None:
+                continue
+            key = e.get("trip_key") or e.get("trip_id") or ""
+            row = trip_rows.get(key)
+            if row is None:
+                row = trip_rows[key] = len(tt.trip_ids)
+                tt.trip_ids.append(str(e.get("trip_id") or ""))
+                tt.line_ids.append(str(e.get("line_id") or ""))
+                tt.direction_ids.append(str(e.get("direction_id") or "0"))
+                tt.headsigns.append(str(e.get("headsign") or e.get("trip_id") or "Trip"))
+            per_station.setdefault(sid, []).append((ts, row, str(e.get("arrival_time") or "")))
+
+        for sid, rows in per_station.items():
+            rows.sort(key=lambda r: (r[0], r[1]))
+            if np is not None:
+                tt.times[sid] = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+                tt.trip_idx[sid] = np.fromiter((r[1] for r in rows), dtype=np.int32, count=len(rows))
+            else:
+                tt.times[sid] = array("q", (r[0] for r in rows))
+                tt.trip_idx[sid] = array("i", (r[1] for r in rows))
+            tt.clock[sid] = [r[2] for r in rows]
+        return tt
+
+    def next_trips(self, station_id: str, ts: int, limit: int) -> List[Dict[str, Any]]:
+        """Next 'limit' stop events at station_id arriving at or after ts."""
+        times = self.times.get(station_id)
+        if times is None or limit <= 0:
+            return []
+        if np is not None:
+            i = int(np.searchsorted(times, ts, side="left"))
+        else:
+            i = bisect_left(times, ts)
+
+        out: List[Dict[str, Any]] = []
+        rows = self.trip_idx[station_id]
+        clock = self.clock[station_id]
+        for j in range(i, min(i + limit, len(times))):
+            row = int(rows[j])
+            out.append({
+                "trip_id": self.trip_ids[row] or None,
+                "trip_headsign": self.headsigns[row],
+                "line_id": self.line_ids[row],
+                "direction_id": self.direction_ids[row],
+                "arrival_time": clock[j],
+                "station_id": station_id,
+            })
+        return out
+
+
+# ----------------------------
+# Firestore loader
+# ----------------------------
+def _load_day(start: datetime, end: datetime) -> StationTimetable:
+    """
+    One collection-group scan of
+      trips_month/{YYYY-MM}/trips/{tripDoc}/stops/{stopDoc}
+    over [start, end), plus batched reads of the parent trip docs.
+    """
+    db = get_db()
+    q = (
+        db.collection_group("stops")
+        .where("arrival_timestamp", ">=", start)
+        .where("arrival_timestamp", "<", end)
+    )
+
+    stops: List[Tuple[Dict[str, Any], Any]] = []
+    parents: Dict[str, Any] = {}
+    for sd in q.stream():
+        trip_ref = sd.reference.parent.parent
+        stops.append((sd.to_dict() or {}, trip_ref))
+        if trip_ref is not None:
+            parents.setdefault(trip_ref.path, trip_ref)
+
+    trips: Dict[str, Dict[str, Any]] = {}
+    refs = list(parents.values())
+    for i in range(0, len(refs), _GET_ALL_CHUNK):
+        for snap in db.get_all(refs[i:i + _GET_ALL_CHUNK]):
+            trips[snap.reference.path] = (snap.to_dict() or {}) if snap.exists else {}
+
+    def events():
+        for stop, trip_ref in stops:
+            trip = trips.get(trip_ref.path, {}) if trip_ref is not None else {}
+            trip_id = stop.get("trip_id") or trip.get("trip_id")
+            yield {
+                "station_id": stop.get("station_id"),
+                "ts": _epoch(stop.get("arrival_timestamp")),
+                "arrival_time": stop.get("arrival_time"),
+                "trip_key": trip_ref.path if trip_ref is not None else trip_id,
+                "trip_id": trip_id,
+                "line_id": stop.get("line_id") or trip.get("line_id") or "",
+                "direction_id": stop.get("direction_id") or trip.get("direction_id") or "0",
+                "headsign": trip.get("end_station_code") or trip.get("end_station_id") or trip_id or "Trip",
+            }
+
+    return StationTimetable.build(events(), _epoch(start), _epoch(end))
+
+
+# ----------------------------
+# Cache with background refresh
+# ----------------------------
+_DAYS: Dict[int, StationTimetable] = {}  # day start epoch -> index
+_LOADING: Dict[int, threading.Thread] = {}
+_FAILED_UNTIL: Dict[int, float] = {}  # day start epoch -> monotonic retry time
+_LOCK = threading.Lock()
+
+
+def _refresh(start: datetime, end: datetime) -> None:
+    key = _epoch(start)
+    try:
+        tt = _load_day(start, end)
+    except Exception:
+        logger.exception("station timetable load failed for %s..%s", start.isoformat(), end.isoformat())
+        tt = None
+    with _LOCK:
+        _LOADING.pop(key, None)
+        if tt is None:
+            _FAILED_UNTIL[key] = time.monotonic() + STATION_TT_RETRY_SEC
+            return
+        _FAILED_UNTIL.pop(key, None)
+        _DAYS[key] = tt
+        # Keep the current and next day only
+        for old in sorted(_DAYS)[:-2]:
+            del _DAYS[old]
+
+
+def _ensure_loading(start: datetime, end: datetime) -> None:
+    key = _epoch(start)
+    with _LOCK:
+        if key in _DAYS or key in _LOADING or time.monotonic() < _FAILED_UNTIL.get(key, 0.0):
+            return
+        t = threading.Thread(target=_refresh, args=(start, end), daemon=True)
+        _LOADING[key] = t
+    t.start()
+
+
+def get_station_timetable(now: Optional[datetime] = None) -> Optional[StationTimetable]:
+    """
+    The in-memory index for now's service day, or None while it is still
+    loading (callers query Firestore directly meanwhile). Loads run in a
+    background thread; the next day's starts STATION_TT_PREFETCH_MIN
+    before midnight. A failed load is retried after STATION_TT_RETRY_SEC.
+    """
+    if not STATION_TT_ENABLED:
+        return None
+    now = now or datetime.now(timezone.utc)
+    start, end = service_day(now)
+    tt = _DAYS.get(_epoch(start))
+    if tt is None:
+        _ensure_loading(start, end)
+        return None
+
+    next_start = start + timedelta(days=1)
+    if now >= next_start - timedelta(minutes=STATION_TT_PREFETCH_MIN):
+        _ensure_loading(*service_day(next_start))
+    return tt
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.firestore import get_db
+
+logger = logging.getLogger(__name__)
+
+# Stop times loaded per refresh, and how much of that window must still
+# lie ahead of a query before the timetable is reloaded.
+TIMETABLE_HORIZON_MIN = int(os.getenv("TIMETABLE_HORIZON_MIN", "240"))
+TIMETABLE_MIN_AHEAD_MIN = int(os.getenv("TIMETABLE_MIN_AHEAD_MIN", "120"))
+# After a failed load, wait this long before trying again.
+TIMETABLE_RETRY_SEC = int(os.getenv("TIMETABLE_RETRY_SEC", "60"))
+
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def _epoch(x: Any) -> Optional[int]:
+    """Firestore Timestamp / datetime -> epoch seconds."""
+    if isinstance(x, datetime):
+        if x.tzinfo is None:
+            x = x.replace(tzinfo=timezone.utc)
+        return int(x.timestamp())
+    if isinstance(x, (int, float)):
+        return int(x)
+    return None
+
+
+def _seq(x: Any) -> Optional[int]:
+    try:
+        return int(x) if x is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+# ----------------------------
+# Timetable
+# ----------------------------
+class Timetable:
+    """
+    Stop times in RAPTOR layout. Trips with the same line, direction and
+    stop sequence form a route; a route's trips never overtake each other,
+    so every stop column is sorted by time.
+
+      route_stops[r]   array of stop indices along route r
+      route_times[r]   array of epoch seconds, row-major trips x stops
+      route_trips[r]   trip ids, same order as the rows
+      route_meta[r]    (line_id, direction_id)
+      stop_routes[p]   [(route, position of p in that route), ...]
+    """
+
+    def __init__(self, start_ts: int, end_ts: int):
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.stop_ids: List[str] = []
+        self.stop_index: Dict[str, int] = {}
+        self.route_stops: List[array] = []
+        self.route_times: List[array] = []
+        self.route_trips: List[List[str]] = []
+        self.route_meta: List[Tuple[str, str]] = []
+        self.stop_routes: List[List[Tuple[int, int]]] = []
+
+    def _stop(self, station_id: str) -> int:
+        idx = self.stop_index.get(station_id)
+        if idx is None:
+            idx = len(self.stop_ids)
+            self.stop_index[station_id] = idx
+            self.stop_ids.append(station_id)
+            self.stop_routes.append([])
+        return idx
+
+    @property
+    def trip_count(self) -> int:
+        return sum(len(t) for t in self.route_trips)
+
+    @classmethod
+    def build(cls, rows: Iterable[Dict[str, Any]], start_ts: int, end_ts: int) -> "Timetable":
+        """
+        rows: one per stop event with trip_key, station_id, ts (epoch seconds),
+        and optional seq, trip_id, line_id, direction_id.
+        """
+        trips: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            if row.get("station_id") and row.get("ts") is not None:
+                trips.setdefault(row["trip_key"], []).append(row)
+
+        # (line, direction, stop sequence) -> [(times, trip_id), ...]
+        patterns: Dict[Tuple[str, str, Tuple[str, ...]], List[Tuple[List[int], str]]] = {}
+        for key, events in trips.items():
+            events.sort(key=lambda e: (e.get("seq") is None, e.get("seq") or 0, e["ts"]))
+            stations: List[str] = []
+            times: List[int] = []
+            for e in events:
+                if stations and stations[-1] == e["station_id"]:
+                    continue
+                stations.append(e["station_id"])
+                times.append(e["ts"])
+            if len(stations) < 2:
+                continue
+            head = events[0]
+            pattern = (str(head.get("line_id") or ""), str(head.get("direction_id") or ""), tuple(stations))
+            patterns.setdefault(pattern, []).append((times, str(head.get("trip_id") or key)))
+
+        tt = cls(start_ts, end_ts)
+        for (line_id, direction_id, stations), members in patterns.items():
+            members.sort(key=lambda m: m[0])
+            # Split overtaking trips into their own routes (FIFO per route)
+            groups: List[List[Tuple[List[int], str]]] = []
+            for times, trip_id in members:
+                for g in groups:
+                    if all(a <= b for a, b in zip(g[-1][0], times)):
+                        g.append((times, trip_id))
+                        break
+                else:
+                    groups.append([(times, trip_id)])
+
+            stop_idx = [tt._stop(s) for s in stations]
+            for g in groups:
+                r = len(tt.route_stops)
+                tt.route_stops.append(array("i", stop_idx))
+                tt.route_times.append(array("q", (t for times, _ in g for t in times)))
+                tt.route_trips.append([trip_id for _, trip_id in g])
+                tt.route_meta.append((line_id, direction_id))
+                for pos, p in enumerate(stop_idx):
+                    tt.stop_routes[p].append((r, pos))
+        return tt
+
+
+# ----------------------------
+# Firestore loader (cached)
+# ----------------------------
+def _stop_rows(start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """
+    Collection Group:
+      trips_month/{YYYY-MM}/trips/{tripDoc}/stops/{stopDoc}
+    restricted to arrival_timestamp in [start, end).
+    """
+    q = (
+        get_db().collection_group("stops")
+        .where("arrival_timestamp", ">=", start)
+        .where("arrival_timestamp", "<", end)
+    )
+    rows: List[Dict[str, Any]] = []
+    for sd in q.stream():
+        stop = sd.to_dict() or {}
+        trip_ref = sd.reference.parent.parent
+        rows.append({
+            "trip_key": trip_ref.path if trip_ref else str(stop.get("trip_id") or ""),
+            "trip_id": stop.get("trip_id") or (trip_ref.id if trip_ref else None),
+            "station_id": stop.get("station_id"),
+            "ts": _epoch(stop.get("arrival_timestamp")),
+            "seq": _seq(stop.get("stop_sequence")),
+            "line_id": stop.get("line_id"),
+            "direction_id": stop.get("direction_id"),
+        })
+    return rows
+
+
+_TIMETABLE: Optional[Timetable] = None
+_LOADING: Optional[threading.Thread] = None
+_FAILED_UNTIL = 0.0
+_LOCK = threading.Lock()
+
+
+def _refresh(start: datetime, end: datetime) -> None:
+    global _TIMETABLE, _LOADING, _FAILED_UNTIL
+    try:
+        tt = Timetable.build(_stop_rows(start, end), _epoch(start), _epoch(end))
+    except Exception:
+        logger.exception("timetable load failed for %s..%s", start.isoformat(), end.isoformat())
+        tt = None
+    with _LOCK:
+        _LOADING = None
+        if tt is not None:
+            _TIMETABLE = tt
+        else:
+            _FAILED_UNTIL = time.monotonic() + TIMETABLE_RETRY_SEC
+
+
+def _ensure_loading(now: datetime) -> None:
+    global _LOADING
+    start = now.astimezone(timezone.utc).replace(second=0, microsecond=0)
+    end = start + timedelta(minutes=TIMETABLE_HORIZON_MIN)
+    with _LOCK:
+        if _LOADING is not None or time.monotonic() < _FAILED_UNTIL:
+            return
+        t = threading.Thread(target=_refresh, args=(start, end), daemon=True)
+        _LOADING = t
+    t.start()
+
+
+def get_timetable(now: Optional[datetime] = None) -> Optional[Timetable]:
+    """
+    Timetable covering at least TIMETABLE_MIN_AHEAD_MIN after 'now'.
+    When the cached window runs short it is reloaded from Firestore in a
+    background thread; meanwhile the old timetable is served while it
+    still covers 'now'. None while the first load runs or after failures
+    (callers fall back to estimates).
+    """
+    now = now or datetime.now(timezone.utc)
+    now_ts = _epoch(now)
+
+    tt = _TIMETABLE
+    if tt is not None and tt.start_ts <= now_ts and now_ts + TIMETABLE_MIN_AHEAD_MIN * 60 <= tt.end_ts:
+        return tt
+    _ensure_loading(now)
+    return tt if tt is not None and tt.start_ts <= now_ts < tt.end_ts else None
@@ -1,9 +1,24 @@
 from __future__ import annotations
 
-from typing import List, Dict, Any, Optional
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timezone
 
 from app.firestore import get_db
+from app.station_timetable import get_station_timetable
+
+# Parent trip docs rarely change within a day: keep the fields the
+# schedule needs for this long, for up to this many trips.
+TRIP_META_TTL_SEC = int(os.getenv("TRIP_META_TTL_SEC", "21600"))
+TRIP_META_CACHE_SIZE = int(os.getenv("TRIP_META_CACHE_SIZE", "4096"))
+TRIP_META_FIELDS = ("trip_id", "line_id", "direction_id", "end_station_code", "end_station_id")
+
+# Local GTFS store (python -m app.gtfs_store <feed> <dir>). When set, the
+# schedule is read from it instead of Firestore.
+GTFS_STORE_DIR = os.getenv("GTFS_STORE_DIR", "").strip()
 
 # ----------------------------
 # Helpers
@@ -47,6 +62,83 @@ def _line_color(line_id: Optional[str]) -> str:
     return LINE_COLORS.get(key, "#3B82F6")
 
 
+def _trip_item(
+    station_id: str,
+    *,
+    trip_id: Optional[str],
+    headsign: str,
+    line_id: Optional[str],
+    direction_id: Optional[str],
+    arrival_time: Optional[str],
+) -> Dict[str, Any]:
+    return {
+        "trip_id": trip_id,
+        "trip_headsign": headsign,
+        "route_short_name": _safe_str(line_id),
+        "route_color": _line_color(line_id),
+        "direction_id": _safe_str(direction_id),
+        "arrival_time": _hhmm(arrival_time),
+        "station_id": station_id,
+    }
+
+
+_gtfs_timetable = None
+_gtfs_lock = threading.Lock()
+
+
+def _gtfs_store():
+    global _gtfs_timetable
+    if not GTFS_STORE_DIR:
+        return None
+    with _gtfs_lock:
+        if _gtfs_timetable is None:
+            from app.gtfs_store import GtfsTimetable
+            _gtfs_timetable = GtfsTimetable(GTFS_STORE_DIR)
+    return _gtfs_timetable
+
+
+# ----------------------------
+# Trip metadata cache
+# ----------------------------
+_trip_meta_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_trip_meta_lock = threading.Lock()
+
+
+def _trip_meta(db, refs: List[Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Parent trip fields by ref path. Cached entries (LRU, TRIP_META_TTL_SEC)
+    are served from memory; the rest come from one get_all round trip.
+    """
+    out: Dict[str, Dict[str, Any]] = {}
+    missing: Dict[str, Any] = {}
+    now = time.monotonic()
+    with _trip_meta_lock:
+        for ref in refs:
+            hit = _trip_meta_cache.get(ref.path)
+            if hit is not None and now - hit[0] < TRIP_META_TTL_SEC:
+                _trip_meta_cache.move_to_end(ref.path)
+                out[ref.path] = hit[1]
+            else:
+                missing.setdefault(ref.path, ref)
+
+    if not missing:
+        return out
+
+    fetched: Dict[str, Dict[str, Any]] = {}
+    for snap in db.get_all(list(missing.values())):
+        trip = (snap.to_dict() or {}) if snap.exists else {}
+        fetched[snap.reference.path] = {k: trip[k] for k in TRIP_META_FIELDS if k in trip}
+    out.update(fetched)
+
+    with _trip_meta_lock:
+        for path, meta in fetched.items():
+            _trip_meta_cache[path] = (now, meta)
+            _trip_meta_cache.move_to_end(path)
+        while len(_trip_meta_cache) > TRIP_META_CACHE_SIZE:
+            _trip_meta_cache.popitem(last=False)
+    return out
+
+
 # ----------------------------
 # New API (Recommended)
 # ----------------------------
@@ -72,6 +164,39 @@ def fetch_next_trips_for_station(
         return []
 
     now = _to_utc(dt or datetime.now(timezone.utc))
+
+    store = _gtfs_store()
+    if store is not None:
+        return [
+            _trip_item(
+                station_id,
+                trip_id=t["trip_id"],
+                headsign=t["trip_headsign"],
+                line_id=t["line_id"],
+                direction_id=t["direction_id"],
+                arrival_time=t["arrival_time"],
+            )
+            for t in store.next_trips(station_id, now, max(0, int(limit)))
+        ]
+
+    # In-memory day index (binary search) once it is loaded. Short
+    # answers near the end of its window go to Firestore for the next day.
+    index = get_station_timetable(now)
+    if index is not None and index.covers(int(now.timestamp())):
+        hits = index.next_trips(station_id, int(now.timestamp()), max(0, int(limit)))
+        if len(hits) >= max(0, int(limit)):
+            return [
+                _trip_item(
+                    station_id,
+                    trip_id=t["trip_id"],
+                    headsign=t["trip_headsign"],
+                    line_id=t["line_id"],
+                    direction_id=t["direction_id"],
+                    arrival_time=t["arrival_time"],
+                )
+                for t in hits
+            ]
+
     db = get_db()
 
     q = (
@@ -84,14 +209,15 @@ def fetch_next_trips_for_station(
 
     stop_snaps = list(q.stream())
 
+    # parent trip docs:
+    # .../trips_month/{month}/trips/{tripDoc}/stops/{stopDoc}
+    trip_refs = [sd.reference.parent.parent for sd in stop_snaps]
+    trips = _trip_meta(db, [r for r in trip_refs if r is not None])
+
     results: List[Dict[str, Any]] = []
-    for sd in stop_snaps:
+    for sd, trip_ref in zip(stop_snaps, trip_refs):
         stop = sd.to_dict() or {}
-
-        # parent trip doc:
-        # .../trips_month/{month}/trips/{tripDoc}/stops/{stopDoc}
-        trip_ref = sd.reference.parent.parent
-        trip = (trip_ref.get().to_dict() or {}) if trip_ref else {}
+        trip = trips.get(trip_ref.path, {}) if trip_ref else {}
 
         line_id = stop.get("line_id") or trip.get("line_id") or ""
         direction_id = stop.get("direction_id") or trip.get("direction_id") or "0"
@@ -105,19 +231,15 @@ def fetch_next_trips_for_station(
             or "Trip"
         )
 
-        arrival_time = _hhmm(stop.get("arrival_time"))
-        route_color = _line_color(line_id)
-
         results.append(
-            {
-                "trip_id": stop.get("trip_id") or trip.get("trip_id"),
-                "trip_headsign": trip_headsign,
-                "route_short_name": _safe_str(line_id),
-                "route_color": route_color,
-                "direction_id": _safe_str(direction_id),
-                "arrival_time": arrival_time,
-                "station_id": station_id,
-            }
+            _trip_item(
+                station_id,
+                trip_id=stop.get("trip_id") or trip.get("trip_id"),
+                headsign=trip_headsign,
+                line_id=line_id,
+                direction_id=direction_id,
+                arrival_time=stop.get("arrival_time"),
+            )
         )
 
     return results
@@ -0,0 +1,258 @@
+# backtest.py
+# Offline batch backtest of the 30-min model over materialized features
+
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from typing import Dict, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from features import (
+    FEATURES,
+    FEATURES_DIR,
+    GLOBAL_EVENT_MAP,
+    HORIZON_MINUTES,
+    MINUTES_PER_DAY,
+    TARGET,
+    feature_days,
+    partition_path,
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(
+    BASE_DIR,
+    "..",
+    "masar_forecasting",
+    "models",
+    "masar_xgb_30min_model.pkl",
+)
+
+LEVELS = ["Low", "Medium", "High", "Extreme"]
+
+# Same utilization cut-offs as sim_core.classify_from_cap.
+LEVEL_CUTS = [0.30, 0.60, 1.00]
+
+EVENT_NAMES = {v: k for k, v in GLOBAL_EVENT_MAP.items()}
+
+PREDICT_BATCH_ROWS = int(os.environ.get("MASAR_BACKTEST_BATCH", "65536"))
+
+GROUPINGS = {
+    "station": "station_code",
+    "hour": "hour",
+    "event_type": "event_name",
+}
+
+
+def crowd_level_codes(totals: np.ndarray, capacity: np.ndarray) -> np.ndarray:
+    """Vectorized classify_from_cap -> level codes (0=Low .. 3=Extreme)."""
+    ratio = np.divide(totals, capacity, out=np.zeros_like(totals, dtype=np.float64), where=capacity > 0)
+    codes = np.digitize(ratio, LEVEL_CUTS)
+    return np.where(capacity > 0, codes, 1)  # no capacity -> "Medium"
+
+
+# ------------------------------------------------------------
+# Partial results (mergeable across days / processes)
+# ------------------------------------------------------------
+
+
+def _empty_cell() -> Dict:
+    return {"rows": 0, "abs_err": 0.0, "ape": 0.0, "ape_rows": 0, "confusion": np.zeros((4, 4), dtype=np.int64)}
+
+
+def _partial(df: pd.DataFrame) -> Dict:
+    """Sums per grouping value (and overall) for one scored frame."""
+    out = {"overall": {"all": _cell(df)}}
+    for name, col in GROUPINGS.items():
+        out[name] = {str(k): _cell(g) for k, g in df.groupby(col, sort=False)}
+    return out
+
+
+def _cell(df: pd.DataFrame) -> Dict:
+    y = df[TARGET].to_numpy()
+    err = np.abs(df["pred"].to_numpy() - y)
+    nz = y > 0
+    confusion = np.zeros((4, 4), dtype=np.int64)
+    np.add.at(confusion, (df["level_true"].to_numpy(), df["level_pred"].to_numpy()), 1)
+    return {
+        "rows": len(df),
+        "abs_err": float(err.sum()),
+        "ape": float((err[nz] / y[nz]).sum()),
+        "ape_rows": int(nz.sum()),
+        "confusion": confusion,
+    }
+
+
+def _merge(into: Dict, part: Dict) -> None:
+    for grouping, cells in part.items():
+        target = into.setdefault(grouping, {})
+        for key, cell in cells.items():
+            acc = target.setdefault(key, _empty_cell())
+            for field in ("rows", "abs_err", "ape", "ape_rows"):
+                acc[field] += cell[field]
+            acc["confusion"] += cell["confusion"]
+
+
+def _summary(cell: Dict) -> Dict:
+    cm = cell["confusion"]
+    rows = cell["rows"]
+    return {
+        "rows": rows,
+        "mae": round(cell["abs_err"] / rows, 2) if rows else None,
+        "mape": round(100 * cell["ape"] / cell["ape_rows"], 2) if cell["ape_rows"] else None,
+        "level_accuracy": round(float(np.trace(cm)) / rows, 4) if rows else None,
+        # rows = actual level, columns = predicted level (LEVELS order)
+        "confusion": cm.tolist(),
+    }
+
+
+# ------------------------------------------------------------
+# Worker
+# ------------------------------------------------------------
+
+_model = None
+_capacity: Dict[str, float] = {}
+
+
+def _init_worker(model_path: str, capacity: Dict[str, float]) -> None:
+    global _model, _capacity
+    _model = joblib.load(model_path)
+    # One thread per process: parallelism comes from the pool.
+    try:
+        _model.set_params(n_jobs=1)
+    except Exception:
+        pass
+    _capacity = capacity
+
+
+def score_day(path: str, batch_rows: int = PREDICT_BATCH_ROWS) -> Dict:
+    """Predict one materialized day in batches and return mergeable sums."""
+    t0 = time.perf_counter()
+    df = pd.read_parquet(path, memory_map=True)
+
+    # Targets past midnight are the next day's pre-service zeros,
+    # not simulator output, so they are left out of the scores.
+    df = df[df["minute_of_day"] + HORIZON_MINUTES < MINUTES_PER_DAY].reset_index(drop=True)
+
+    X = df[FEATURES].to_numpy(dtype=np.float32)
+    t_pred = time.perf_counter()
+    preds = [
+        _model.predict(pd.DataFrame(X[i:i + batch_rows], columns=FEATURES))
+        for i in range(0, len(X), batch_rows)
+    ]
+    predict_seconds = time.perf_counter() - t_pred
+    df["pred"] = np.clip(np.concatenate(preds) if preds else np.zeros(0), 0, None)
+
+    capacity = df["station_code"].map(_capacity).fillna(0.0).to_numpy()
+    df["level_pred"] = crowd_level_codes(df["pred"].to_numpy(), capacity)
+    df["level_true"] = crowd_level_codes(df[TARGET].to_numpy(), capacity)
+    df["event_name"] = df["special_event_type"].map(EVENT_NAMES).fillna("Unknown")
+
+    return {
+        "rows": len(df),
+        "seconds": time.perf_counter() - t0,
+        "predict_seconds": predict_seconds,
+        "partial": _partial(df),
+    }
+
+
+# ------------------------------------------------------------
+# Driver
+# ------------------------------------------------------------
+
+
+def run_backtest(
+    features_dir: str = FEATURES_DIR,
+    model_path: str = MODEL_PATH,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    workers: Optional[int] = None,
+    batch_rows: int = PREDICT_BATCH_ROWS,
+) -> Dict:
+    """
+    Score every materialized day in [start, end] on a process pool
+    (one day per task) and merge the per-day sums into a report.
+    """
+    from sim_core import get_capacity, station_ids
+
+    days = [
+        d for d in feature_days(features_dir)
+        if (start is None or d >= start) and (end is None or d <= end)
+    ]
+    if not days:
+        return {"error": f"no materialized features under {features_dir} (run features.py first)"}
+
+    capacity = {code: get_capacity(code) for code in station_ids}
+    workers = workers or os.cpu_count() or 1
+
+    t0 = time.perf_counter()
+    totals: Dict = {}
+    rows = 0
+    predict_seconds = 0.0
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(days)),
+        initializer=_init_worker,
+        initargs=(model_path, capacity),
+    ) as pool:
+        futures = [pool.submit(score_day, partition_path(features_dir, d), batch_rows) for d in days]
+        for f in as_completed(futures):
+            res = f.result()
+            rows += res["rows"]
+            predict_seconds += res["predict_seconds"]
+            _merge(totals, res["partial"])
+
+    seconds = time.perf_counter() - t0
+    report = {
+        "days": len(days),
+        "first_day": days[0].isoformat(),
+        "last_day": days[-1].isoformat(),
+        "levels": LEVELS,
+        "overall": _summary(totals["overall"]["all"]),
+    }
+    for name in GROUPINGS:
+        cells = totals.get(name, {})
+        keys = sorted(cells, key=lambda k: (len(k), k) if name != "hour" else int(k))
+        report[f"by_{name}"] = {k: _summary(cells[k]) for k in keys}
+
+    report["throughput"] = {
+        "workers": min(workers, len(days)),
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+        # Model time only, summed over workers
+        "predict_rows_per_sec_per_worker": round(rows / predict_seconds, 1) if predict_seconds > 0 else None,
+    }
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Backtest the 30-min model over materialized features")
+    parser.add_argument("--features", default=FEATURES_DIR)
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--start", type=date.fromisoformat, default=None)
+    parser.add_argument("--end", type=date.fromisoformat, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch", type=int, default=PREDICT_BATCH_ROWS)
+    parser.add_argument("--out", default=None, help="also write the JSON report here")
+    args = parser.parse_args()
+
+    report = run_backtest(
+        args.features,
+        args.model,
+        start=args.start,
+        end=args.end,
+        workers=args.workers,
+        batch_rows=args.batch,
+    )
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
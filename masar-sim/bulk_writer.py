@@ -0,0 +1,208 @@
+# bulk_writer.py
+# Parallel batched Firestore writes for live ticks and backfills
+
+import os
+import time
+import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Tuple
+
+from google.api_core import exceptions as gexc
+
+from metrics import span
+
+# ------------------------------------------------------------
+# Limits & tuning
+# ------------------------------------------------------------
+
+# Firestore rejects a write batch with more than 500 operations
+# or a request payload above 10 MiB. We stay below both.
+FIRESTORE_MAX_BATCH_OPS = 500
+FIRESTORE_MAX_BATCH_BYTES = 9 * 1024 * 1024
+
+BULK_BATCH_SIZE = int(os.environ.get("MASAR_BULK_BATCH_SIZE", "400"))
+BULK_MAX_WORKERS = int(os.environ.get("MASAR_BULK_WORKERS", "8"))
+BULK_MAX_RETRIES = int(os.environ.get("MASAR_BULK_RETRIES", "5"))
+
+# Errors raised by contention / transient overload.
+# A batch of set() calls is idempotent, so retrying is safe.
+RETRYABLE_ERRORS = (
+    gexc.Aborted,
+    gexc.DeadlineExceeded,
+    gexc.ServiceUnavailable,
+    gexc.ResourceExhausted,
+    gexc.InternalServerError,
+)
+
+
+# ------------------------------------------------------------
+# Helpers
+# ------------------------------------------------------------
+
+def _approx_doc_bytes(data: Dict[str, Any]) -> int:
+    """
+    Rough size estimate of a document payload.
+    Only used to keep batches well under the request size limit.
+    """
+    return len(repr(data)) + 64
+
+
+def chunk_writes(
+    writes: Iterable[Tuple[Any, Dict[str, Any]]],
+    batch_size: int = BULK_BATCH_SIZE,
+    max_bytes: int = FIRESTORE_MAX_BATCH_BYTES,
+) -> List[List[Tuple[Any, Dict[str, Any]]]]:
+    """
+    Split (doc_ref, data) pairs into batches that respect
+    Firestore's per-batch operation and payload limits.
+    """
+    batch_size = max(1, min(int(batch_size), FIRESTORE_MAX_BATCH_OPS))
+
+    chunks = []
+    current = []
+    current_bytes = 0
+
+    for ref, data in writes:
+        size = _approx_doc_bytes(data)
+        if current and (
+            len(current) >= batch_size or current_bytes + size > max_bytes
+        ):
+            chunks.append(current)
+            current = []
+            current_bytes = 0
+
+        current.append((ref, data))
+        current_bytes += size
+
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+def _commit_with_retry(db, chunk, max_retries: int) -> int:
+    """
+    Commit one batch, retrying with exponential backoff + jitter
+    on contention errors. Returns the number of retries used.
+    """
+    attempt = 0
+    while True:
+        batch = db.batch()
+        for ref, data in chunk:
+            batch.set(ref, data)
+
+        try:
+            with span("firestore_commit"):
+                batch.commit()
+            return attempt
+        except RETRYABLE_ERRORS:
+            if attempt >= max_retries:
+                raise
+            delay = min(8.0, 0.1 * (2 ** attempt))
+            time.sleep(delay + random.uniform(0, delay / 2))
+            attempt += 1
+
+
+# ------------------------------------------------------------
+# Public API
+# ------------------------------------------------------------
+
+def bulk_write(
+    db,
+    writes: Iterable[Tuple[Any, Dict[str, Any]]],
+    batch_size: int = BULK_BATCH_SIZE,
+    max_workers: int = BULK_MAX_WORKERS,
+    max_retries: int = BULK_MAX_RETRIES,
+) -> Dict[str, Any]:
+    """
+    Write (doc_ref, data) pairs to Firestore using concurrent batch commits.
+
+    'db' only needs a batch() method returning an object with
+    set(ref, data) and commit(), so the same code runs against the
+    real client, the Firestore emulator (FIRESTORE_EMULATOR_HOST)
+    or an in-memory fake in tests.
+
+    Returns write statistics including docs/sec throughput.
+    """
+    t0 = time.perf_counter()
+    chunks = chunk_writes(writes, batch_size=batch_size)
+    written = sum(len(c) for c in chunks)
+
+    retries = 0
+    if len(chunks) == 1 or max_workers <= 1:
+        # No point paying for a pool on a single batch (e.g. one live tick)
+        for chunk in chunks:
+            retries += _commit_with_retry(db, chunk, max_retries)
+    elif chunks:
+        workers = min(max_workers, len(chunks))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_commit_with_retry, db, chunk, max_retries)
+                for chunk in chunks
+            ]
+            for f in futures:
+                retries += f.result()
+
+    seconds = time.perf_counter() - t0
+    return {
+        "written": written,
+        "batches": len(chunks),
+        "retries": retries,
+        "seconds": round(seconds, 4),
+        "docs_per_sec": round(written / seconds, 1) if seconds > 0 else float(written),
+    }
+
+
+async def _commit_with_retry_async(db, chunk, max_retries: int) -> int:
+    """Async twin of _commit_with_retry for the AsyncClient."""
+    attempt = 0
+    while True:
+        batch = db.batch()
+        for ref, data in chunk:
+            batch.set(ref, data)
+
+        try:
+            with span("firestore_commit"):
+                await batch.commit()
+            return attempt
+        except RETRYABLE_ERRORS:
+            if attempt >= max_retries:
+                raise
+            delay = min(8.0, 0.1 * (2 ** attempt))
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            attempt += 1
+
+
+async def bulk_write_async(
+    db,
+    writes: Iterable[Tuple[Any, Dict[str, Any]]],
+    batch_size: int = BULK_BATCH_SIZE,
+    max_workers: int = BULK_MAX_WORKERS,
+    max_retries: int = BULK_MAX_RETRIES,
+) -> Dict[str, Any]:
+    """
+    Same as bulk_write but for the async Firestore client:
+    up to max_workers batch commits are in flight at once
+    on the event loop instead of in a thread pool.
+    """
+    t0 = time.perf_counter()
+    chunks = chunk_writes(writes, batch_size=batch_size)
+    written = sum(len(c) for c in chunks)
+
+    sem = asyncio.Semaphore(max(1, max_workers))
+
+    async def commit(chunk):
+        async with sem:
+            return await _commit_with_retry_async(db, chunk, max_retries)
+
+    retries = sum(await asyncio.gather(*(commit(c) for c in chunks)))
+
+    seconds = time.perf_counter() - t0
+    return {
+        "written": written,
+        "batches": len(chunks),
+        "retries": retries,
+        "seconds": round(seconds, 4),
+        "docs_per_sec": round(written / seconds, 1) if seconds > 0 else float(written),
+    }
@@ -0,0 +1,310 @@
+# features.py
+# Vectorized FEATURES matrix for the 30-min forecaster (training / backtests)
+
+import os
+import json
+import time
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from history_store import HistoryStore
+
+# ------------------------------------------------------------
+# Model contract
+# ------------------------------------------------------------
+
+# Column order the XGBoost model was trained with (see
+# masar_forecasting/notebooks/Masar_CrowdForecast_AllModels.ipynb).
+FEATURES = [
+    "hour",
+    "minute_of_day",
+    "day_of_week",
+    "is_weekend",
+    "station_id",
+    "headway_seconds",
+    "event_flag",
+    "holiday_flag",
+    "special_event_type",
+    "lag_5",
+    "lag_15",
+    "lag_30",
+    "lag_60",
+    "lag_120",
+    "roll_mean_15",
+    "roll_std_15",
+    "roll_mean_60",
+]
+
+TARGET = "target_30m"
+HORIZON_MINUTES = 30
+
+LAGS = [5, 15, 30, 60, 120]
+ROLL_MEANS = [15, 60]
+ROLL_STDS = [15]
+
+GLOBAL_EVENT_MAP = {
+    "None": 0,
+    "Festival": 1,
+    "Sports": 2,
+    "NationalHoliday": 3,
+    "Holiday": 4,
+    "Conference": 5,
+    "Exhibition": 6,
+    "Concert": 7,
+    "Expo": 8,
+    "AirportSurge": 9,
+}
+
+# Same defaults features_from_history() uses for live rows.
+LIVE_DEFAULTS = {
+    "headway_seconds": 300.0,
+    "event_flag": 0,
+    "holiday_flag": 0,
+    "special_event_type": 0,
+}
+
+# The simulator (and live snapshots) report 0 before 06:00.
+SERVICE_START_MINUTE = 6 * 60
+MINUTES_PER_DAY = 24 * 60
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FEATURES_DIR = os.environ.get(
+    "MASAR_FEATURES_DIR",
+    os.path.join(BASE_DIR, "data", "features"),
+)
+
+
+def station_code_to_numeric(station_code: str) -> int:
+    """
+    Convert 'S1' -> 1, 'S10' -> 10, etc.
+    If the code is already numeric, we parse it directly.
+    """
+    s = station_code.strip()
+    if s.upper().startswith("S"):
+        s = s[1:]
+    try:
+        return int(s)
+    except ValueError:
+        # Fallback: 0 if parsing fails
+        return 0
+
+
+# ------------------------------------------------------------
+# Vectorized builder
+# ------------------------------------------------------------
+
+
+def _window_sum(cum: np.ndarray, window: int) -> np.ndarray:
+    """Sum over [m - window, m] (clipped at 0) from a cumulative sum."""
+    out = cum.copy()
+    out[window + 1:] -= cum[: -(window + 1)]
+    return out
+
+
+def station_day_features(
+    frame: pd.DataFrame,
+    day: date,
+    station_code: str,
+    live_defaults: bool = False,
+) -> pd.DataFrame:
+    """
+    Feature rows for one station-day, one per minute from 06:00.
+
+    Mirrors the live builder in server.py on a per-minute history:
+    the day is laid out on all 1440 minutes with 0 before 06:00, then
+    - lag_k        = total at m - k (last earlier minute if missing)
+    - roll_mean_w  = mean of the minutes present in [m - w, m]
+    - roll_std_w   = population std (ddof=0) of the same, 0 if < 2 points
+    computed with shifts and cumulative sums instead of per-row scans.
+
+    Event / headway columns come from the simulator output unless
+    live_defaults=True, which reproduces the live endpoint's constants.
+    target_30m is the total 30 minutes later (0 past midnight, which
+    is before service start on the next day).
+    """
+    day_start = pd.Timestamp(day)
+    minute = ((frame["timestamp"] - day_start) // pd.Timedelta(minutes=1)).to_numpy()
+    keep = (minute >= 0) & (minute < MINUTES_PER_DAY)
+    minute = minute[keep]
+
+    totals = np.zeros(MINUTES_PER_DAY, dtype=np.float64)
+    present = np.zeros(MINUTES_PER_DAY, dtype=bool)
+    totals[minute] = frame["station_total"].to_numpy(dtype=np.float64)[keep]
+    present[minute] = True
+    totals[:SERVICE_START_MINUTE] = 0.0
+    present[:SERVICE_START_MINUTE] = True
+
+    # Last present value at or before each minute (pick_lag semantics)
+    idx = np.where(present, np.arange(MINUTES_PER_DAY), 0)
+    np.maximum.accumulate(idx, out=idx)
+    filled = totals[idx]
+
+    minutes = np.arange(SERVICE_START_MINUTE, MINUTES_PER_DAY)
+    out = {
+        "hour": minutes // 60,
+        "minute_of_day": minutes,
+    }
+    dow = day.weekday()
+    out["day_of_week"] = np.full(len(minutes), dow)
+    # Saudi weekend: Friday (4) and Saturday (5)
+    out["is_weekend"] = np.full(len(minutes), 1 if dow in (4, 5) else 0)
+    out["station_id"] = np.full(len(minutes), station_code_to_numeric(station_code))
+
+    if live_defaults:
+        for col, value in LIVE_DEFAULTS.items():
+            out[col] = np.full(len(minutes), value)
+    else:
+        ops = frame.loc[keep, ["headway_seconds", "event_flag", "holiday_flag", "special_event_type"]]
+        ops = ops.set_axis(minute).reindex(minutes).ffill().bfill()
+        out["headway_seconds"] = ops["headway_seconds"].to_numpy(dtype=np.float64)
+        out["event_flag"] = ops["event_flag"].fillna(0).to_numpy(dtype=np.int64)
+        out["holiday_flag"] = ops["holiday_flag"].fillna(0).to_numpy(dtype=np.int64)
+        out["special_event_type"] = (
+            ops["special_event_type"].fillna("None").map(GLOBAL_EVENT_MAP).fillna(0).to_numpy(dtype=np.int64)
+        )
+
+    for k in LAGS:
+        out[f"lag_{k}"] = filled[minutes - k]
+
+    # Station totals are whole passenger counts, so the running sums are
+    # kept in int64: exact, with no cancellation in E[x^2] - E[x]^2.
+    counts = np.rint(totals).astype(np.int64) * present
+    cum_n = np.cumsum(present, dtype=np.int64)
+    cum_x = np.cumsum(counts)
+    cum_x2 = np.cumsum(counts * counts)
+
+    for w in sorted(set(ROLL_MEANS) | set(ROLL_STDS)):
+        n = _window_sum(cum_n, w)[minutes]
+        s = _window_sum(cum_x, w)[minutes]
+        safe_n = np.maximum(n, 1)
+        if w in ROLL_MEANS:
+            out[f"roll_mean_{w}"] = np.where(n > 0, s / safe_n, 0.0)
+        if w in ROLL_STDS:
+            s2 = _window_sum(cum_x2, w)[minutes]
+            var = (n * s2 - s * s) / (safe_n * safe_n)
+            out[f"roll_std_{w}"] = np.where(n >= 2, np.sqrt(np.clip(var, 0, None)), 0.0)
+
+    ahead = minutes + HORIZON_MINUTES
+    target = np.zeros(len(minutes))
+    inside = ahead < MINUTES_PER_DAY
+    target[inside] = filled[ahead[inside]]
+
+    df = pd.DataFrame(out)[FEATURES]
+    df.insert(0, "timestamp", day_start + pd.to_timedelta(minutes, unit="min"))
+    df.insert(1, "station_code", station_code)
+    df["current_total"] = filled[minutes]
+    df[TARGET] = target
+    return df
+
+
+def day_features(
+    history: HistoryStore,
+    day: date,
+    stations: Optional[List[str]] = None,
+    live_defaults: bool = False,
+) -> pd.DataFrame:
+    """Feature rows for every station of one generated day."""
+    frames = history.day_frames(day, stations)
+    parts = [
+        station_day_features(frame, day, code, live_defaults=live_defaults)
+        for code, frame in sorted(frames.items())
+    ]
+    if not parts:
+        return pd.DataFrame(columns=["timestamp", "station_code"] + FEATURES + ["current_total", TARGET])
+    return pd.concat(parts, ignore_index=True)
+
+
+# ------------------------------------------------------------
+# Partitioned Parquet
+# ------------------------------------------------------------
+
+
+def partition_path(root: str, day: date) -> str:
+    return os.path.join(root, f"date={day.isoformat()}", "features.parquet")
+
+
+def materialize(
+    history: HistoryStore,
+    out_dir: str = FEATURES_DIR,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    force: bool = False,
+) -> Dict:
+    """
+    Write one date=YYYY-MM-DD partition per generated day.
+    Days whose partition is newer than their source are skipped
+    unless force=True.
+    """
+    t0 = time.perf_counter()
+    written, skipped, rows = [], [], 0
+
+    for day in history.available_days():
+        if (start and day < start) or (end and day > end):
+            continue
+        path = partition_path(out_dir, day)
+        version = history.day_version(day)
+        if not force and os.path.exists(path) and version is not None and os.stat(path).st_mtime >= version:
+            skipped.append(day.isoformat())
+            continue
+
+        df = day_features(history, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp, index=False, compression="zstd")
+        os.replace(tmp, path)
+        written.append(day.isoformat())
+        rows += len(df)
+
+    seconds = time.perf_counter() - t0
+    return {
+        "written": written,
+        "skipped": len(skipped),
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else float(rows),
+    }
+
+
+def feature_days(out_dir: str = FEATURES_DIR) -> List[date]:
+    days = []
+    if not os.path.isdir(out_dir):
+        return days
+    for name in os.listdir(out_dir):
+        if name.startswith("date=") and os.path.exists(os.path.join(out_dir, name, "features.parquet")):
+            try:
+                days.append(date.fromisoformat(name[len("date="):]))
+            except ValueError:
+                continue
+    return sorted(days)
+
+
+def iter_feature_days(
+    out_dir: str = FEATURES_DIR,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    columns: Optional[List[str]] = None,
+) -> Iterator[Tuple[date, pd.DataFrame]]:
+    """Yield (day, frame) per materialized partition, oldest first."""
+    for day in feature_days(out_dir):
+        if (start and day < start) or (end and day > end):
+            continue
+        yield day, pd.read_parquet(partition_path(out_dir, day), columns=columns, memory_map=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Materialize FEATURES from generated days")
+    parser.add_argument("--source", default=None, help="generated data dir (default: history_store.GENERATED_DIR)")
+    parser.add_argument("--out", default=FEATURES_DIR)
+    parser.add_argument("--start", type=date.fromisoformat, default=None)
+    parser.add_argument("--end", type=date.fromisoformat, default=None)
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+
+    history = HistoryStore(args.source) if args.source else HistoryStore()
+    stats = materialize(history, args.out, start=args.start, end=args.end, force=args.force)
+    print(json.dumps(stats, indent=2))
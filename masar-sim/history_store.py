@@ -0,0 +1,366 @@
+# history_store.py
+# Indexed reader over generated simulator days (Parquet, cf_day CSV fallback)
+
+import os
+import glob
+import json
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # CSV-only mode
+    pa = None
+    pq = None
+
+# ------------------------------------------------------------
+# Layout
+# ------------------------------------------------------------
+
+# The day / week / month notebooks all write one cf_day_YYYY-MM-DD.csv
+# per simulated day. Each day is indexed once into
+# parquet/cf_day_YYYY-MM-DD.parquet with one row group per station
+# (sorted by station, then minute), so a station query only touches
+# that station's row group and only the requested columns.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GENERATED_DIR = os.environ.get(
+    "MASAR_HISTORY_DIR",
+    os.path.join(BASE_DIR, "data", "generated"),
+)
+PARQUET_SUBDIR = "parquet"
+
+# Days kept decoded in memory (a month of dashboards + some slack).
+HISTORY_CACHE_DAYS = int(os.environ.get("MASAR_HISTORY_CACHE_DAYS", "45"))
+
+HISTORY_COLUMNS = [
+    "timestamp",
+    "station_id",
+    "station_total",
+    "crowd_level",
+    "special_event_type",
+    "event_flag",
+    "holiday_flag",
+    "headway_seconds",
+]
+
+_DTYPES = {
+    "station_id": "string",
+    "station_total": "int32",
+    "crowd_level": "string",
+    "special_event_type": "string",
+    "event_flag": "int8",
+    "holiday_flag": "int8",
+    "headway_seconds": "int32",
+}
+
+
+def day_csv_path(root: str, day: date) -> str:
+    return os.path.join(root, f"cf_day_{day.isoformat()}.csv")
+
+
+def day_parquet_path(root: str, day: date) -> str:
+    return os.path.join(root, PARQUET_SUBDIR, f"cf_day_{day.isoformat()}.parquet")
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def read_day_csv(path: str) -> pd.DataFrame:
+    """One cf_day CSV -> typed frame with HISTORY_COLUMNS only."""
+    df = pd.read_csv(
+        path,
+        encoding="utf-8-sig",
+        usecols=HISTORY_COLUMNS,
+        parse_dates=["timestamp"],
+    )
+    df["special_event_type"] = df["special_event_type"].fillna("None")
+    return df.astype(_DTYPES)[HISTORY_COLUMNS]
+
+
+def build_day_parquet(csv_path: str, parquet_path: str) -> int:
+    """
+    Index one cf_day CSV into Parquet: sorted by (station, minute) and
+    written one row group per station, so the station_id min/max stats
+    of every row group identify exactly one station.
+    Returns the number of rows written.
+    """
+    df = read_day_csv(csv_path).sort_values(["station_id", "timestamp"], kind="stable")
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+
+    out_dir = os.path.dirname(parquet_path)
+    os.makedirs(out_dir, exist_ok=True)
+    # Unique per writer, so concurrent builds never share a temp file
+    fd, tmp = tempfile.mkstemp(dir=out_dir, prefix=os.path.basename(parquet_path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+            for _, group in df.groupby("station_id", sort=True):
+                writer.write_table(pa.Table.from_pandas(group, schema=schema, preserve_index=False))
+        os.replace(tmp, parquet_path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return len(df)
+
+
+def station_row_groups(pf, stations: Optional[Iterable[str]]) -> List[int]:
+    """Row groups whose station_id statistics can contain one of 'stations'."""
+    n = pf.metadata.num_row_groups
+    if stations is None:
+        return list(range(n))
+
+    wanted = set(stations)
+    col = pf.schema_arrow.get_field_index("station_id")
+    groups = []
+    for i in range(n):
+        stats = pf.metadata.row_group(i).column(col).statistics
+        if stats is None or not stats.has_min_max:
+            groups.append(i)
+        elif any(stats.min <= sid <= stats.max for sid in wanted):
+            groups.append(i)
+    return groups
+
+
+# ------------------------------------------------------------
+# Reader
+# ------------------------------------------------------------
+
+
+class HistoryStore:
+    """
+    Time x station reads over generated days.
+
+    Cold days are read from their Parquet index (memory-mapped, pruned to
+    the requested stations' row groups); days without an index yet are
+    indexed from their cf_day CSV on first use, or read from the CSV
+    directly when pyarrow is missing or the directory is read-only.
+    Decoded per-station frames are kept in an LRU of hot days and
+    dropped when the day's source file changes.
+    """
+
+    def __init__(self, root: str = GENERATED_DIR, cache_days: int = HISTORY_CACHE_DAYS):
+        self.root = root
+        self.cache_days = max(1, int(cache_days))
+        # day -> {"mtime": source mtime, "complete": bool, "stations": {sid: frame}}
+        self._cache: "OrderedDict[date, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        # day -> lock held while that day's CSV is indexed
+        self._build_locks: Dict[date, threading.Lock] = {}
+        self.stats = {"hits": 0, "misses": 0, "indexed": 0}
+
+    # ---------- discovery ----------
+
+    def available_days(self) -> List[date]:
+        days = set()
+        patterns = [
+            os.path.join(self.root, "cf_day_*.csv"),
+            os.path.join(self.root, PARQUET_SUBDIR, "cf_day_*.parquet"),
+        ]
+        for pattern in patterns:
+            for path in glob.glob(pattern):
+                stem = os.path.basename(path).split(".")[0]
+                try:
+                    days.add(date.fromisoformat(stem[len("cf_day_"):]))
+                except ValueError:
+                    continue
+        return sorted(days)
+
+    def day_version(self, day: date) -> Optional[float]:
+        """
+        Modification time of a day's generated data (the CSV when present),
+        used by derived datasets to notice regenerated days.
+        """
+        csv_mtime = _mtime(day_csv_path(self.root, day))
+        return csv_mtime if csv_mtime is not None else _mtime(day_parquet_path(self.root, day))
+
+    def _build_lock(self, day: date) -> threading.Lock:
+        with self._lock:
+            return self._build_locks.setdefault(day, threading.Lock())
+
+    def _source(self, day: date):
+        """
+        (kind, path, mtime) of the freshest readable source for a day,
+        indexing the CSV into Parquet when needed (one thread per day;
+        the others wait and read its result). None if no data.
+        """
+        csv_path = day_csv_path(self.root, day)
+        pq_path = day_parquet_path(self.root, day)
+        csv_mtime = _mtime(csv_path)
+        pq_mtime = _mtime(pq_path)
+
+        if pq is not None:
+            if pq_mtime is not None and (csv_mtime is None or pq_mtime >= csv_mtime):
+                return "parquet", pq_path, pq_mtime
+            if csv_mtime is not None:
+                with self._build_lock(day):
+                    # Another thread may have indexed the day while this one waited
+                    pq_mtime = _mtime(pq_path)
+                    if pq_mtime is None or pq_mtime < csv_mtime:
+                        try:
+                            build_day_parquet(csv_path, pq_path)
+                        except OSError:
+                            pq_mtime = None
+                        else:
+                            with self._lock:
+                                self.stats["indexed"] += 1
+                            pq_mtime = _mtime(pq_path)
+                if pq_mtime is not None:
+                    return "parquet", pq_path, pq_mtime
+
+        if csv_mtime is not None:
+            return "csv", csv_path, csv_mtime
+        return None
+
+    # ---------- cache ----------
+
+    def _load(self, kind: str, path: str, stations: Optional[List[str]]) -> Dict[str, pd.DataFrame]:
+        if kind == "parquet":
+            pf = pq.ParquetFile(path, memory_map=True)
+            groups = station_row_groups(pf, stations)
+            df = pf.read_row_groups(groups, columns=HISTORY_COLUMNS).to_pandas()
+        else:
+            df = read_day_csv(path)
+
+        if stations is not None:
+            df = df[df["station_id"].isin(stations)]
+        return {
+            sid: g.sort_values("timestamp").reset_index(drop=True)
+            for sid, g in df.groupby("station_id", sort=True)
+        }
+
+    def day_frames(self, day: date, stations: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+        """
+        {station_id: frame} for one day (all stations when 'stations' is
+        None). Only stations not already cached for that day are read.
+        """
+        src = self._source(day)
+        if src is None:
+            return {}
+        kind, path, mtime = src
+
+        with self._lock:
+            entry = self._cache.get(day)
+            if entry is None or entry["mtime"] != mtime:
+                entry = {"mtime": mtime, "complete": False, "stations": {}}
+                self._cache[day] = entry
+            self._cache.move_to_end(day)
+
+            todo = None if stations is None else [s for s in stations if s not in entry["stations"]]
+            need = not entry["complete"] and (todo is None or bool(todo))
+            self.stats["misses" if need else "hits"] += 1
+
+        if need:
+            loaded = self._load(kind, path, todo)
+            with self._lock:
+                entry["stations"].update(loaded)
+                if todo is None:
+                    entry["complete"] = True
+                while len(self._cache) > self.cache_days:
+                    self._cache.popitem(last=False)
+
+        cached = entry["stations"]
+        if stations is None:
+            return dict(cached)
+        return {s: cached[s] for s in stations if s in cached}
+
+    def cache_info(self) -> Dict:
+        with self._lock:
+            days = [d.isoformat() for d in self._cache]
+            stats = dict(self.stats)
+        return {"days": days, "capacity": self.cache_days, **stats}
+
+    # ---------- queries ----------
+
+    def window(
+        self,
+        start: datetime,
+        end: datetime,
+        stations: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        All rows with start <= timestamp <= end (naive Riyadh time),
+        sorted by timestamp then station.
+        """
+        parts = []
+        day = start.date()
+        while day <= end.date():
+            for frame in self.day_frames(day, stations).values():
+                ts = frame["timestamp"]
+                lo = ts.searchsorted(pd.Timestamp(start), side="left")
+                hi = ts.searchsorted(pd.Timestamp(end), side="right")
+                if hi > lo:
+                    parts.append(frame.iloc[lo:hi])
+            day += timedelta(days=1)
+
+        if not parts:
+            return pd.DataFrame(columns=HISTORY_COLUMNS)
+        out = pd.concat(parts, ignore_index=True)
+        return out.sort_values(["timestamp", "station_id"], kind="stable").reset_index(drop=True)
+
+    def at(self, ts: datetime, stations: Optional[List[str]] = None) -> pd.DataFrame:
+        """Network state at one minute (rows for every station that has it)."""
+        minute = ts.replace(second=0, microsecond=0)
+        return self.window(minute, minute, stations)
+
+
+def benchmark_history(store: HistoryStore, days: int = 30, reads: int = 5) -> Dict:
+    """Cold vs warm timing of a multi-day window over the newest available days."""
+    available = store.available_days()
+    if not available:
+        return {"error": f"no cf_day data under {store.root}"}
+
+    last = available[-1]
+    start = datetime.combine(last - timedelta(days=days - 1), datetime.min.time())
+    end = datetime.combine(last, datetime.max.time())
+
+    with store._lock:
+        store._cache.clear()
+    t0 = time.perf_counter()
+    rows = len(store.window(start, end))
+    cold_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    for _ in range(reads):
+        store.window(start, end)
+    warm_ms = (time.perf_counter() - t0) * 1000 / reads
+
+    return {
+        "days_available": len(available),
+        "window": [start.isoformat(), end.isoformat()],
+        "rows": rows,
+        "cold_ms": round(cold_ms, 2),
+        "warm_ms": round(warm_ms, 2),
+        "cache": store.cache_info(),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Index generated days / benchmark history reads")
+    parser.add_argument("--root", default=GENERATED_DIR)
+    parser.add_argument("--index", action="store_true", help="build Parquet for every cf_day CSV")
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    store = HistoryStore(args.root)
+    if args.index:
+        for d in store.available_days():
+            store._source(d)
+        print(json.dumps({"indexed": store.stats["indexed"]}))
+    else:
+        print(json.dumps(benchmark_history(store, days=args.days), indent=2))
@@ -0,0 +1,97 @@
+# live_stream.py
+# Server-sent events fan-out of live snapshots + forecasts
+
+import asyncio
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+import orjson
+
+# Per-subscriber buffer. A client that falls this far behind only
+# needs the newest tick, so older payloads are dropped.
+SUBSCRIBER_QUEUE_SIZE = 2
+
+# Comment line sent when idle so proxies keep the connection open.
+KEEPALIVE_SECONDS = 15.0
+
+
+def sse_event(event: str, data: Any, event_id: Optional[str] = None) -> bytes:
+    """
+    Encode one SSE message. 'data' may be pre-serialized JSON (str/bytes)
+    or any JSON-serializable object.
+    """
+    if isinstance(data, bytes):
+        body = data.decode("utf-8")
+    elif isinstance(data, str):
+        body = data
+    else:
+        body = orjson.dumps(data, default=str, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    for line in body.splitlines() or [""]:
+        lines.append(f"data: {line}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class LiveBroadcaster:
+    """
+    Broadcasts one pre-encoded payload per tick to every subscriber.
+
+    The payload is serialized once by the publisher and the same bytes
+    object is queued for every client, so a tick costs the same no
+    matter how many clients are connected. State is per process.
+    """
+
+    def __init__(self):
+        self._subscribers: Set[asyncio.Queue] = set()
+        self.latest: Optional[bytes] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, payload: bytes) -> int:
+        """Queue a payload for all subscribers. Returns how many got it."""
+        self.latest = payload
+        for q in list(self._subscribers):
+            if q.full():
+                try:
+                    q.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            q.put_nowait(payload)
+        return len(self._subscribers)
+
+    async def stream(self, is_disconnected=None) -> AsyncIterator[bytes]:
+        """
+        Yield payloads for one client: the latest tick first (if any),
+        then every new tick, with keep-alive comments while idle.
+        """
+        q: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(q)
+        try:
+            if self.latest is not None:
+                yield self.latest
+
+            while True:
+                try:
+                    payload = await asyncio.wait_for(q.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        break
+                    yield b": keep-alive\n\n"
+                    continue
+                yield payload
+        finally:
+            self._subscribers.discard(q)
+
+
+def tick_payload(timestamp: str, snapshot: Dict, forecasts: Dict) -> bytes:
+    """The 'tick' SSE message shared by every subscriber."""
+    return sse_event(
+        "tick",
+        {"timestamp": timestamp, "snapshot": snapshot, "forecasts": forecasts},
+        event_id=timestamp,
+    )
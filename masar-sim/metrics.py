@@ -0,0 +1,155 @@
+# metrics.py
+# Request / stage timings: Prometheus histograms + Server-Timing debug header
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+except ImportError:  # timings still work for the debug header
+    Histogram = None
+
+# ------------------------------------------------------------
+# Settings
+# ------------------------------------------------------------
+
+# Send a Server-Timing header on every response, not only when the
+# request asks for it with "X-Debug-Timing: 1".
+SERVER_TIMING_ALWAYS = os.environ.get("MASAR_SERVER_TIMING", "0") == "1"
+DEBUG_TIMING_HEADER = b"x-debug-timing"
+
+# 0.5 ms .. 10 s: covers an in-memory read up to a slow Firestore backfill.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+if Histogram is not None:
+    REQUEST_SECONDS = Histogram(
+        "masar_request_seconds",
+        "HTTP request latency",
+        ["method", "route", "status"],
+        buckets=BUCKETS,
+    )
+    STAGE_SECONDS = Histogram(
+        "masar_stage_seconds",
+        "Time spent in one stage of request handling",
+        ["stage"],
+        buckets=BUCKETS,
+    )
+else:
+    REQUEST_SECONDS = STAGE_SECONDS = None
+
+
+# ------------------------------------------------------------
+# Spans
+# ------------------------------------------------------------
+
+
+class RequestTimings:
+    """Stage -> (total seconds, count) for the current request."""
+
+    def __init__(self):
+        self.stages: Dict[str, list] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        entry = self.stages.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """Server-Timing header value, durations in ms."""
+        parts = [
+            f'{stage};dur={secs * 1000:.2f};desc="x{count}"' if count > 1 else f"{stage};dur={secs * 1000:.2f}"
+            for stage, (secs, count) in self.stages.items()
+        ]
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("masar_request_timings", default=None)
+
+
+def record(stage: str, seconds: float) -> None:
+    if STAGE_SECONDS is not None:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time a block as one stage. Works in sync and async code; the request
+    breakdown follows the context into run_in_threadpool / to_thread,
+    while plain executor threads only feed the histogram.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - t0)
+
+
+# ------------------------------------------------------------
+# ASGI middleware + /metrics
+# ------------------------------------------------------------
+
+
+class TimingMiddleware:
+    """
+    Times every HTTP request into masar_request_seconds (labelled by route
+    template, not raw path) and, when enabled, adds a Server-Timing header
+    listing each stage. Event streams are not timed: their duration is
+    the client's connection lifetime.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        t0 = time.perf_counter()
+        want_header = SERVER_TIMING_ALWAYS or any(
+            k == DEBUG_TIMING_HEADER and v == b"1" for k, v in scope.get("headers", [])
+        )
+        state = {"status": 500, "stream": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                headers = list(message.get("headers", []))
+                state["stream"] = any(
+                    k.lower() == b"content-type" and v.startswith(b"text/event-stream") for k, v in headers
+                )
+                if want_header:
+                    value = timings.server_timing(time.perf_counter() - t0)
+                    headers.append((b"server-timing", value.encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if REQUEST_SECONDS is not None and not state["stream"]:
+                route = scope.get("route")
+                REQUEST_SECONDS.labels(
+                    scope["method"],
+                    getattr(route, "path", "unmatched"),
+                    str(state["status"]),
+                ).observe(time.perf_counter() - t0)
+
+
+def metrics_payload():
+    """(body, content type) for /metrics, or None without prometheus_client."""
+    if Histogram is None:
+        return None
+    return generate_latest(), CONTENT_TYPE_LATEST
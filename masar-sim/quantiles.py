@@ -0,0 +1,221 @@
+# quantiles.py
+# Multi-quantile 30-min forecasts: p10 / p50 / p90 + chance of High / Extreme
+
+import os
+import json
+import time
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from features import (
+    FEATURES,
+    FEATURES_DIR,
+    HORIZON_MINUTES,
+    MINUTES_PER_DAY,
+    TARGET,
+    iter_feature_days,
+)
+from tree_eval import TreeEnsemble
+
+# ------------------------------------------------------------
+# Model location & settings
+# ------------------------------------------------------------
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+QUANTILE_MODEL_PATH = os.environ.get(
+    "MASAR_QUANTILE_MODEL",
+    os.path.join(BASE_DIR, "..", "masar_forecasting", "models", "masar_xgb_30min_quantiles.json"),
+)
+
+QUANTILES = [0.1, 0.5, 0.9]
+
+# Utilization cut-offs of sim_core.classify_from_cap.
+HIGH_RATIO = 0.60
+EXTREME_RATIO = 1.00
+
+
+# ------------------------------------------------------------
+# CDF helpers
+# ------------------------------------------------------------
+
+
+def cdf_at(qvals: np.ndarray, alphas: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """
+    P(Y <= x) per row from predicted quantiles, by linear interpolation
+    between (quantile value, alpha) points and linear extrapolation of
+    the outer segments, clipped to [0, 1].
+
+    qvals: (rows, k) sorted per row; alphas: (k,); x: (rows,)
+    """
+    rows, k = qvals.shape
+    x = np.asarray(x, dtype=np.float64)
+    # Segment j with q[j] <= x < q[j+1]; the outer segments extrapolate
+    below = (qvals <= x[:, None]).sum(axis=1)
+    seg = np.where(x <= qvals[:, 0], 0, np.where(x >= qvals[:, -1], k - 2, np.clip(below - 1, 0, k - 2)))
+
+    idx = np.arange(rows)
+    q_lo = qvals[idx, seg]
+    q_hi = qvals[idx, seg + 1]
+    a_lo = alphas[seg]
+    a_hi = alphas[seg + 1]
+    dq = q_hi - q_lo
+    flat = dq <= 0
+    out = a_lo + (x - q_lo) * (a_hi - a_lo) / np.where(flat, 1.0, dq)
+    # Tied quantiles (a zero-width segment) are a step: the highest alpha
+    # whose quantile is <= x, and 1 only at or past the last quantile
+    step = np.where(below > 0, alphas[np.maximum(below - 1, 0)], 0.0)
+    step = np.where(x >= qvals[:, -1], 1.0, step)
+    out = np.where(flat, step, out)
+    return np.clip(out, 0.0, 1.0)
+
+
+# ------------------------------------------------------------
+# Serving
+# ------------------------------------------------------------
+
+
+class QuantileForecaster:
+    """
+    One multi-output XGBoost model (reg:quantileerror with several
+    quantile_alpha values) scored once per batch on the same FEATURES
+    matrix as the point forecast, so every quantile comes from a single
+    model call. Small batches can go through the NumPy tree evaluator.
+    """
+
+    def __init__(self, booster: xgb.Booster, quantiles: List[float], use_numpy: bool = False, numpy_max_rows: int = 256):
+        self.booster = booster
+        self.quantiles = np.asarray(quantiles, dtype=np.float64)
+        self.ensemble = TreeEnsemble.from_booster(booster) if use_numpy else None
+        self.numpy_max_rows = numpy_max_rows
+
+    @classmethod
+    def load(cls, path: str = QUANTILE_MODEL_PATH, **kwargs) -> Optional["QuantileForecaster"]:
+        """The model at 'path', or None if it has not been trained yet."""
+        if not os.path.exists(path):
+            return None
+        booster = xgb.Booster(model_file=path)
+        booster.set_param({"nthread": 1})
+        quantiles = json.loads(booster.attr("quantiles") or json.dumps(QUANTILES))
+        return cls(booster, quantiles, **kwargs)
+
+    def quantile_values(self, X: pd.DataFrame) -> np.ndarray:
+        """(rows, k) predicted totals, non-negative and sorted per row."""
+        if self.ensemble is not None and len(X) <= self.numpy_max_rows:
+            raw = self.ensemble.predict(X)
+        else:
+            raw = self.booster.inplace_predict(X[FEATURES].to_numpy(dtype=np.float32))
+        raw = np.asarray(raw, dtype=np.float64).reshape(len(X), -1)
+        # Independent quantile heads can cross; sorting restores a valid CDF.
+        return np.sort(np.clip(raw, 0.0, None), axis=1)
+
+    def predict(self, X: pd.DataFrame, capacities: np.ndarray) -> List[Dict]:
+        """
+        Per row: the quantile band and the probability that the station
+        is at least High (>= 60% of capacity) / Extreme (>= 100%) in 30 min.
+        """
+        qv = self.quantile_values(X)
+        cap = np.asarray(capacities, dtype=np.float64)
+        has_cap = cap > 0
+        p_high = np.where(has_cap, 1.0 - cdf_at(qv, self.quantiles, HIGH_RATIO * cap), 0.0)
+        p_extreme = np.where(has_cap, 1.0 - cdf_at(qv, self.quantiles, EXTREME_RATIO * cap), 0.0)
+
+        names = [f"p{int(round(a * 100))}" for a in self.quantiles]
+        return [
+            {
+                "quantiles": {n: round(float(v), 1) for n, v in zip(names, qv[i])},
+                "interval": [round(float(qv[i, 0]), 1), round(float(qv[i, -1]), 1)],
+                "prob_high_or_above": round(float(p_high[i]), 3),
+                "prob_extreme": round(float(p_extreme[i]), 3),
+            }
+            for i in range(len(qv))
+        ]
+
+
+# ------------------------------------------------------------
+# Training
+# ------------------------------------------------------------
+
+
+def load_training_frame(
+    features_dir: str = FEATURES_DIR,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> pd.DataFrame:
+    parts = []
+    for day, df in iter_feature_days(features_dir, start, end, columns=FEATURES + [TARGET]):
+        # Targets past midnight are synthetic pre-service zeros (see backtest.py).
+        df = df[df["minute_of_day"] + HORIZON_MINUTES < MINUTES_PER_DAY]
+        df.insert(0, "day", day)
+        parts.append(df)
+    if not parts:
+        raise SystemExit(f"No materialized features under {features_dir} (run features.py first)")
+    return pd.concat(parts, ignore_index=True)
+
+
+def train_quantile_model(
+    df: pd.DataFrame,
+    quantiles: List[float] = QUANTILES,
+    holdout_frac: float = 0.15,
+    **params,
+) -> Dict:
+    """
+    Fit one reg:quantileerror model for all quantiles. The last
+    holdout_frac of days is held out to report pinball loss and the
+    empirical coverage of each quantile.
+    """
+    days = sorted(df["day"].unique())
+    n_hold = int(len(days) * holdout_frac) if len(days) > 1 else 0
+    hold_days = set(days[len(days) - n_hold:]) if n_hold else set()
+    is_hold = df["day"].isin(hold_days).to_numpy()
+
+    X = df[FEATURES].to_numpy(dtype=np.float32)
+    y = df[TARGET].to_numpy(dtype=np.float32)
+
+    settings = {
+        "objective": "reg:quantileerror",
+        "quantile_alpha": np.asarray(quantiles),
+        "tree_method": "hist",
+        "max_depth": 5,
+        "learning_rate": 0.1,
+    }
+    settings.update(params)
+    rounds = int(settings.pop("n_estimators", 300))
+
+    t0 = time.perf_counter()
+    dtrain = xgb.QuantileDMatrix(X[~is_hold], y[~is_hold], feature_names=FEATURES)
+    booster = xgb.train(settings, dtrain, num_boost_round=rounds)
+    booster.set_attr(quantiles=json.dumps(list(quantiles)))
+    seconds = time.perf_counter() - t0
+
+    report = {"rows_train": int((~is_hold).sum()), "rows_holdout": int(is_hold.sum()), "train_seconds": round(seconds, 2)}
+    if is_hold.any():
+        pred = booster.inplace_predict(X[is_hold]).reshape(int(is_hold.sum()), -1)
+        yh = y[is_hold]
+        for j, a in enumerate(quantiles):
+            diff = yh - pred[:, j]
+            report[f"p{int(round(a * 100))}"] = {
+                "pinball": round(float(np.mean(np.maximum(a * diff, (a - 1) * diff))), 2),
+                "coverage": round(float(np.mean(yh <= pred[:, j])), 3),
+            }
+    return {"booster": booster, "report": report}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the multi-quantile 30-min model")
+    parser.add_argument("--features", default=FEATURES_DIR)
+    parser.add_argument("--out", default=QUANTILE_MODEL_PATH)
+    parser.add_argument("--start", type=date.fromisoformat, default=None)
+    parser.add_argument("--end", type=date.fromisoformat, default=None)
+    parser.add_argument("--rounds", type=int, default=300)
+    args = parser.parse_args()
+
+    frame = load_training_frame(args.features, args.start, args.end)
+    result = train_quantile_model(frame, n_estimators=args.rounds)
+    result["booster"].save_model(args.out)
+    print(json.dumps({"model": os.path.abspath(args.out), **result["report"]}, indent=2))
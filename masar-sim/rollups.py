@@ -0,0 +1,281 @@
+# rollups.py
+# Pre-aggregated 5-min / hourly / daily cubes over generated days
+
+import os
+import json
+import logging
+import time
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from history_store import HistoryStore
+
+logger = logging.getLogger("masar.rollups")
+
+# ------------------------------------------------------------
+# Levels & layout
+# ------------------------------------------------------------
+
+# Bucket width in minutes, finest first.
+ROLLUP_LEVELS = {
+    "5min": 5,
+    "hourly": 60,
+    "daily": 1440,
+}
+
+CROWD_LEVELS = ["Low", "Medium", "High", "Extreme"]
+
+ROLLUP_COLUMNS = (
+    ["bucket", "station_id", "mean", "max", "p95", "minutes"]
+    + [f"minutes_{lvl.lower()}" for lvl in CROWD_LEVELS]
+)
+
+# level=auto picks the coarsest level that still gives this many
+# buckets over the requested range (a week -> hourly, a quarter -> daily).
+ROLLUP_MIN_POINTS = int(os.environ.get("MASAR_ROLLUP_MIN_POINTS", "24"))
+
+# The live tick re-checks the manifest against the generated days (in a
+# background thread) at most this often, so newly generated days show up
+# without a restart. Queries only read the level files.
+ROLLUP_REFRESH_SECONDS = float(os.environ.get("MASAR_ROLLUP_REFRESH_SEC", "60"))
+
+ROLLUP_SUBDIR = "rollups"
+MANIFEST_NAME = "manifest.json"
+
+
+def rollup_frame(df: pd.DataFrame, minutes: int) -> pd.DataFrame:
+    """
+    Minute rows (timestamp, station_id, station_total, crowd_level)
+    -> one row per (bucket, station) with mean / max / p95 of
+    station_total and the number of minutes spent in each crowd level.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+
+    bucket = df["timestamp"].dt.floor(f"{minutes}min").rename("bucket")
+    keys = [bucket, df["station_id"]]
+    totals = df.groupby(keys, sort=True)["station_total"]
+
+    out = totals.agg(["mean", "max", "size"]).rename(columns={"size": "minutes"})
+    out["p95"] = totals.quantile(0.95)
+
+    per_level = (
+        df.groupby(keys + [df["crowd_level"]], sort=False)
+        .size()
+        .unstack(fill_value=0)
+        .reindex(columns=CROWD_LEVELS, fill_value=0)
+    )
+    per_level.columns = [f"minutes_{lvl.lower()}" for lvl in CROWD_LEVELS]
+    out = out.join(per_level).reset_index()
+
+    out["mean"] = out["mean"].round(1)
+    out["p95"] = out["p95"].round(1)
+    return out[ROLLUP_COLUMNS]
+
+
+def pick_level(start: datetime, end: datetime, min_points: int = ROLLUP_MIN_POINTS) -> str:
+    """Coarsest level with at least min_points buckets in [start, end]."""
+    span = (end - start).total_seconds() / 60 + 1
+    for name in sorted(ROLLUP_LEVELS, key=ROLLUP_LEVELS.get, reverse=True):
+        if span / ROLLUP_LEVELS[name] >= min_points:
+            return name
+    return min(ROLLUP_LEVELS, key=ROLLUP_LEVELS.get)
+
+
+# ------------------------------------------------------------
+# Store
+# ------------------------------------------------------------
+
+
+class RollupStore:
+    """
+    Rollup cubes kept next to the generated data as one Parquet file per
+    level (rollups/{level}.parquet, sorted by bucket then station).
+
+    A manifest records which days were aggregated and from which version
+    of their source file, so update() only aggregates new or regenerated
+    days and drops days whose source is gone. Level files are read once
+    and cached until they change.
+    """
+
+    def __init__(self, history: HistoryStore):
+        self.history = history
+        self.root = os.path.join(history.root, ROLLUP_SUBDIR)
+        self._frames: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._last_refresh = 0.0
+        self._refreshing: Optional[threading.Thread] = None
+        self._refresh_lock = threading.Lock()  # not _lock: update() holds that for the whole build
+
+    # ---------- layout ----------
+
+    def level_path(self, level: str) -> str:
+        return os.path.join(self.root, f"{level}.parquet")
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.root, MANIFEST_NAME)
+
+    def load_manifest(self) -> Dict:
+        try:
+            with open(self._manifest_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"days": {}}
+
+    def _save_manifest(self, manifest: Dict) -> None:
+        tmp = f"{self._manifest_path()}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self._manifest_path())
+
+    # ---------- incremental build ----------
+
+    def update(self) -> Dict:
+        """
+        Aggregate every generated day that is new or changed since the
+        last run. Returns which days were added / rebuilt / removed.
+        """
+        t0 = time.perf_counter()
+        with self._lock:
+            manifest = self.load_manifest()
+            done = manifest.get("days", {})
+
+            versions = {d.isoformat(): self.history.day_version(d) for d in self.history.available_days()}
+            todo = sorted(d for d, v in versions.items() if done.get(d, {}).get("version") != v)
+            removed = sorted(d for d in done if d not in versions)
+
+            if todo or removed:
+                os.makedirs(self.root, exist_ok=True)
+                fresh = {level: [] for level in ROLLUP_LEVELS}
+                for day in todo:
+                    frames = self.history.day_frames(date.fromisoformat(day))
+                    df = pd.concat(frames.values(), ignore_index=True) if frames else pd.DataFrame()
+                    for level, minutes in ROLLUP_LEVELS.items():
+                        fresh[level].append(rollup_frame(df, minutes))
+                    done[day] = {"version": versions[day], "rows": len(df)}
+                for day in removed:
+                    done.pop(day, None)
+
+                stale = set(todo) | set(removed)
+                for level in ROLLUP_LEVELS:
+                    self._rewrite_level(level, stale, fresh[level])
+
+                manifest["days"] = done
+                manifest["updated_at"] = datetime.now().isoformat(timespec="seconds")
+                self._save_manifest(manifest)
+
+            self._last_refresh = time.monotonic()
+
+        return {
+            "days": len(done),
+            "aggregated": todo,
+            "removed": removed,
+            "seconds": round(time.perf_counter() - t0, 3),
+        }
+
+    def _rewrite_level(self, level: str, stale_days, parts: List[pd.DataFrame]) -> None:
+        path = self.level_path(level)
+        old = self._read_level(path)
+        if old is not None and stale_days:
+            day_keys = old["bucket"].dt.strftime("%Y-%m-%d")
+            old = old[~day_keys.isin(stale_days)]
+
+        frames = [f for f in [old] + parts if f is not None and not f.empty]
+        if frames:
+            out = pd.concat(frames, ignore_index=True)
+        else:
+            out = pd.DataFrame(columns=ROLLUP_COLUMNS)
+        out = out.sort_values(["bucket", "station_id"], kind="stable").reset_index(drop=True)
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        out.to_parquet(tmp, index=False, compression="zstd")
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _read_level(path: str) -> Optional[pd.DataFrame]:
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path, memory_map=True)
+
+    def refresh(self, force: bool = False) -> None:
+        """Run update() if the last check is older than ROLLUP_REFRESH_SECONDS."""
+        if force or time.monotonic() - self._last_refresh >= ROLLUP_REFRESH_SECONDS:
+            self.update()
+
+    def refresh_in_background(self) -> bool:
+        """
+        refresh() in a daemon thread, at most one at a time. Returns
+        False when a refresh is running or the last one is recent.
+        """
+        if time.monotonic() - self._last_refresh < ROLLUP_REFRESH_SECONDS:
+            return False
+        with self._refresh_lock:
+            if self._refreshing is not None and self._refreshing.is_alive():
+                return False
+            self._refreshing = threading.Thread(target=self._refresh_logged, daemon=True)
+            self._refreshing.start()
+        return True
+
+    def _refresh_logged(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            # Retry on the next interval rather than on every tick
+            self._last_refresh = time.monotonic()
+            logger.exception("rollup refresh failed")
+
+    # ---------- queries ----------
+
+    def level_frame(self, level: str) -> pd.DataFrame:
+        path = self.level_path(level)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return pd.DataFrame(columns=ROLLUP_COLUMNS)
+
+        hit = self._frames.get(level)
+        if hit is not None and hit[0] == mtime:
+            return hit[1]
+        df = self._read_level(path)
+        self._frames[level] = (mtime, df)
+        return df
+
+    def query(
+        self,
+        start: datetime,
+        end: datetime,
+        level: str = "auto",
+        stations: Optional[List[str]] = None,
+    ) -> Dict:
+        """
+        Buckets of 'level' overlapping [start, end] (naive Riyadh time).
+        level='auto' uses pick_level(). Returns {level, minutes, frame}.
+        Read-only: serves the level files as last written by update().
+        """
+        if level == "auto":
+            level = pick_level(start, end)
+        minutes = ROLLUP_LEVELS[level]
+
+        df = self.level_frame(level)
+        lo_ts = pd.Timestamp(start).floor(f"{minutes}min")
+        lo = df["bucket"].searchsorted(lo_ts, side="left")
+        hi = df["bucket"].searchsorted(pd.Timestamp(end), side="right")
+        out = df.iloc[lo:hi]
+        if stations is not None:
+            out = out[out["station_id"].isin(stations)]
+
+        return {"level": level, "minutes": minutes, "frame": out.reset_index(drop=True)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build / update rollup cubes over generated days")
+    parser.add_argument("--root", default=None, help="generated data dir (default: history_store.GENERATED_DIR)")
+    args = parser.parse_args()
+
+    history = HistoryStore(args.root) if args.root else HistoryStore()
+    print(json.dumps(RollupStore(history).update(), indent=2))
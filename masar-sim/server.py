@@ -3,17 +3,25 @@
 
 import os
 import json
+import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import joblib
+import numpy as np
+import orjson
 import pandas as pd
 from pydantic import BaseModel
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.cloud.firestore import AsyncClient
+from starlette.concurrency import run_in_threadpool
 
 # Import simulation engine
 from sim_core import (
@@ -22,7 +30,18 @@ from sim_core import (
     make_snapshot_for_station,
     get_capacity,
     classify_from_cap,
+    station_ids,
 )
+from tick_store import make_tick_store
+from live_stream import LiveBroadcaster, tick_payload
+from history_store import HistoryStore
+from features import FEATURES, station_code_to_numeric
+from tree_eval import TreeEnsemble
+from quantiles import QUANTILE_MODEL_PATH, QuantileForecaster
+from rollups import ROLLUP_LEVELS, RollupStore
+from metrics import TimingMiddleware, metrics_payload, span
+
+logger = logging.getLogger("masar.server")
 
 # ------------------------------------------------------------
 # Model loading
@@ -40,25 +59,29 @@ MODEL_PATH = os.path.join(
 
 xgb_model = joblib.load(MODEL_PATH)
 
-FEATURES = [
-    "hour",
-    "minute_of_day",
-    "day_of_week",
-    "is_weekend",
-    "station_id",
-    "headway_seconds",
-    "event_flag",
-    "holiday_flag",
-    "special_event_type",
-    "lag_5",
-    "lag_15",
-    "lag_30",
-    "lag_60",
-    "lag_120",
-    "roll_mean_15",
-    "roll_std_15",
-    "roll_mean_60",
-]
+# MASAR_TREE_EVAL=numpy scores small batches (a live request is 1-6 rows)
+# with the NumPy tree evaluator instead of calling into XGBoost, which
+# has a large fixed cost per call. Larger batches stay on XGBoost.
+MODEL_RUNTIME = os.environ.get("MASAR_TREE_EVAL", "xgboost").strip().lower()
+TREE_EVAL_MAX_ROWS = int(os.environ.get("MASAR_TREE_EVAL_MAX_ROWS", "256"))
+
+tree_ensemble = TreeEnsemble.from_booster(xgb_model) if MODEL_RUNTIME == "numpy" else None
+
+
+def model_predict(X: pd.DataFrame):
+    """Model output for the rows of X (columns in FEATURES order)."""
+    if tree_ensemble is not None and len(X) <= TREE_EVAL_MAX_ROWS:
+        return tree_ensemble.predict(X)
+    return xgb_model.predict(X)
+
+
+# Optional p10/p50/p90 model (quantiles.py). When it has been trained,
+# live forecasts also carry a range and the chance of High / Extreme.
+quantile_forecaster = QuantileForecaster.load(
+    QUANTILE_MODEL_PATH,
+    use_numpy=MODEL_RUNTIME == "numpy",
+    numpy_max_rows=TREE_EVAL_MAX_ROWS,
+)
 
 LEVEL_TO_INT = {
     "Low": 0,
@@ -67,14 +90,35 @@ LEVEL_TO_INT = {
     "Extreme": 3,
 }
 
+# Columnar responses list crowd levels as codes; this is the legend.
+LEVELS = sorted(LEVEL_TO_INT, key=LEVEL_TO_INT.get)
+
+RESPONSE_SHAPES = {"records", "columnar"}
+
 # ------------------------------------------------------------
 # FastAPI + CORS
 # ------------------------------------------------------------
 
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson (numpy scalars and datetimes
+    included). Much cheaper than the stdlib encoder for the lists of
+    station dicts returned by the snapshot / forecast endpoints.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+
+
 app = FastAPI(
     title="Masar Snapshot & Forecast API",
     description="On-demand congestion snapshots + 30-min ML forecast",
     version="1.0.0",
+    default_response_class=FastJSONResponse,
 )
 
 app.add_middleware(
@@ -85,11 +129,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency histograms + opt-in Server-Timing header (see metrics.py)
+app.add_middleware(TimingMiddleware)
+
 # ------------------------------------------------------------
 # Firestore init with env variable
 # ------------------------------------------------------------
 
 _firestore_client = None
+_async_firestore_client = None
+_firebase_cred = None
 
 
 def init_firebase_app():
@@ -97,7 +146,7 @@ def init_firebase_app():
     Initialize Firebase app using either an environment variable
     or a local serviceAccount.json file.
     """
-    global _firestore_client
+    global _firestore_client, _firebase_cred
     if _firestore_client is not None:
         return _firestore_client
 
@@ -114,6 +163,7 @@ def init_firebase_app():
     if not firebase_admin._apps:
         firebase_admin.initialize_app(cred)
 
+    _firebase_cred = cred
     _firestore_client = firestore.client()
     return _firestore_client
 
@@ -122,6 +172,47 @@ def get_firestore_client():
     """Return a singleton Firestore client."""
     return init_firebase_app()
 
+
+def get_async_firestore_client():
+    """
+    Return a singleton async Firestore client built from the same
+    service account, so the async handlers never block a threadpool
+    worker on Firestore I/O. Honours FIRESTORE_EMULATOR_HOST.
+    """
+    global _async_firestore_client
+    if _async_firestore_client is not None:
+        return _async_firestore_client
+
+    init_firebase_app()
+    _async_firestore_client = AsyncClient(
+        project=_firebase_cred.project_id,
+        credentials=_firebase_cred.get_credential(),
+    )
+    return _async_firestore_client
+
+# ------------------------------------------------------------
+# Live tick storage (layout selected by MASAR_TICK_STORE)
+# ------------------------------------------------------------
+
+_tick_store = None
+
+
+def get_tick_store():
+    """
+    Return the singleton tick store.
+    'firestore' (default): live/{station}/ticks/{YYYYMMDDHHMM}
+    'firestore_compact': one ring document for all stations
+    'sqlite' / 'memory': local stores, no network
+    """
+    global _tick_store
+    if _tick_store is None:
+        _tick_store = make_tick_store(
+            os.environ.get("MASAR_TICK_STORE"),
+            get_firestore_client,
+            get_async_firestore_client,
+        )
+    return _tick_store
+
 # ------------------------------------------------------------
 # Prediction input (manual mode - for testing)
 # ------------------------------------------------------------
@@ -155,68 +246,17 @@ class CrowdRequest(BaseModel):
 # Helper: read last 120 minutes from Firestore and build lags
 # ------------------------------------------------------------
 
-def read_history_for_station(
+async def read_history_for_station(
     station_code: str,
     now: datetime,
     minutes_back: int = 120,
-    max_docs: int = 240,
 ) -> pd.DataFrame:
     """
-    Read recent history for a station from Firestore.
-
-    We read up to max_docs ordered by timestamp desc,
-    then filter to [now - minutes_back, now] and sort ascending.
+    Read recent history for a station from the tick store,
+    restricted to [now - minutes_back, now] and sorted ascending.
     """
-    db = get_firestore_client()
-
-    col_ref = (
-        db.collection("live")
-        .document(station_code)
-        .collection("ticks")
-    )
-
-    # Read most recent documents
-    docs = (
-        col_ref
-        .order_by("timestamp", direction=firestore.Query.DESCENDING)
-        .limit(max_docs)
-        .stream()
-    )
-
-    rows = []
-    cutoff = now - timedelta(minutes=minutes_back)
-
-    for d in docs:
-        data = d.to_dict() or {}
-        ts = data.get("timestamp")
-        total = data.get("station_total")
-
-        if ts is None or total is None:
-            continue
-
-        # Firestore timestamp might be a datetime already
-        if isinstance(ts, datetime):
-            ts_dt = ts
-        else:
-            # Fallback, just in case
-            ts_dt = ts
-
-        if ts_dt < cutoff:
-            # Older than the window we care about; we can skip
-            continue
-
-        rows.append(
-            {
-                "timestamp": ts_dt,
-                "station_total": float(total),
-            }
-        )
-
-    if not rows:
-        return pd.DataFrame(columns=["timestamp", "station_total"])
-
-    df = pd.DataFrame(rows).sort_values("timestamp").reset_index(drop=True)
-    return df
+    with span("store_read"):
+        return await get_tick_store().aread_history(station_code, now, minutes_back)
 
 
 def pick_lag(df: pd.DataFrame, now: datetime, minutes: int) -> float:
@@ -269,68 +309,44 @@ def rolling_std(df: pd.DataFrame, now: datetime, window_min: int) -> float:
     return float(subset["station_total"].std(ddof=0))
 
 
-def station_code_to_numeric(station_code: str) -> int:
-    """
-    Convert 'S1' -> 1, 'S10' -> 10, etc.
-    If the code is already numeric, we parse it directly.
-    """
-    s = station_code.strip()
-    if s.upper().startswith("S"):
-        s = s[1:]
-    try:
-        return int(s)
-    except ValueError:
-        # Fallback: 0 if parsing fails
-        return 0
-
-
-def build_feature_row_from_live(station_code: str) -> Dict:
+def features_from_history(station_code: str, df: pd.DataFrame, now: datetime) -> Optional[Dict]:
     """
-    Build a full feature row for the model using:
-    - current Riyadh time
-    - last 120 minutes from Firestore (for lags & rolling stats)
+    Build a full feature row for the model from a station's history:
+    - lags & rolling stats from the last 120 minutes
+    - time features from 'now' (Riyadh time)
     - simple defaults for headway / event / holiday flags
 
-    This is the main "smart" function for live prediction.
+    Returns None when there is no history to build lags from.
     """
-    now = datetime.now(RIYADH_TZ)
-
-    # 1) Read live history from Firestore (last 120 minutes)
-    df = read_history_for_station(station_code, now, minutes_back=120)
-
     if df.empty:
-        raise HTTPException(
-            status_code=400,
-            detail=f"No live history found for station {station_code}. "
-                   f"Run /backfill_last_2h and /tick_live first."
-        )
+        return None
 
-    # 2) Current crowd level = latest station_total
+    # 1) Current crowd level = latest station_total
     current_total = float(df["station_total"].iloc[-1])
 
-    # 3) Compute lags (using timestamps)
+    # 2) Compute lags (using timestamps)
     lag_5 = pick_lag(df, now, 5)
     lag_15 = pick_lag(df, now, 15)
     lag_30 = pick_lag(df, now, 30)
     lag_60 = pick_lag(df, now, 60)
     lag_120 = pick_lag(df, now, 120)
 
-    # 4) Rolling statistics
+    # 3) Rolling statistics
     roll_mean_15 = rolling_mean(df, now, 15)
     roll_std_15 = rolling_std(df, now, 15)
     roll_mean_60 = rolling_mean(df, now, 60)
 
-    # 5) Time features
+    # 4) Time features
     hour = now.hour
     minute_of_day = now.hour * 60 + now.minute
     day_of_week = now.weekday()  # Monday=0 ... Sunday=6
     # Saudi weekend: Friday (4) and Saturday (5)
     is_weekend = 1 if day_of_week in (4, 5) else 0
 
-    # 6) Station numeric ID
+    # 5) Station numeric ID
     station_id_numeric = station_code_to_numeric(station_code)
 
-    # 7) Simple defaults (can be improved later)
+    # 6) Simple defaults (can be improved later)
     # In a real system, headway_seconds + event_flag + holiday_flag
     # could be derived from separate data sources or config.
     headway_seconds = 300.0
@@ -363,6 +379,157 @@ def build_feature_row_from_live(station_code: str) -> Dict:
 
     return features
 
+
+async def build_feature_row_from_live(station_code: str) -> Dict:
+    """
+    Build a full feature row for the model using:
+    - current Riyadh time
+    - last 120 minutes from the tick store (for lags & rolling stats)
+    - simple defaults for headway / event / holiday flags
+
+    This is the main "smart" function for live prediction.
+    """
+    now = datetime.now(RIYADH_TZ)
+
+    # Read live history (last 120 minutes)
+    df = await read_history_for_station(station_code, now, minutes_back=120)
+
+    with span("features"):
+        features = features_from_history(station_code, df, now)
+    if features is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No live history found for station {station_code}. "
+                   f"Run /backfill_last_2h and /tick_live first."
+        )
+
+    return features
+
+
+def forecast_from_features(station_code: str, features: Dict, y_pred: float) -> Dict:
+    """
+    Turn a model output into the live forecast response for one station.
+    """
+    predicted_total = max(0.0, float(y_pred))
+
+    # Capacity-based classification
+    capacity = get_capacity(station_code)
+    level_text, ratio = classify_from_cap(predicted_total, capacity)
+    level_code = LEVEL_TO_INT[level_text]
+
+    now_ts = features["timestamp_now"]
+    current_total = features["current_total"]
+
+    return {
+        "station_id": station_code,
+        "station_id_ml": station_code_to_numeric(station_code),
+        "timestamp_now": now_ts.isoformat(),
+        "current_occupancy": current_total,
+        "predicted_occupancy_30min": predicted_total,
+        "capacity_station": capacity,
+        "utilization_ratio": ratio,
+        "crowd_level_30min": level_text,
+        "crowd_level_30min_code": level_code,
+        # Debug / transparency fields (optional, useful for the thesis)
+        "features_used": {
+            "hour": features["hour"],
+            "minute_of_day": features["minute_of_day"],
+            "day_of_week": features["day_of_week"],
+            "is_weekend": features["is_weekend"],
+            "lag_5": features["lag_5"],
+            "lag_15": features["lag_15"],
+            "lag_30": features["lag_30"],
+            "lag_60": features["lag_60"],
+            "lag_120": features["lag_120"],
+            "roll_mean_15": features["roll_mean_15"],
+            "roll_std_15": features["roll_std_15"],
+            "roll_mean_60": features["roll_mean_60"],
+        },
+    }
+
+
+def attach_forecast_ranges(forecasts: List[Dict], X: pd.DataFrame) -> None:
+    """
+    Add 'forecast_range' (quantiles, interval, prob_high_or_above,
+    prob_extreme) to each forecast, scored in one batch on the same
+    feature rows. No-op when no quantile model is deployed.
+    """
+    if quantile_forecaster is None or not forecasts:
+        return
+    caps = [f["capacity_station"] for f in forecasts]
+    with span("inference_quantiles"):
+        bands = quantile_forecaster.predict(X, caps)
+    for forecast, band in zip(forecasts, bands):
+        forecast["forecast_range"] = band
+
+
+def _check_shape(shape: str) -> str:
+    if shape not in RESPONSE_SHAPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"shape must be one of: {', '.join(sorted(RESPONSE_SHAPES))}",
+        )
+    return shape
+
+
+def forecast_columns(forecasts: List[Dict]) -> Dict[str, List]:
+    """Parallel arrays for the columnar forecast shape."""
+    columns = {
+        "station_id": [f["station_id"] for f in forecasts],
+        "current": [f["current_occupancy"] for f in forecasts],
+        "predicted": [round(f["predicted_occupancy_30min"], 1) for f in forecasts],
+        "ratio": [round(f["utilization_ratio"], 3) for f in forecasts],
+        "level": [f["crowd_level_30min_code"] for f in forecasts],
+    }
+    if forecasts and "forecast_range" in forecasts[0]:
+        ranges = [f["forecast_range"] for f in forecasts]
+        columns.update(
+            low=[r["interval"][0] for r in ranges],
+            high=[r["interval"][1] for r in ranges],
+            p_high=[r["prob_high_or_above"] for r in ranges],
+            p_extreme=[r["prob_extreme"] for r in ranges],
+        )
+    return columns
+
+
+async def forecast_all_live(now: Optional[datetime] = None) -> Dict:
+    """
+    30-min forecast for every station: one history read through the
+    tick store and one batched model call for all feature rows.
+    Stations without live history are listed under 'missing'.
+    """
+    now = now or datetime.now(RIYADH_TZ)
+    with span("store_read"):
+        history = await get_tick_store().aread_history_all(station_ids, now, 120)
+
+    rows = []
+    missing = []
+    with span("features"):
+        for code in station_ids:
+            features = features_from_history(code, history.get(code, pd.DataFrame()), now)
+            if features is None:
+                missing.append(code)
+            else:
+                rows.append((code, features))
+
+    forecasts = []
+    if rows:
+        X = pd.DataFrame([f for _, f in rows])[FEATURES]
+        with span("inference"):
+            y = model_predict(X)
+        forecasts = [
+            forecast_from_features(code, features, y_i)
+            for (code, features), y_i in zip(rows, y)
+        ]
+        attach_forecast_ranges(forecasts, X)
+
+    return {
+        "timestamp_now": now.isoformat(),
+        "count": len(forecasts),
+        "forecasts": forecasts,
+        "missing": missing,
+    }
+
 # ------------------------------------------------------------
 # Prediction APIs
 # ------------------------------------------------------------
@@ -378,7 +545,8 @@ def predict_30min(req: CrowdRequest):
     """
     row = pd.DataFrame([req.dict()])[FEATURES]
 
-    y_pred = float(xgb_model.predict(row)[0])
+    with span("inference"):
+        y_pred = float(model_predict(row)[0])
     predicted_total = max(0.0, y_pred)
 
     station_code = f"S{req.station_id}"
@@ -397,12 +565,30 @@ def predict_30min(req: CrowdRequest):
     }
 
 
+@app.get("/predict_30min_live/all")
+async def predict_30min_live_all(shape: str = "records"):
+    """
+    Live 30-min forecast for ALL stations in one batched model call.
+
+    ?shape=columnar returns parallel arrays (station_id, current,
+    predicted, ratio, level code) instead of one dict per station.
+    """
+    _check_shape(shape)
+    result = await forecast_all_live()
+
+    if shape == "columnar":
+        forecasts = result.pop("forecasts")
+        result.update(shape="columnar", levels=LEVELS, columns=forecast_columns(forecasts))
+
+    return result
+
+
 @app.get("/predict_30min_live/{station_code}")
-def predict_30min_live(station_code: str):
+async def predict_30min_live(station_code: str):
     """
     Live prediction endpoint.
 
-    - Reads last 120 minutes for the given station from Firestore.
+    - Reads last 120 minutes for the given station from the tick store.
     - Computes lag features and rolling statistics on the backend.
     - Builds the full feature vector for the XGBoost model.
     - Returns a 30-min ahead crowd forecast + crowd level.
@@ -416,50 +602,18 @@ def predict_30min_live(station_code: str):
         s = f"S{s}"
 
     # Build all features from live history
-    features = build_feature_row_from_live(s)
+    features = await build_feature_row_from_live(s)
 
     # Prepare the row for the model
-    model_input = {k: features[k] for k in FEATURES}
-    row = pd.DataFrame([model_input])[FEATURES]
+    row = pd.DataFrame([{k: features[k] for k in FEATURES}])[FEATURES]
 
     # Run the model
-    y_pred = float(xgb_model.predict(row)[0])
-    predicted_total = max(0.0, y_pred)
-
-    # Capacity-based classification
-    capacity = get_capacity(s)
-    level_text, ratio = classify_from_cap(predicted_total, capacity)
-    level_code = LEVEL_TO_INT[level_text]
+    with span("inference"):
+        y_pred = float(model_predict(row)[0])
 
-    now_ts = features["timestamp_now"]
-    current_total = features["current_total"]
-
-    return {
-        "station_id": s,
-        "station_id_ml": station_code_to_numeric(s),
-        "timestamp_now": now_ts.isoformat(),
-        "current_occupancy": current_total,
-        "predicted_occupancy_30min": predicted_total,
-        "capacity_station": capacity,
-        "utilization_ratio": ratio,
-        "crowd_level_30min": level_text,
-        "crowd_level_30min_code": level_code,
-        # Debug / transparency fields (optional, useful for the thesis)
-        "features_used": {
-            "hour": model_input["hour"],
-            "minute_of_day": model_input["minute_of_day"],
-            "day_of_week": model_input["day_of_week"],
-            "is_weekend": model_input["is_weekend"],
-            "lag_5": model_input["lag_5"],
-            "lag_15": model_input["lag_15"],
-            "lag_30": model_input["lag_30"],
-            "lag_60": model_input["lag_60"],
-            "lag_120": model_input["lag_120"],
-            "roll_mean_15": model_input["roll_mean_15"],
-            "roll_std_15": model_input["roll_std_15"],
-            "roll_mean_60": model_input["roll_mean_60"],
-        },
-    }
+    forecast = forecast_from_features(s, features, y_pred)
+    attach_forecast_ranges([forecast], row)
+    return forecast
 
 # ------------------------------------------------------------
 # Health
@@ -469,26 +623,150 @@ def predict_30min_live(station_code: str):
 @app.get("/health")
 def health_check():
     """Simple health-check endpoint."""
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "model_runtime": "numpy" if tree_ensemble is not None else "xgboost",
+        "quantile_model": quantile_forecaster is not None,
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Prometheus exposition: request and per-stage latency histograms."""
+    payload = metrics_payload()
+    if payload is None:
+        raise HTTPException(status_code=503, detail="prometheus_client is not installed")
+    body, content_type = payload
+    return Response(body, media_type=content_type)
 
 # ------------------------------------------------------------
 # Snapshots
 # ------------------------------------------------------------
 
 
+# Snapshots are generated once per minute and kept for the live
+# window, so repeat polls agree with each other and with /tick_live,
+# and a client can ask what changed since an earlier minute.
+SNAPSHOT_CACHE_MINUTES = 121
+
+_snapshot_cache: "OrderedDict[str, Tuple[datetime, List[Dict]]]" = OrderedDict()
+_snapshot_lock = threading.Lock()
+
+
+def minute_key(dt: datetime) -> str:
+    """Tick minute as YYYYMMDDHHMM (same format as tick doc IDs)."""
+    return dt.strftime("%Y%m%d%H%M")
+
+
+def snapshot_for_minute(dt: datetime) -> Tuple[datetime, List[Dict]]:
+    """
+    Return (generated_at, all-stations snapshot) for dt's minute,
+    generating it on the first request of that minute.
+    The returned snapshot is shared: callers must not mutate it.
+    """
+    key = minute_key(dt)
+    with _snapshot_lock:
+        hit = _snapshot_cache.get(key)
+    if hit is not None:
+        return hit
+
+    with span("snapshot"):
+        frame = generate_all_stations_snapshot(dt)
+
+    with _snapshot_lock:
+        hit = _snapshot_cache.setdefault(key, (dt, frame))
+        while len(_snapshot_cache) > SNAPSHOT_CACHE_MINUTES:
+            _snapshot_cache.popitem(last=False)
+    return hit
+
+
+def cached_snapshot(key: str) -> Optional[List[Dict]]:
+    """Snapshot previously served for minute 'key', if still cached."""
+    with _snapshot_lock:
+        hit = _snapshot_cache.get(key)
+    return hit[1] if hit is not None else None
+
+
+def snapshot_delta(frame: List[Dict], base: List[Dict]) -> List[Dict]:
+    """Stations whose crowd_level or station_total differ from 'base'."""
+    prev = {s["station_id"]: s for s in base}
+    changed = []
+    for snap in frame:
+        old = prev.get(snap["station_id"])
+        if (
+            old is None
+            or old.get("crowd_level") != snap.get("crowd_level")
+            or old.get("station_total") != snap.get("station_total")
+        ):
+            changed.append(snap)
+    return changed
+
+
+def snapshot_columns(snaps: List[Dict]) -> Dict[str, List]:
+    """Parallel arrays for the columnar snapshot shape."""
+    return {
+        "station_id": [s["station_id"] for s in snaps],
+        "total": [s["station_total"] for s in snaps],
+        "ratio": [s["load_ratio"] for s in snaps],
+        "level": [LEVEL_TO_INT[s["crowd_level"]] for s in snaps],
+    }
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """RFC 9110 weak comparison against an If-None-Match header."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return "*" in tags or any((t[2:] if t.startswith("W/") else t) == bare for t in tags)
+
+
 @app.get("/snapshot/all")
-def snapshot_all():
+def snapshot_all(request: Request, since: Optional[str] = None, shape: str = "records"):
     """
-    Generate a snapshot for ALL metro stations at the current Riyadh time.
+    Snapshot for ALL metro stations at the current Riyadh minute.
+
+    - The ETag is the tick minute: a repeat poll in the same minute
+      sending If-None-Match gets 304 Not Modified with no body.
+    - ?since=YYYYMMDDHHMM (the 'minute' of an earlier response) returns
+      only stations whose crowd_level or station_total changed since
+      then, with delta=true. If that minute is no longer cached, the
+      full list is returned with delta=false.
+    - ?shape=columnar replaces 'stations' with parallel arrays
+      (station_id, total, ratio, level code). Records stay the default.
     """
+    _check_shape(shape)
     dt = datetime.now(RIYADH_TZ)
-    snaps = generate_all_stations_snapshot(dt)
-    return {
-        "timestamp": dt.isoformat(),
+    key = minute_key(dt)
+    etag = "-".join([key] + ([since] if since else []) + ([shape] if shape != "records" else []))
+    etag = f'W/"{etag}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    generated_at, snaps = snapshot_for_minute(dt)
+    body = {
+        "timestamp": generated_at.isoformat(),
+        "minute": key,
         "count": len(snaps),
         "stations": snaps,
     }
 
+    if since:
+        base = cached_snapshot(since)
+        if base is None:
+            body["delta"] = False
+        else:
+            changed = snapshot_delta(snaps, base)
+            body.update(delta=True, since=since, count=len(changed), stations=changed)
+
+    if shape == "columnar":
+        stations = body.pop("stations")
+        body.update(shape="columnar", levels=LEVELS, columns=snapshot_columns(stations))
+
+    return FastJSONResponse(body, headers=headers)
+
 
 @app.get("/snapshot/{station_id}")
 def snapshot_station(station_id: str):
@@ -497,78 +775,306 @@ def snapshot_station(station_id: str):
     Example: /snapshot/S1
     """
     dt = datetime.now(RIYADH_TZ)
-    return make_snapshot_for_station(station_id, dt)
+    with span("snapshot"):
+        return make_snapshot_for_station(station_id, dt)
+
+# ------------------------------------------------------------
+# Historical replay (generated datasets)
+# ------------------------------------------------------------
+
+# Longest window /history/window serves in one response.
+HISTORY_MAX_DAYS = int(os.environ.get("MASAR_HISTORY_MAX_DAYS", "31"))
+
+history_store = HistoryStore()
+rollup_store = RollupStore(history_store)
+
+# Cap on buckets per station for an explicit rollup level
+# (e.g. a year at 5-min would be ~105k buckets per station).
+ROLLUP_MAX_BUCKETS = int(os.environ.get("MASAR_ROLLUP_MAX_BUCKETS", "20000"))
+
+
+def parse_history_time(value: str, name: str, end_of_day: bool = False) -> datetime:
+    """
+    Naive Riyadh time (the generated data's clock) from ISO 8601
+    (date or datetime, any offset) or YYYYMMDDHHMM.
+    A bare date used as a window end means the end of that day.
+    """
+    try:
+        if len(value) == 12 and value.isdigit():
+            dt = datetime.strptime(value, "%Y%m%d%H%M")
+        else:
+            dt = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{name} must be ISO 8601 or YYYYMMDDHHMM",
+        )
+
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(RIYADH_TZ).replace(tzinfo=None)
+    if end_of_day and len(value) == 10:
+        dt = dt.replace(hour=23, minute=59)
+    return dt
+
+
+def parse_station_list(stations: Optional[str]) -> Optional[List[str]]:
+    """'S1,S3' -> ['S1', 'S3']; None/empty means all stations."""
+    if not stations:
+        return None
+    codes = [c.strip().upper() for c in stations.split(",") if c.strip()]
+    unknown = [c for c in codes if c not in station_ids]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown station(s): {', '.join(unknown)}")
+    return codes
+
+
+def _iso_minutes(ts: pd.Series) -> List[str]:
+    """Timestamps -> ISO strings, formatting each distinct minute once."""
+    codes, uniques = pd.factorize(ts)
+    labels = np.datetime_as_string(pd.DatetimeIndex(uniques).to_numpy().astype("datetime64[s]"))
+    return labels[codes].tolist()
+
+
+def history_records(df: pd.DataFrame, time_col: str = "timestamp") -> List[Dict]:
+    """Row dicts built from column lists (DataFrame.to_dict is ~10x slower)."""
+    keys = list(df.columns)
+    cols = [_iso_minutes(df[c]) if c == time_col else df[c].tolist() for c in keys]
+    return [dict(zip(keys, row)) for row in zip(*cols)]
+
+
+def history_columns(df: pd.DataFrame) -> Dict[str, List]:
+    """
+    Time x station matrix for the columnar history shape:
+    one shared timestamp axis and, per station, a list of totals and
+    crowd level codes (null where a station has no row that minute).
+    """
+    t_codes, minutes = pd.factorize(df["timestamp"], sort=True)
+    s_codes, codes = pd.factorize(df["station_id"], sort=True)
+
+    def matrix(values) -> List[List]:
+        m = np.full((len(codes), len(minutes)), -1, dtype=np.int64)
+        m[s_codes, t_codes] = values
+        return [
+            [None if v < 0 else v for v in row.tolist()] if (row < 0).any() else row.tolist()
+            for row in m
+        ]
+
+    return {
+        "timestamp": _iso_minutes(pd.Series(minutes)),
+        "station_id": [str(c) for c in codes],
+        "total": matrix(df["station_total"].to_numpy()),
+        "level": matrix(df["crowd_level"].map(LEVEL_TO_INT).fillna(-1).to_numpy()),
+    }
+
+
+@app.get("/history/days")
+def history_days():
+    """Simulated days available for replay (cf_day files under data/generated)."""
+    days = history_store.available_days()
+    return {
+        "count": len(days),
+        "first": days[0].isoformat() if days else None,
+        "last": days[-1].isoformat() if days else None,
+        "days": [d.isoformat() for d in days],
+    }
+
+
+@app.get("/history/at")
+def history_at(ts: str, stations: Optional[str] = None):
+    """
+    What the network looked like at a past minute of the generated data.
+    Example: /history/at?ts=2025-09-24T08:30
+    """
+    dt = parse_history_time(ts, "ts")
+    with span("history_read"):
+        df = history_store.at(dt, parse_station_list(stations))
+    if df.empty:
+        raise HTTPException(status_code=404, detail=f"No generated data at {dt.isoformat()}")
+
+    return {
+        "timestamp": dt.replace(second=0, microsecond=0).isoformat(),
+        "count": len(df),
+        "stations": history_records(df),
+    }
+
+
+@app.get("/history/window")
+def history_window(
+    start: str,
+    end: str,
+    stations: Optional[str] = None,
+    shape: str = "records",
+):
+    """
+    Time x station slice of the generated data, start..end inclusive
+    (at most HISTORY_MAX_DAYS days).
+
+    - ?stations=S1,S3 limits the slice (only those stations are read).
+    - ?shape=columnar returns one timestamp axis plus per-station
+      total / level-code arrays, which is far smaller than records
+      for week- or month-long dashboard views.
+    """
+    _check_shape(shape)
+    t0 = parse_history_time(start, "start")
+    t1 = parse_history_time(end, "end", end_of_day=True)
+    if t1 < t0:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if t1 - t0 > timedelta(days=HISTORY_MAX_DAYS):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Window longer than {HISTORY_MAX_DAYS} days",
+        )
+
+    with span("history_read"):
+        df = history_store.window(t0, t1, parse_station_list(stations))
+    body = {
+        "start": t0.isoformat(),
+        "end": t1.isoformat(),
+        "count": len(df),
+    }
+
+    if shape == "columnar":
+        body.update(shape="columnar", levels=LEVELS, columns=history_columns(df))
+    else:
+        body["rows"] = history_records(df)
+
+    # Returned as a response so FastAPI skips jsonable_encoder on large bodies.
+    return FastJSONResponse(body)
+
+
+@app.get("/history/rollup")
+def history_rollup(
+    start: str,
+    end: str,
+    level: str = "auto",
+    stations: Optional[str] = None,
+    shape: str = "records",
+):
+    """
+    Pre-aggregated congestion for long ranges: per station and bucket,
+    mean / max / p95 of station_total and minutes spent in each crowd level.
+
+    - level: 5min | hourly | daily | auto (default). auto picks the
+      coarsest level that still gives a useful number of buckets
+      (a month -> daily, a week -> hourly, a few hours -> 5min).
+    - ?shape=columnar returns parallel arrays instead of records.
+    """
+    _check_shape(shape)
+    if level != "auto" and level not in ROLLUP_LEVELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"level must be auto or one of: {', '.join(ROLLUP_LEVELS)}",
+        )
+    t0 = parse_history_time(start, "start")
+    t1 = parse_history_time(end, "end", end_of_day=True)
+    if t1 < t0:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if level != "auto":
+        buckets = (t1 - t0).total_seconds() / 60 / ROLLUP_LEVELS[level]
+        if buckets > ROLLUP_MAX_BUCKETS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Range too long for level={level}; use a coarser level or auto",
+            )
+
+    with span("rollup_read"):
+        result = rollup_store.query(t0, t1, level, parse_station_list(stations))
+    df = result["frame"]
+    body = {
+        "start": t0.isoformat(),
+        "end": t1.isoformat(),
+        "level": result["level"],
+        "bucket_minutes": result["minutes"],
+        "count": len(df),
+    }
+
+    if shape == "columnar":
+        columns = {c: df[c].tolist() for c in df.columns}
+        columns["bucket"] = _iso_minutes(df["bucket"])
+        body.update(shape="columnar", columns=columns)
+    else:
+        body["rows"] = history_records(df, time_col="bucket")
+    return FastJSONResponse(body)
+
+
+@app.api_route("/rollups/refresh", methods=["GET", "POST"])
+def rollups_refresh():
+    """
+    Aggregate generated days that are new or regenerated since the last
+    run (the live tick also starts this in the background at most once
+    a minute; /history/rollup never does).
+    """
+    return rollup_store.update()
 
 # ------------------------------------------------------------
 # BACKFILL last 2 hours (timestamp = Firestore Timestamp)
 # ------------------------------------------------------------
 
 
-def generate_last_2h_history(step_minutes=1):
+def generate_last_2h_frames(step_minutes=1):
     """
-    Generate synthetic history for the last 2 hours using the simulator.
-    The timestamps are minute-based and stored as datetime objects.
+    Generate synthetic frames for the last 2 hours using the simulator.
+    Returns a list of (timestamp, [snapshot per station]).
     """
     now = datetime.now(RIYADH_TZ)
     start = now - timedelta(hours=2)
 
-    snapshots = []
+    frames = []
     t = start
 
     while t <= now:
-        frame = generate_all_stations_snapshot(t)
-        for s in frame:
-            item = s.copy()
-            item["timestamp"] = t           # Firestore timestamp
-            snapshots.append(item)
+        frames.append((t, generate_all_stations_snapshot(t)))
         t += timedelta(minutes=step_minutes)
 
-    return snapshots
+    return frames
 
 
-def write_last_2h_to_firestore(step_minutes=1):
+def generate_last_2h_history(step_minutes=1):
     """
-    Write the last 2 hours of synthetic history into Firestore
-    under live/{station_id}/ticks/{YYYYMMDDHHMM}.
+    Generate synthetic history for the last 2 hours using the simulator.
+    The timestamps are minute-based and stored as datetime objects.
     """
-    db = get_firestore_client()
-    snaps = generate_last_2h_history(step_minutes)
-
-    batch = db.batch()
-    count = 0
-
-    for snap in snaps:
-        station_id = snap["station_id"]
-        ts = snap["timestamp"]
+    snapshots = []
+    for t, frame in generate_last_2h_frames(step_minutes):
+        for s in frame:
+            item = s.copy()
+            item["timestamp"] = t           # Firestore timestamp
+            snapshots.append(item)
 
-        doc_id = ts.strftime("%Y%m%d%H%M")     # clean ID
-        doc_ref = (
-            db.collection("live")
-            .document(station_id)
-            .collection("ticks")
-            .document(doc_id)
-        )
+    return snapshots
 
-        batch.set(doc_ref, snap)
-        count += 1
 
-        if count % 400 == 0:
-            batch.commit()
-            batch = db.batch()
+async def write_last_2h_to_firestore(step_minutes=1):
+    """
+    Write the last 2 hours of synthetic history into the tick store
+    (by default live/{station_id}/ticks/{YYYYMMDDHHMM}).
 
-    batch.commit()
-    return count
+    Snapshot generation is CPU work, so it runs in the threadpool;
+    the batch commits then overlap on the event loop.
+    Returns write statistics (docs, batches, retries, docs/sec).
+    """
+    with span("snapshot"):
+        frames = await run_in_threadpool(generate_last_2h_frames, step_minutes)
+    with span("store_write"):
+        return await get_tick_store().awrite_frames(frames)
 
 
 @app.api_route("/backfill_last_2h", methods=["GET", "POST"])
-def backfill_last_2h():
+async def backfill_last_2h():
     """
     One-shot endpoint to pre-fill the last 2 hours of data in Firestore.
     Useful when the server starts (to avoid cold history for the model).
     """
     try:
-        written = write_last_2h_to_firestore(step_minutes=1)
-        return {"status": "ok", "written_ticks": written}
+        stats = await write_last_2h_to_firestore(step_minutes=1)
+        return {
+            "status": "ok",
+            "written_ticks": stats["written"],
+            "batches": stats["batches"],
+            "retries": stats["retries"],
+            "seconds": stats["seconds"],
+            "docs_per_sec": stats["docs_per_sec"],
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -577,87 +1083,97 @@ def backfill_last_2h():
 # ------------------------------------------------------------
 
 
-def write_current_tick(now):
+async def write_current_tick(now):
     """
     Generate a snapshot for all stations at the given 'now' datetime
-    and append it to Firestore as the current live tick.
+    and append it to the tick store as the current live tick.
+    Returns the generated frame.
     """
-    db = get_firestore_client()
-    frame = generate_all_stations_snapshot(now)
-
-    batch = db.batch()
-
-    for snap in frame:
-        station_id = snap["station_id"]
-        doc_id = now.strftime("%Y%m%d%H%M")
+    # Same per-minute snapshot that /snapshot/all serves
+    _, frame = await run_in_threadpool(snapshot_for_minute, now)
+    with span("store_write"):
+        await get_tick_store().awrite_frame(now, frame)
+    return frame
 
-        snap["timestamp"] = now   # Firestore timestamp
 
-        doc_ref = (
-            db.collection("live")
-            .document(station_id)
-            .collection("ticks")
-            .document(doc_id)
-        )
+async def publish_tick(now, frame) -> int:
+    """
+    Broadcast this tick's snapshot + forecasts to /stream/live subscribers.
 
-        batch.set(doc_ref, snap)
+    Forecasts are computed once and the message is serialized once,
+    so the cost does not depend on how many clients are connected.
+    With no subscribers nothing is computed (forecasts read the history
+    of every station). Returns the number of subscribers reached.
+    """
+    if live_broadcaster.subscriber_count == 0:
+        # A client connecting later waits for the next tick, not this one
+        live_broadcaster.latest = None
+        return 0
 
-    batch.commit()
+    try:
+        forecasts = await forecast_all_live(now)
+    except Exception:
+        logger.exception("live forecast failed for tick %s", now.isoformat())
+        forecasts = {"timestamp_now": now.isoformat(), "count": 0, "forecasts": [], "missing": []}
+
+    snapshot = {
+        "timestamp": now.isoformat(),
+        "count": len(frame),
+        "stations": frame,
+    }
+    return live_broadcaster.publish(tick_payload(now.isoformat(), snapshot, forecasts))
 
 
-def delete_old(now):
+async def delete_old(now):
     """
-    Delete any tick older than 2 hours for all stations,
-    keeping a rolling 2-hour window of live data.
+    Offline compaction: delete ticks older than the retention window.
 
-    Uses pagination (limit 300) per station to avoid exceeding
-    Firestore batch operation limits.
+    The live tick path does not call this; expiry is handled by the
+    Firestore TTL policy on 'expire_at' (or by the ring layout).
     """
-    cutoff = now - timedelta(hours=2)
-    db = get_firestore_client()
-
-    stations = db.collection("live").stream()
-    deleted_total = 0
+    with span("compaction"):
+        return await get_tick_store().acompact(now)
 
-    for station in stations:
-        ticks_ref = station.reference.collection("ticks")
 
-        while True:
-            # Take a small batch of old docs per station
-            docs = list(
-                ticks_ref
-                .where("timestamp", "<", cutoff)
-                .limit(300)
-                .stream()
-            )
+@app.api_route("/tick_live", methods=["GET", "POST"])
+async def tick_live():
+    """
+    Live tick endpoint.
 
-            if not docs:
-                # No more old docs for this station
-                break
+    - Generates a snapshot "now" for all stations.
+    - Writes it to Firestore as the latest tick (with 'expire_at').
+    - Pushes snapshot + forecasts to /stream/live subscribers.
+    - Starts a background rollup refresh when one is due.
 
-            batch = db.batch()
-            for doc in docs:
-                batch.delete(doc.reference)
-                deleted_total += 1
-            batch.commit()
+    Old ticks are not scanned here; see /compact_live.
+    """
+    now = datetime.now(RIYADH_TZ)
 
-    return deleted_total
+    try:
+        frame = await write_current_tick(now)
+        subscribers = await publish_tick(now, frame)
+        rollup_store.refresh_in_background()
+        return {
+            "status": "ok",
+            "now": now.isoformat(),
+            "subscribers": subscribers,
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.api_route("/tick_live", methods=["GET", "POST"])
-def tick_live():
+@app.api_route("/compact_live", methods=["GET", "POST"])
+async def compact_live():
     """
-    Live tick endpoint.
+    Offline compaction endpoint (run from a scheduler, e.g. hourly).
 
-    - Generates a snapshot "now" for all stations.
-    - Writes it to Firestore as the latest tick.
-    - Deletes any tick older than 2 hours.
+    Deletes ticks older than the retention window that the
+    Firestore TTL policy has not removed yet.
     """
     now = datetime.now(RIYADH_TZ)
 
     try:
-        write_current_tick(now)
-        deleted = delete_old(now)
+        deleted = await delete_old(now)
         return {
             "status": "ok",
             "now": now.isoformat(),
@@ -666,6 +1182,29 @@ def tick_live():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ------------------------------------------------------------
+# Live push (server-sent events)
+# ------------------------------------------------------------
+
+live_broadcaster = LiveBroadcaster()
+
+
+@app.get("/stream/live")
+async def stream_live(request: Request):
+    """
+    Server-sent events stream of live ticks.
+
+    Each minute's /tick_live pushes one 'tick' event holding the
+    all-stations snapshot and the 30-min forecasts, so clients no
+    longer need to poll /snapshot/all and /predict_30min_live.
+    New subscribers receive the latest tick immediately.
+    """
+    return StreamingResponse(
+        live_broadcaster.stream(request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ------------------------------------------------------------
 # Local run
 # ------------------------------------------------------------
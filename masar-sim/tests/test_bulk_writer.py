@@ -0,0 +1,151 @@
+# test_bulk_writer.py
+# Chunking and retry behaviour of bulk_writer against an in-memory fake client
+
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+from google.api_core import exceptions as gexc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bulk_writer  # noqa: E402
+from bulk_writer import FIRESTORE_MAX_BATCH_OPS, bulk_write, bulk_write_async, chunk_writes  # noqa: E402
+
+
+# ------------------------------------------------------------
+# Fake client
+# ------------------------------------------------------------
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, ref, data):
+        self.ops.append((ref, data))
+
+    def _commit(self):
+        with self.db.lock:
+            self.db.commit_sizes.append(len(self.ops))
+            if self.db.failures:
+                raise self.db.failures.pop(0)
+            for ref, data in self.ops:
+                self.db.docs[ref] = data
+
+    def commit(self):
+        self._commit()
+
+
+class FakeAsyncBatch(FakeBatch):
+    async def commit(self):
+        self._commit()
+
+
+class FakeFirestore:
+    """batch() / set() / commit() only; 'failures' are raised by the next commits."""
+
+    def __init__(self, failures=None, batch_cls=FakeBatch):
+        self.docs = {}
+        self.commit_sizes = []
+        self.failures = list(failures or [])
+        self.batch_cls = batch_cls
+        self.lock = threading.Lock()
+
+    def batch(self):
+        return self.batch_cls(self)
+
+
+def _writes(n):
+    return [(f"live/S{i}", {"i": i}) for i in range(n)]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    calls = []
+    monkeypatch.setattr(bulk_writer.time, "sleep", calls.append)
+    return calls
+
+
+# ------------------------------------------------------------
+# Chunking
+# ------------------------------------------------------------
+
+
+def test_chunks_respect_batch_size():
+    chunks = chunk_writes(_writes(1001), batch_size=400)
+    assert [len(c) for c in chunks] == [400, 400, 201]
+
+
+def test_batch_size_is_capped_at_firestore_limit():
+    chunks = chunk_writes(_writes(1200), batch_size=10_000)
+    assert max(len(c) for c in chunks) == FIRESTORE_MAX_BATCH_OPS
+
+
+def test_chunks_respect_byte_limit():
+    big = [(f"d{i}", {"blob": "x" * 1000}) for i in range(10)]
+    chunks = chunk_writes(big, batch_size=500, max_bytes=2500)
+    assert all(len(c) == 2 for c in chunks)
+    assert sum(len(c) for c in chunks) == 10
+
+
+# ------------------------------------------------------------
+# Retries
+# ------------------------------------------------------------
+
+
+def test_bulk_write_commits_every_doc(sleeps):
+    db = FakeFirestore()
+    stats = bulk_write(db, _writes(950), batch_size=300, max_workers=4)
+    assert stats["written"] == 950
+    assert stats["batches"] == 4
+    assert stats["retries"] == 0
+    assert sorted(db.commit_sizes) == [50, 300, 300, 300]
+    assert len(db.docs) == 950
+    assert sleeps == []
+
+
+def test_transient_errors_are_retried_with_backoff(sleeps):
+    db = FakeFirestore(failures=[gexc.Aborted("contention"), gexc.ServiceUnavailable("busy")])
+    stats = bulk_write(db, _writes(10), max_retries=3)
+    assert stats["retries"] == 2
+    assert len(db.docs) == 10
+    # Exponential: second delay starts from twice the first base delay
+    assert len(sleeps) == 2
+    assert 0.1 <= sleeps[0] <= 0.15
+    assert 0.2 <= sleeps[1] <= 0.3
+
+
+def test_retries_give_up_after_max_retries(sleeps):
+    db = FakeFirestore(failures=[gexc.DeadlineExceeded("slow")] * 3)
+    with pytest.raises(gexc.DeadlineExceeded):
+        bulk_write(db, _writes(5), max_retries=2)
+    assert len(sleeps) == 2
+    assert db.docs == {}
+
+
+def test_non_transient_errors_are_not_retried(sleeps):
+    db = FakeFirestore(failures=[gexc.PermissionDenied("no")])
+    with pytest.raises(gexc.PermissionDenied):
+        bulk_write(db, _writes(5), max_retries=5)
+    assert sleeps == []
+    assert db.commit_sizes == [5]
+
+
+def test_async_writer_retries(monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(bulk_writer.asyncio, "sleep", fake_sleep)
+    db = FakeFirestore(failures=[gexc.ResourceExhausted("quota")], batch_cls=FakeAsyncBatch)
+    stats = asyncio.run(bulk_write_async(db, _writes(700), batch_size=300, max_workers=2))
+    assert stats["written"] == 700
+    assert stats["batches"] == 3
+    assert stats["retries"] == 1
+    assert len(db.docs) == 700
+    assert len(sleeps) == 1
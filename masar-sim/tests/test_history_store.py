@@ -0,0 +1,89 @@
+# test_history_store.py
+# Parquet indexing of a generated day under concurrent first reads
+
+import os
+import sys
+import threading
+from datetime import date
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import history_store  # noqa: E402
+from history_store import HistoryStore, day_csv_path, day_parquet_path  # noqa: E402
+
+pytest.importorskip("pyarrow")
+
+DAY = date(2026, 10, 19)
+
+
+def _write_day(root):
+    ts = pd.date_range("2026-10-19 06:00", periods=120, freq="min")
+    rows = [
+        {
+            "timestamp": t,
+            "station_id": f"S{j}",
+            "station_total": 10 * j + i,
+            "crowd_level": "Low",
+            "special_event_type": None,
+            "event_flag": 0,
+            "holiday_flag": 0,
+            "headway_seconds": 300,
+        }
+        for i, t in enumerate(ts)
+        for j in range(6)
+    ]
+    pd.DataFrame(rows).to_csv(day_csv_path(str(root), DAY), index=False)
+
+
+def _run_threads(n, target):
+    barrier = threading.Barrier(n)
+    results, errors = [], []
+
+    def worker():
+        barrier.wait()
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_concurrent_first_reads_index_the_day_once(tmp_path, monkeypatch):
+    _write_day(tmp_path)
+    builds = []
+    real_build = history_store.build_day_parquet
+
+    def counting_build(csv_path, parquet_path):
+        builds.append(threading.get_ident())
+        return real_build(csv_path, parquet_path)
+
+    monkeypatch.setattr(history_store, "build_day_parquet", counting_build)
+    store = HistoryStore(str(tmp_path))
+
+    results, errors = _run_threads(16, lambda: store._source(DAY))
+    assert errors == []
+    assert len(builds) == 1
+    assert store.stats["indexed"] == 1
+    assert {r[0] for r in results} == {"parquet"}
+    assert os.listdir(os.path.dirname(day_parquet_path(str(tmp_path), DAY))) == ["cf_day_2026-10-19.parquet"]
+
+
+def test_concurrent_builds_never_share_a_temp_file(tmp_path):
+    _write_day(tmp_path)
+    csv_path = day_csv_path(str(tmp_path), DAY)
+    pq_path = day_parquet_path(str(tmp_path), DAY)
+
+    results, errors = _run_threads(8, lambda: history_store.build_day_parquet(csv_path, pq_path))
+    assert errors == []
+    assert results == [720] * 8
+    assert len(pd.read_parquet(pq_path)) == 720
+    assert os.listdir(os.path.dirname(pq_path)) == ["cf_day_2026-10-19.parquet"]
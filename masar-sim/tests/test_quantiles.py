@@ -0,0 +1,50 @@
+# test_quantiles.py
+# cdf_at: interpolation between predicted quantiles, including tied ones
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quantiles import cdf_at  # noqa: E402
+
+ALPHAS = np.array([0.1, 0.5, 0.9])
+
+
+def _cdf(q, x):
+    return cdf_at(np.array([q], dtype=float), ALPHAS, np.array([x], dtype=float))[0]
+
+
+def test_interpolates_between_quantiles():
+    assert _cdf([10, 20, 30], 10) == pytest.approx(0.1)
+    assert _cdf([10, 20, 30], 15) == pytest.approx(0.3)
+    assert _cdf([10, 20, 30], 25) == pytest.approx(0.7)
+
+
+def test_extrapolates_and_clips_outer_segments():
+    assert _cdf([10, 20, 30], 5) == pytest.approx(0.0)
+    assert _cdf([10, 20, 30], 35) == pytest.approx(1.0)
+    assert _cdf([10, 20, 30], 31) == pytest.approx(0.94)
+
+
+def test_tied_lower_quantiles_step_to_the_highest_alpha_at_x():
+    assert _cdf([10, 10, 30], 10) == pytest.approx(0.5)
+    assert _cdf([10, 10, 30], 9) == pytest.approx(0.0)
+    assert _cdf([10, 10, 30], 20) == pytest.approx(0.7)
+    assert _cdf([0, 0, 4], 0) == pytest.approx(0.5)
+
+
+def test_tied_upper_quantiles_reach_one_at_the_last_quantile():
+    assert _cdf([10, 20, 20], 20) == pytest.approx(1.0)
+    assert _cdf([10, 20, 20], 15) == pytest.approx(0.3)
+    assert _cdf([7, 7, 7], 7) == pytest.approx(1.0)
+    assert _cdf([7, 7, 7], 6) == pytest.approx(0.0)
+
+
+def test_rows_are_independent():
+    q = np.array([[10, 10, 30], [10, 20, 30], [0, 0, 0]], dtype=float)
+    x = np.array([10, 25, 3], dtype=float)
+    np.testing.assert_allclose(cdf_at(q, ALPHAS, x), [0.5, 0.7, 1.0])
@@ -0,0 +1,79 @@
+# test_tick_store.py
+# Tick store interface; the SQLite in-memory database is shared by every thread
+
+import os
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tick_store import SQLiteTickStore, TickStore  # noqa: E402
+
+NOW = datetime(2026, 10, 19, 10, 0, tzinfo=timezone.utc)
+
+
+def _frame(ts, total):
+    return (ts, [{"station_id": f"S{j}", "station_total": total} for j in range(5)])
+
+
+def test_memory_store_is_visible_from_other_threads():
+    store = SQLiteTickStore(":memory:")
+    store.write_frames([_frame(NOW, 4.5)])
+
+    out = []
+    t = threading.Thread(target=lambda: out.append(store.read_history("S1", NOW, 30)))
+    t.start()
+    t.join()
+
+    assert out[0]["station_total"].tolist() == [4.5]
+
+
+def test_memory_stores_are_separate():
+    a = SQLiteTickStore(":memory:")
+    b = SQLiteTickStore(":memory:")
+    a.write_frames([_frame(NOW, 1.0)])
+    assert b.read_history("S1", NOW, 30).empty
+
+
+def test_memory_store_concurrent_writes_and_reads():
+    store = SQLiteTickStore(":memory:")
+    errors = []
+
+    def writer():
+        try:
+            for i in range(100):
+                store.write_frames([_frame(NOW + timedelta(minutes=i), float(i))])
+                store.compact(NOW + timedelta(minutes=i))
+        except Exception as e:
+            errors.append(e)
+
+    def reader():
+        try:
+            for _ in range(100):
+                store.read_history_all([f"S{j}" for j in range(5)], NOW + timedelta(minutes=50), 60)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer) for _ in range(2)]
+    threads += [threading.Thread(target=reader) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert len(store.read_history("S0", NOW + timedelta(minutes=99), 5)) == 6
+
+
+def test_incomplete_backend_fails_at_construction():
+    class WriteOnly(TickStore):
+        def write_frames(self, frames):
+            return {}
+
+    with pytest.raises(TypeError):
+        TickStore()
+    with pytest.raises(TypeError):
+        WriteOnly()
@@ -0,0 +1,755 @@
+# tick_store.py
+# Storage backends for live ticks (rolling history used by the forecaster)
+
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from firebase_admin import firestore
+
+from bulk_writer import bulk_write, bulk_write_async
+
+# ------------------------------------------------------------
+# Retention
+# ------------------------------------------------------------
+
+# Live ticks are kept for a rolling window. Each tick carries an
+# 'expire_at' field so a Firestore TTL policy on live/*/ticks can
+# drop it; /compact_live sweeps anything TTL has not removed yet.
+LIVE_RETENTION_MINUTES = int(os.environ.get("MASAR_LIVE_RETENTION_MIN", "120"))
+TICK_TTL_FIELD = "expire_at"
+
+# One tick per minute, both ends of the window included.
+RING_SLOTS = LIVE_RETENTION_MINUTES + 1
+
+HISTORY_COLUMNS = ["timestamp", "station_total"]
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SQLITE_PATH = os.environ.get(
+    "MASAR_TICK_SQLITE_PATH",
+    os.path.join(BASE_DIR, "data", "live", "ticks.sqlite3"),
+)
+
+Frame = Tuple[datetime, List[Dict]]
+
+
+def _history_frame(rows: List[Dict]) -> pd.DataFrame:
+    """Rows of {timestamp, station_total} -> DataFrame sorted by time."""
+    if not rows:
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+    return pd.DataFrame(rows).sort_values("timestamp").reset_index(drop=True)
+
+
+def _epoch_minute(ts: datetime) -> int:
+    """Minute bucket of a timestamp (same granularity as tick doc IDs)."""
+    return int(ts.timestamp() // 60)
+
+
+def _write_stats(written: int, batches: int, t0: float) -> Dict:
+    """Same shape as bulk_write statistics."""
+    seconds = time.perf_counter() - t0
+    return {
+        "written": written,
+        "batches": batches,
+        "retries": 0,
+        "seconds": round(seconds, 4),
+        "docs_per_sec": round(written / seconds, 1) if seconds > 0 else float(written),
+    }
+
+
+# ------------------------------------------------------------
+# Interface
+# ------------------------------------------------------------
+
+class TickStore(ABC):
+    """
+    Storage interface for live ticks.
+
+    A frame is (timestamp, [snapshot dicts for all stations]).
+    Readers get a DataFrame with 'timestamp' and 'station_total'
+    sorted ascending, restricted to [now - minutes_back, now].
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def write_frames(self, frames: List[Frame]) -> Dict:
+        """Write several frames (backfill). Returns write statistics."""
+
+    def write_frame(self, ts: datetime, snaps: List[Dict]) -> Dict:
+        """Write the frame for one tick."""
+        return self.write_frames([(ts, snaps)])
+
+    @abstractmethod
+    def read_history(
+        self,
+        station_code: str,
+        now: datetime,
+        minutes_back: int = LIVE_RETENTION_MINUTES,
+    ) -> pd.DataFrame:
+        """History of a single station."""
+
+    def read_history_all(
+        self,
+        station_codes: List[str],
+        now: datetime,
+        minutes_back: int = LIVE_RETENTION_MINUTES,
+    ) -> Dict[str, pd.DataFrame]:
+        """History of several stations (one read per station by default)."""
+        return {
+            code: self.read_history(code, now, minutes_back)
+            for code in station_codes
+        }
+
+    def compact(self, now: datetime) -> int:
+        """Drop ticks older than the retention window. Returns deleted count."""
+        return 0
+
+    # Async API used by the FastAPI handlers. By default the sync
+    # methods run in a worker thread; network stores override these.
+
+    async def awrite_frames(self, frames: List[Frame]) -> Dict:
+        return await asyncio.to_thread(self.write_frames, frames)
+
+    async def awrite_frame(self, ts: datetime, snaps: List[Dict]) -> Dict:
+        return await self.awrite_frames([(ts, snaps)])
+
+    async def aread_history(self, station_code, now, minutes_back=LIVE_RETENTION_MINUTES):
+        return await asyncio.to_thread(self.read_history, station_code, now, minutes_back)
+
+    async def aread_history_all(self, station_codes, now, minutes_back=LIVE_RETENTION_MINUTES):
+        return await asyncio.to_thread(self.read_history_all, station_codes, now, minutes_back)
+
+    async def acompact(self, now: datetime) -> int:
+        return await asyncio.to_thread(self.compact, now)
+
+
+# ------------------------------------------------------------
+# Firestore: one document per station per minute
+# ------------------------------------------------------------
+
+class FirestoreTickStore(TickStore):
+    """
+    Layout: live/{station_id}/ticks/{YYYYMMDDHHMM}
+
+    This is the layout the staff dashboard reads directly.
+    The async methods use the AsyncClient when a factory is given,
+    so reads, batch commits and deletes overlap on the event loop.
+    """
+
+    name = "firestore"
+
+    def __init__(
+        self,
+        client_factory: Callable,
+        async_client_factory: Optional[Callable] = None,
+        max_docs: int = 240,
+    ):
+        self._client_factory = client_factory
+        self._async_client_factory = async_client_factory
+        self.max_docs = max_docs
+
+    @staticmethod
+    def tick_doc_ref(db, station_id: str, ts: datetime):
+        """Return the Firestore ref for live/{station_id}/ticks/{YYYYMMDDHHMM}."""
+        doc_id = ts.strftime("%Y%m%d%H%M")     # clean ID
+        return (
+            db.collection("live")
+            .document(station_id)
+            .collection("ticks")
+            .document(doc_id)
+        )
+
+    def _tick_writes(self, db, frames: List[Frame]):
+        """(doc_ref, data) pairs for bulk_write / bulk_write_async."""
+        expiry = timedelta(minutes=LIVE_RETENTION_MINUTES)
+
+        writes = []
+        for ts, snaps in frames:
+            for snap in snaps:
+                doc = dict(snap)
+                doc["timestamp"] = ts           # Firestore timestamp
+                doc[TICK_TTL_FIELD] = ts + expiry
+                writes.append((self.tick_doc_ref(db, doc["station_id"], ts), doc))
+        return writes
+
+    def _history_query(self, db, station_code: str, cutoff: datetime):
+        """
+        Up to max_docs ticks in [cutoff, ...] ordered by timestamp desc.
+        The range filter keeps reads bounded even when expired ticks
+        are still waiting for TTL cleanup.
+        """
+        return (
+            db.collection("live")
+            .document(station_code)
+            .collection("ticks")
+            .where("timestamp", ">=", cutoff)
+            .order_by("timestamp", direction=firestore.Query.DESCENDING)
+            .limit(self.max_docs)
+        )
+
+    @staticmethod
+    def _history_rows(dicts, cutoff: datetime) -> pd.DataFrame:
+        rows = []
+        for data in dicts:
+            data = data or {}
+            ts = data.get("timestamp")
+            total = data.get("station_total")
+
+            if ts is None or total is None or ts < cutoff:
+                continue
+
+            rows.append({"timestamp": ts, "station_total": float(total)})
+
+        return _history_frame(rows)
+
+    def write_frames(self, frames: List[Frame]) -> Dict:
+        db = self._client_factory()
+        return bulk_write(db, self._tick_writes(db, frames))
+
+    def read_history(self, station_code, now, minutes_back=LIVE_RETENTION_MINUTES):
+        db = self._client_factory()
+        cutoff = now - timedelta(minutes=minutes_back)
+        docs = self._history_query(db, station_code, cutoff).stream()
+        return self._history_rows((d.to_dict() for d in docs), cutoff)
+
+    def compact(self, now):
+        """
+        Offline compaction: delete ticks older than the retention window
+        that TTL has not removed yet (TTL deletion can lag by hours),
+        plus legacy ticks written before 'expire_at' existed.
+
+        Uses pagination (limit 300) per station to avoid exceeding
+        Firestore batch operation limits.
+        """
+        cutoff = now - timedelta(minutes=LIVE_RETENTION_MINUTES)
+        db = self._client_factory()
+
+        # list_documents() also yields live/{station} parents that only
+        # exist as containers for the ticks subcollection; stream() skips them.
+        stations = db.collection("live").list_documents()
+        deleted_total = 0
+
+        for station_ref in stations:
+            ticks_ref = station_ref.collection("ticks")
+
+            while True:
+                # Take a small batch of old docs per station
+                docs = list(
+                    ticks_ref
+                    .where("timestamp", "<", cutoff)
+                    .limit(300)
+                    .stream()
+                )
+
+                if not docs:
+                    # No more old docs for this station
+                    break
+
+                batch = db.batch()
+                for doc in docs:
+                    batch.delete(doc.reference)
+                    deleted_total += 1
+                batch.commit()
+
+        return deleted_total
+
+    async def awrite_frames(self, frames):
+        if self._async_client_factory is None:
+            return await super().awrite_frames(frames)
+
+        db = self._async_client_factory()
+        return await bulk_write_async(db, self._tick_writes(db, frames))
+
+    async def aread_history(self, station_code, now, minutes_back=LIVE_RETENTION_MINUTES):
+        if self._async_client_factory is None:
+            return await super().aread_history(station_code, now, minutes_back)
+
+        db = self._async_client_factory()
+        cutoff = now - timedelta(minutes=minutes_back)
+        docs = [d.to_dict() async for d in self._history_query(db, station_code, cutoff).stream()]
+        return self._history_rows(docs, cutoff)
+
+    async def aread_history_all(self, station_codes, now, minutes_back=LIVE_RETENTION_MINUTES):
+        codes = list(station_codes)
+        frames = await asyncio.gather(
+            *(self.aread_history(code, now, minutes_back) for code in codes)
+        )
+        return dict(zip(codes, frames))
+
+    async def acompact(self, now):
+        if self._async_client_factory is None:
+            return await super().acompact(now)
+
+        cutoff = now - timedelta(minutes=LIVE_RETENTION_MINUTES)
+        db = self._async_client_factory()
+
+        async def sweep(station_ref) -> int:
+            ticks_ref = station_ref.collection("ticks")
+            deleted = 0
+            while True:
+                docs = [
+                    d async for d in
+                    ticks_ref.where("timestamp", "<", cutoff).limit(300).stream()
+                ]
+                if not docs:
+                    return deleted
+
+                batch = db.batch()
+                for doc in docs:
+                    batch.delete(doc.reference)
+                await batch.commit()
+                deleted += len(docs)
+
+        # Stations are swept concurrently
+        stations = [ref async for ref in db.collection("live").list_documents()]
+        return sum(await asyncio.gather(*(sweep(ref) for ref in stations)))
+
+
+# ------------------------------------------------------------
+# Firestore: compact ring (one document for all stations)
+# ------------------------------------------------------------
+
+class FirestoreCompactTickStore(TickStore):
+    """
+    Layout: live_compact/ring
+
+      {
+        "slots": {
+          "<minute % RING_SLOTS>": {
+            "timestamp": <Timestamp>,
+            "station_ids": ["S1", "S2", ...],
+            "totals": [<station_total per station_ids>],
+          },
+          ...
+        }
+      }
+
+    Each slot carries its own station order, so a slot written before the
+    station list changed still reads back correctly. (Lists, not maps:
+    merge=True replaces a list whole but would merge a map's keys.)
+
+    A tick is one merged write of a single slot, a backfill is one write,
+    and the history of every station is one read. Old minutes are
+    overwritten in place, so there is nothing to compact.
+
+    The staff dashboard reads live/*/ticks, so this layout is opt-in.
+    """
+
+    name = "firestore_compact"
+
+    def __init__(
+        self,
+        client_factory: Callable,
+        async_client_factory: Optional[Callable] = None,
+        collection: str = "live_compact",
+        doc_id: str = "ring",
+    ):
+        self._client_factory = client_factory
+        self._async_client_factory = async_client_factory
+        self.collection = collection
+        self.doc_id = doc_id
+
+    def _doc_ref(self, db):
+        return db.collection(self.collection).document(self.doc_id)
+
+    @staticmethod
+    def slot_key(ts: datetime) -> str:
+        """Ring slot for a minute (epoch minutes, so days roll over cleanly)."""
+        return str(int(ts.timestamp() // 60) % RING_SLOTS)
+
+    def _ring_update(self, frames: List[Frame]) -> Tuple[Dict, int]:
+        """Merge payload for the ring doc + number of station ticks in it."""
+        slots = {}
+        written = 0
+        for ts, snaps in frames:
+            slots[self.slot_key(ts)] = {
+                "timestamp": ts,
+                "station_ids": [s["station_id"] for s in snaps],
+                "totals": [s.get("station_total") for s in snaps],
+            }
+            written += len(snaps)
+
+        payload = {"updated_at": frames[-1][0], "slots": slots}
+        return payload, written
+
+    @staticmethod
+    def _ring_history(data: Dict, station_codes, now, minutes_back) -> Dict[str, pd.DataFrame]:
+        cutoff = now - timedelta(minutes=minutes_back)
+
+        # Docs written before slots carried their own order
+        legacy_ids = data.get("station_ids") or []
+        rows: Dict[str, List[Dict]] = {code: [] for code in station_codes}
+
+        for slot in (data.get("slots") or {}).values():
+            ts = slot.get("timestamp")
+            station_ids = slot.get("station_ids") or legacy_ids
+            totals = slot.get("totals") or []
+            if ts is None or ts < cutoff or ts > now or len(totals) != len(station_ids):
+                continue
+
+            col = {sid: i for i, sid in enumerate(station_ids)}
+            for code in station_codes:
+                i = col.get(code)
+                if i is not None and totals[i] is not None:
+                    rows[code].append({"timestamp": ts, "station_total": float(totals[i])})
+
+        return {code: _history_frame(r) for code, r in rows.items()}
+
+    def write_frames(self, frames: List[Frame]) -> Dict:
+        t0 = time.perf_counter()
+        if not frames:
+            return _write_stats(0, 0, t0)
+
+        payload, written = self._ring_update(frames)
+        # merge=True only replaces the slots we send
+        self._doc_ref(self._client_factory()).set(payload, merge=True)
+        return _write_stats(written, 1, t0)
+
+    def read_history_all(self, station_codes, now, minutes_back=LIVE_RETENTION_MINUTES):
+        snap = self._doc_ref(self._client_factory()).get()
+        data = (snap.to_dict() or {}) if snap.exists else {}
+        return self._ring_history(data, station_codes, now, minutes_back)
+
+    def read_history(self, station_code, now, minutes_back=LIVE_RETENTION_MINUTES):
+        return self.read_history_all([station_code], now, minutes_back)[station_code]
+
+    async def awrite_frames(self, frames):
+        if self._async_client_factory is None:
+            return await super().awrite_frames(frames)
+
+        t0 = time.perf_counter()
+        if not frames:
+            return _write_stats(0, 0, t0)
+
+        payload, written = self._ring_update(frames)
+        await self._doc_ref(self._async_client_factory()).set(payload, merge=True)
+        return _write_stats(written, 1, t0)
+
+    async def aread_history_all(self, station_codes, now, minutes_back=LIVE_RETENTION_MINUTES):
+        if self._async_client_factory is None:
+            return await super().aread_history_all(station_codes, now, minutes_back)
+
+        snap = await self._doc_ref(self._async_client_factory()).get()
+        data = (snap.to_dict() or {}) if snap.exists else {}
+        return self._ring_history(data, station_codes, now, minutes_back)
+
+    async def aread_history(self, station_code, now, minutes_back=LIVE_RETENTION_MINUTES):
+        history = await self.aread_history_all([station_code], now, minutes_back)
+        return history[station_code]
+
+
+# ------------------------------------------------------------
+# SQLite: local file, no network
+# ------------------------------------------------------------
+
+class SQLiteTickStore(TickStore):
+    """
+    Local tick store for on-prem deployments and load tests.
+
+    Table ticks(station_id, minute, ts, station_total, doc) keyed on
+    (station_id, minute), so a station's window is one index range scan.
+    WAL mode lets request threads read while a tick is being written.
+    Ticks older than the retention window are trimmed on write.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._anchor: Optional[sqlite3.Connection] = None
+        # Shared-cache writers fail with "table is locked" instead of
+        # waiting (busy timeout does not apply), so writes take this lock
+        self._write_lock = threading.Lock()
+        if path == ":memory:":
+            # A plain ":memory:" is a separate empty database per connection,
+            # i.e. per thread here. Use one named shared-cache database
+            # instead, kept alive by an anchor connection.
+            self._uri = f"file:masar_ticks_{id(self)}?mode=memory&cache=shared"
+            self._anchor = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        else:
+            self._uri = None
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._init_schema()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (FastAPI runs sync handlers in a pool)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self._uri is not None:
+                conn = sqlite3.connect(self._uri, uri=True, timeout=30)
+                # Shared cache uses table locks; let readers skip them
+                conn.execute("PRAGMA read_uncommitted=1")
+            else:
+                conn = sqlite3.connect(self.path, timeout=30)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS ticks (
+                station_id    TEXT    NOT NULL,
+                minute        INTEGER NOT NULL,
+                ts            REAL    NOT NULL,
+                station_total REAL    NOT NULL,
+                doc           TEXT,
+                PRIMARY KEY (station_id, minute)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS ix_ticks_minute ON ticks (minute);
+            """
+        )
+        conn.commit()
+
+    def write_frames(self, frames):
+        t0 = time.perf_counter()
+        rows = []
+        newest = None
+
+        for ts, snaps in frames:
+            newest = ts if newest is None or ts > newest else newest
+            for snap in snaps:
+                doc = dict(snap)
+                doc["timestamp"] = ts.isoformat()
+                rows.append((
+                    doc["station_id"],
+                    _epoch_minute(ts),
+                    ts.timestamp(),
+                    float(doc.get("station_total") or 0.0),
+                    json.dumps(doc, ensure_ascii=False, default=str),
+                ))
+
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO ticks VALUES (?, ?, ?, ?, ?)", rows
+            )
+            if newest is not None:
+                self._delete_before(conn, newest)
+
+        return _write_stats(len(rows), 1, t0)
+
+    def _query_history(self, station_codes, now, minutes_back):
+        cutoff = now - timedelta(minutes=minutes_back)
+        marks = ",".join("?" for _ in station_codes)
+        cur = self._conn().execute(
+            f"""
+            SELECT station_id, ts, station_total FROM ticks
+            WHERE station_id IN ({marks})
+              AND minute >= ? AND ts >= ? AND ts <= ?
+            ORDER BY station_id, minute
+            """,
+            [*station_codes, _epoch_minute(cutoff), cutoff.timestamp(), now.timestamp()],
+        )
+
+        rows: Dict[str, List[Dict]] = {code: [] for code in station_codes}
+        for sid, ts, total in cur:
+            rows[sid].append({
+                "timestamp": datetime.fromtimestamp(ts, tz=now.tzinfo),
+                "station_total": float(total),
+            })
+        return {code: _history_frame(r) for code, r in rows.items()}
+
+    def read_history(self, station_code, now, minutes_back=LIVE_RETENTION_MINUTES):
+        return self._query_history([station_code], now, minutes_back)[station_code]
+
+    def read_history_all(self, station_codes, now, minutes_back=LIVE_RETENTION_MINUTES):
+        if not station_codes:
+            return {}
+        return self._query_history(list(station_codes), now, minutes_back)
+
+    @staticmethod
+    def _delete_before(conn, now) -> int:
+        cutoff = now - timedelta(minutes=LIVE_RETENTION_MINUTES)
+        cur = conn.execute("DELETE FROM ticks WHERE minute < ?", (_epoch_minute(cutoff),))
+        return cur.rowcount
+
+    def compact(self, now):
+        conn = self._conn()
+        with self._write_lock, conn:
+            return self._delete_before(conn, now)
+
+
+# ------------------------------------------------------------
+# In-memory: single process, nothing persisted
+# ------------------------------------------------------------
+
+class MemoryTickStore(TickStore):
+    """
+    Process-local tick store for tests and load tests.
+
+    Keeps {station_id: {minute: (ts, station_total)}} under a lock
+    and trims the retention window on every write.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ticks: Dict[str, Dict[int, Tuple[datetime, float]]] = {}
+
+    def write_frames(self, frames):
+        t0 = time.perf_counter()
+        written = 0
+        newest = None
+
+        with self._lock:
+            for ts, snaps in frames:
+                newest = ts if newest is None or ts > newest else newest
+                minute = _epoch_minute(ts)
+                for snap in snaps:
+                    series = self._ticks.setdefault(snap["station_id"], {})
+                    series[minute] = (ts, float(snap.get("station_total") or 0.0))
+                    written += 1
+
+            if newest is not None:
+                self._delete_before(newest)
+
+        return _write_stats(written, 1, t0)
+
+    def read_history(self, station_code, now, minutes_back=LIVE_RETENTION_MINUTES):
+        cutoff = now - timedelta(minutes=minutes_back)
+        with self._lock:
+            series = list((self._ticks.get(station_code) or {}).values())
+
+        rows = [
+            {"timestamp": ts, "station_total": total}
+            for ts, total in series
+            if cutoff <= ts <= now
+        ]
+        return _history_frame(rows)
+
+    def _delete_before(self, now) -> int:
+        cutoff = _epoch_minute(now - timedelta(minutes=LIVE_RETENTION_MINUTES))
+        deleted = 0
+        for series in self._ticks.values():
+            old = [m for m in series if m < cutoff]
+            for m in old:
+                del series[m]
+            deleted += len(old)
+        return deleted
+
+    def compact(self, now):
+        with self._lock:
+            return self._delete_before(now)
+
+    # Nothing here blocks on I/O, so skip the worker thread.
+
+    async def awrite_frames(self, frames):
+        return self.write_frames(frames)
+
+    async def aread_history(self, station_code, now, minutes_back=LIVE_RETENTION_MINUTES):
+        return self.read_history(station_code, now, minutes_back)
+
+    async def aread_history_all(self, station_codes, now, minutes_back=LIVE_RETENTION_MINUTES):
+        return self.read_history_all(station_codes, now, minutes_back)
+
+    async def acompact(self, now):
+        return self.compact(now)
+
+
+# ------------------------------------------------------------
+# Factory
+# ------------------------------------------------------------
+
+TICK_STORES = {
+    FirestoreTickStore.name: FirestoreTickStore,
+    FirestoreCompactTickStore.name: FirestoreCompactTickStore,
+    SQLiteTickStore.name: lambda client_factory, async_client_factory=None: SQLiteTickStore(),
+    MemoryTickStore.name: lambda client_factory, async_client_factory=None: MemoryTickStore(),
+}
+
+
+def make_tick_store(
+    kind: Optional[str],
+    client_factory: Callable,
+    async_client_factory: Optional[Callable] = None,
+) -> TickStore:
+    """
+    Build the tick store named by 'kind' (MASAR_TICK_STORE):
+    'firestore' (default), 'firestore_compact', 'sqlite' or 'memory'.
+
+    The factories return the sync / async Firestore clients; they are
+    only called by the Firestore stores, so sqlite/memory never touch
+    the network.
+    """
+    kind = (kind or FirestoreTickStore.name).strip().lower()
+    if kind not in TICK_STORES:
+        raise ValueError(
+            f"Unknown MASAR_TICK_STORE '{kind}'. "
+            f"Expected one of: {', '.join(sorted(TICK_STORES))}"
+        )
+    return TICK_STORES[kind](client_factory, async_client_factory)
+
+
+# ------------------------------------------------------------
+# Store latency benchmark (no model involved)
+# ------------------------------------------------------------
+
+def benchmark_store(store: TickStore, stations: List[str], minutes: int = RING_SLOTS, reads: int = 50) -> Dict:
+    """
+    Time a backfill, single-tick writes and history reads against a store
+    using synthetic totals, so store latency can be measured on its own.
+    """
+    now = datetime.now(timezone(timedelta(hours=3)))
+    frames = [
+        (
+            now - timedelta(minutes=minutes - 1 - i),
+            [{"station_id": sid, "station_total": 1000 + i} for sid in stations],
+        )
+        for i in range(minutes)
+    ]
+
+    backfill = store.write_frames(frames)
+
+    t0 = time.perf_counter()
+    for ts, snaps in frames[-10:]:
+        store.write_frame(ts, snaps)
+    tick_ms = (time.perf_counter() - t0) * 1000 / 10
+
+    t0 = time.perf_counter()
+    for i in range(reads):
+        store.read_history(stations[i % len(stations)], now)
+    read_ms = (time.perf_counter() - t0) * 1000 / reads
+
+    t0 = time.perf_counter()
+    for _ in range(reads):
+        store.read_history_all(stations, now)
+    read_all_ms = (time.perf_counter() - t0) * 1000 / reads
+
+    return {
+        "store": store.name,
+        "backfill_docs_per_sec": backfill["docs_per_sec"],
+        "tick_write_ms": round(tick_ms, 3),
+        "read_station_ms": round(read_ms, 3),
+        "read_all_stations_ms": round(read_all_ms, 3),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark a live tick store")
+    parser.add_argument("--store", default=os.environ.get("MASAR_TICK_STORE", "memory"))
+    parser.add_argument("--stations", type=int, default=6)
+    parser.add_argument("--reads", type=int, default=50)
+    args = parser.parse_args()
+
+    def _firestore_client():
+        from server import get_firestore_client
+        return get_firestore_client()
+
+    codes = [f"S{i}" for i in range(1, args.stations + 1)]
+    store = make_tick_store(args.store, _firestore_client)
+    print(json.dumps(benchmark_store(store, codes, reads=args.reads), indent=2))
@@ -0,0 +1,260 @@
+# tree_eval.py
+# Pure-NumPy evaluator for the XGBoost tree ensemble (low-latency scoring)
+
+import os
+import json
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------
+# Flat tree ensemble
+# ------------------------------------------------------------
+
+
+def _parse_base_score(raw: str) -> np.ndarray:
+    """'1229.27' or '[1.2292772E3]' / '[a,b,c]' (XGBoost >= 2) -> float32 array."""
+    raw = raw.strip().strip("[]")
+    return np.array([float(v) for v in raw.split(",")], dtype=np.float32)
+
+
+class TreeEnsemble:
+    """
+    All trees of a gbtree booster laid out in flat arrays:
+
+        feature[i], threshold[i], left[i], right[i], default_left[i], value[i]
+
+    indexed by a global node id (tree roots at 'roots'). Leaves point to
+    themselves, so walking every row through every tree is max_depth
+    branch-free steps of NumPy fancy indexing. A split sends a row left
+    when x[feature] < threshold (float32, as in XGBoost) and missing
+    values (NaN) to the default child.
+
+    Output = base_score + sum of leaf values per target group, i.e. the
+    raw margin, which is the prediction for reg:squarederror and
+    reg:quantileerror.
+    """
+
+    ARRAYS = ("feature", "threshold", "left", "right", "default_left", "value", "roots", "group", "base_score")
+
+    def __init__(self, feature, threshold, left, right, default_left, value, roots, group, base_score, depth,
+                 feature_names: Optional[List[str]] = None):
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.value = np.asarray(value, dtype=np.float32)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.group = np.asarray(group, dtype=np.int32)
+        self.base_score = np.asarray(base_score, dtype=np.float32)
+        self.depth = int(depth)
+        self.feature_names = list(feature_names) if feature_names else None
+        self.num_targets = int(self.group.max()) + 1 if len(self.group) else 1
+
+        # Hot-loop layout: children packed as [left, right] pairs so the
+        # next node is children[2 * node + went_right], and int64 indices
+        # so NumPy does not re-cast them on every step.
+        self._children = np.stack([self.left, self.right], axis=1).ravel().astype(np.int64)
+        self._feature = self.feature.astype(np.int64)
+        self._nan_right = ~self.default_left
+        self._roots = self.roots.astype(np.int64)
+        # (trees, targets) 0/1 matrix summing leaf values per output
+        self._group_onehot = (self.group[:, None] == np.arange(self.num_targets)).astype(np.float32)
+
+    # ---------- export ----------
+
+    @classmethod
+    def from_booster(cls, booster) -> "TreeEnsemble":
+        """Export an xgboost.Booster (or XGBModel) via its JSON model."""
+        if hasattr(booster, "get_booster"):
+            booster = booster.get_booster()
+        model = json.loads(booster.save_raw("json"))
+        learner = model["learner"]
+        gbm = learner["gradient_booster"]
+        if gbm.get("name") != "gbtree":
+            raise ValueError(f"Only gbtree boosters are supported, got {gbm.get('name')!r}")
+
+        trees = gbm["model"]["trees"]
+        tree_info = gbm["model"].get("tree_info") or [0] * len(trees)
+
+        feature, threshold, left, right, default_left, value = [], [], [], [], [], []
+        roots, depth = [], 0
+        offset = 0
+        for tree in trees:
+            if any(tree.get("split_type", [])):
+                raise ValueError("Categorical splits are not supported")
+
+            lc = np.asarray(tree["left_children"], dtype=np.int64)
+            rc = np.asarray(tree["right_children"], dtype=np.int64)
+            n = len(lc)
+            ids = np.arange(n)
+            leaf = lc == -1
+
+            feature.append(np.where(leaf, 0, tree["split_indices"]))
+            threshold.append(np.asarray(tree["split_conditions"], dtype=np.float32))
+            # Leaves hold their value in split_conditions and loop on themselves.
+            value.append(np.where(leaf, tree["split_conditions"], 0.0))
+            left.append(np.where(leaf, ids, lc) + offset)
+            right.append(np.where(leaf, ids, rc) + offset)
+            default_left.append(np.asarray(tree["default_left"], dtype=bool))
+            roots.append(offset)
+            depth = max(depth, cls._tree_depth(lc, rc))
+            offset += n
+
+        base_score = _parse_base_score(learner["learner_model_param"]["base_score"])
+        return cls(
+            np.concatenate(feature),
+            np.concatenate(threshold),
+            np.concatenate(left),
+            np.concatenate(right),
+            np.concatenate(default_left),
+            np.concatenate(value),
+            roots,
+            tree_info,
+            base_score,
+            depth,
+            feature_names=booster.feature_names,
+        )
+
+    @staticmethod
+    def _tree_depth(lc: np.ndarray, rc: np.ndarray) -> int:
+        depth, frontier = 0, [0]
+        while True:
+            nxt = [c for node in frontier for c in (lc[node], rc[node]) if c != -1]
+            if not nxt:
+                return depth
+            depth += 1
+            frontier = nxt
+
+    def save(self, path: str) -> None:
+        meta = {"depth": self.depth, "feature_names": self.feature_names}
+        np.savez(path, meta=np.array(json.dumps(meta)), **{k: getattr(self, k) for k in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path: str) -> "TreeEnsemble":
+        with np.load(path) as z:
+            meta = json.loads(str(z["meta"]))
+            arrays = {k: z[k] for k in cls.ARRAYS}
+        return cls(**arrays, depth=meta["depth"], feature_names=meta["feature_names"])
+
+    # ---------- scoring ----------
+
+    def _matrix(self, X) -> np.ndarray:
+        if isinstance(X, pd.DataFrame):
+            # Column selection costs more than scoring a few rows; skip it
+            # when the frame is already in model order.
+            if self.feature_names and list(X.columns) != self.feature_names:
+                X = X[self.feature_names]
+            return X.to_numpy(dtype=np.float32)
+        if isinstance(X, dict):
+            return np.array([[X[f] for f in self.feature_names]], dtype=np.float32)
+        X = np.asarray(X, dtype=np.float32)
+        return X.reshape(1, -1) if X.ndim == 1 else X
+
+    def leaves(self, X) -> np.ndarray:
+        """Global leaf node id reached in every tree: shape (rows, trees)."""
+        X = self._matrix(X)
+        n, nf = X.shape
+        flat = np.ascontiguousarray(X).ravel()
+        row_base = (np.arange(n, dtype=np.int64) * nf)[:, None]
+        has_nan = bool(np.isnan(flat).any())
+
+        node = np.tile(self._roots, (n, 1))
+        for _ in range(self.depth):
+            v = flat[row_base + self._feature[node]]
+            went_right = ~(v < self.threshold[node])
+            if has_nan:
+                went_right = np.where(np.isnan(v), self._nan_right[node], went_right)
+            node = self._children[2 * node + went_right]
+        return node
+
+    def predict(self, X) -> np.ndarray:
+        """
+        Raw predictions: shape (rows,) for one target,
+        (rows, num_targets) for multi-output models.
+        """
+        vals = self.value[self.leaves(X)]
+        if self.num_targets == 1:
+            return vals.sum(axis=1, dtype=np.float32) + self.base_score[0]
+
+        return vals @ self._group_onehot + self.base_score
+
+
+# ------------------------------------------------------------
+# Benchmark
+# ------------------------------------------------------------
+
+
+def _time_us(fn, reps: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - t0) * 1e6 / reps
+
+
+def benchmark(model, X: pd.DataFrame, batch_sizes: Sequence[int] = (1, 6, 64, 1024), reps: int = 200) -> Dict:
+    """
+    Per-call latency (microseconds) of the native XGBoost paths vs the
+    NumPy evaluator on the same rows, plus the largest absolute difference.
+    """
+    ens = TreeEnsemble.from_booster(model)
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+
+    native = np.asarray(booster.inplace_predict(X.to_numpy(dtype=np.float32))).reshape(len(X), -1)
+    ours = ens.predict(X).reshape(len(X), -1)
+    results = {
+        "trees": len(ens.roots),
+        "depth": ens.depth,
+        "max_abs_diff": float(np.max(np.abs(native - ours))),
+        "latency_us": {},
+    }
+
+    for n in batch_sizes:
+        batch = X.iloc[:n]
+        arr = batch.to_numpy(dtype=np.float32)
+        r = max(10, reps // max(1, n // 64))
+        timings = {
+            "numpy": _time_us(lambda: ens.predict(arr), r),
+            "xgb_inplace_predict": _time_us(lambda: booster.inplace_predict(arr), r),
+        }
+        if hasattr(model, "predict"):
+            timings["xgb_sklearn_predict_df"] = _time_us(lambda: model.predict(batch), r)
+        results["latency_us"][str(n)] = {k: round(v, 1) for k, v in timings.items()}
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import joblib
+
+    from features import FEATURES, FEATURES_DIR, feature_days, partition_path
+
+    default_model = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..", "masar_forecasting", "models", "masar_xgb_30min_model.pkl",
+    )
+
+    parser = argparse.ArgumentParser(description="Compare NumPy vs XGBoost scoring latency")
+    parser.add_argument("--model", default=default_model)
+    parser.add_argument("--features", default=FEATURES_DIR)
+    parser.add_argument("--export", default=None, help="also save the flat arrays (.npz) here")
+    parser.add_argument("--reps", type=int, default=200)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    days = feature_days(args.features)
+    if days:
+        X = pd.read_parquet(partition_path(args.features, days[-1]), columns=FEATURES)
+    else:
+        # No materialized features: random rows in a plausible range
+        rng = np.random.default_rng(0)
+        X = pd.DataFrame(rng.uniform(0, 20000, size=(1024, len(FEATURES))), columns=FEATURES)
+    X = X.astype(np.float32)
+
+    if args.export:
+        TreeEnsemble.from_booster(model).save(args.export)
+    print(json.dumps(benchmark(model, X, reps=args.reps), indent=2))